@@ -0,0 +1,85 @@
+import os
+import sys
+import json
+import argparse
+import subprocess
+import pandas as pd
+
+# Import time of the compute modules in fresh interpreters, and whether they load the visualization stack.
+# The 'plotting stack' row is what every module paid when matplotlib, seaborn and plotly were imported at
+# module top level.
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+
+MODULES = {
+    'engle_granger_cointegration_method': 'engle_granger_cointegration_method',
+    'gatev_distance_method': 'gatev_distance_method',
+    'data_transformation_snippets': 'data_transformation_snippets',
+    'johansen_cointegration_method': 'johansen_cointegration_method',
+    'pairs_screening': 'pairs_screening',
+    'parallel_pair_scanning': 'parallel_pair_scanning',
+    'pair_reporting': 'pair_reporting',
+    'plotting stack': 'matplotlib.pyplot, seaborn, plotly.express'
+}
+PLOTTING_MODULES = ['matplotlib', 'seaborn', 'plotly']
+
+PROBE = """
+import sys, time, json
+start = time.perf_counter()
+import {modules}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'loaded': [m for m in {plotting} if m in sys.modules]}}))
+"""
+
+
+def time_import(modules: str) -> dict:
+
+    # One fresh interpreter per measurement, so that nothing is already in sys.modules. A failed import
+    # (e.g. a plotting package that is not installed) is returned as the last line of its traceback
+    completed = subprocess.run(
+        [sys.executable, '-c', PROBE.format(modules=modules, plotting=PLOTTING_MODULES)],
+        cwd=SRC_DIR, capture_output=True, text=True,
+        env={**os.environ, 'PYTHONPATH': SRC_DIR, 'MPLBACKEND': 'Agg'}
+    )
+
+    if completed.returncode != 0:
+        lines = completed.stderr.strip().splitlines()
+        return {'error': lines[-1] if lines else f'exit code {completed.returncode}'}
+
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Import-time benchmark of the compute modules')
+    parser.add_argument('--repeat', type=int, default=5, help='Fresh interpreters per module (median reported)')
+    parser.add_argument('--output', default=None, help='Optional CSV file for the results')
+    args = parser.parse_args()
+
+    rows = []
+    for name, modules in MODULES.items():
+        runs = [time_import(modules) for _ in range(args.repeat)]
+        failed = [run['error'] for run in runs if 'error' in run]
+        if failed:
+            # Recorded as unavailable, the other rows are still measured
+            rows.append({
+                'module': name,
+                'median_seconds': float('nan'),
+                'plotting_loaded': '-',
+                'status': f'unavailable ({failed[-1]})'
+            })
+            continue
+        rows.append({
+            'module': name,
+            'median_seconds': pd.Series([run['seconds'] for run in runs]).median(),
+            'plotting_loaded': ', '.join(runs[-1]['loaded']) or '-',
+            'status': 'ok'
+        })
+
+    report = pd.DataFrame(rows)
+    print(report.to_string(index=False, float_format=lambda value: f'{value:.3f}'))
+
+    if args.output:
+        report.to_csv(args.output, index=False)
+
+
+if __name__ == '__main__':
+    main()
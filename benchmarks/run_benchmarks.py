@@ -0,0 +1,348 @@
+import os
+import sys
+import gc
+import json
+import time
+import platform
+import argparse
+import tracemalloc
+import subprocess
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(BENCHMARKS_DIR, '..', 'src')
+sys.path.append(SRC_DIR)
+
+import synthetic_universe as synth
+import gatev_distance_method as gatev_dist
+import engle_granger_cointegration_method as eg_coint
+import johansen_cointegration_method as jj_coint
+import handling_dataframe as hdf
+import explore_stock as explore_stock
+
+# Benchmarks of the pairs formation stages on synthetic universes (synthetic_universe.generate_universe).
+# Every stage records its best wall time over the repeats, its peak traced memory (tracemalloc, one extra
+# run), its throughput and, for the pair tests, the recall of the planted cointegrated pairs. Runs are saved
+# to results/<label>.json so that two versions can be compared with --compare.
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, 'results')
+
+PRESETS = {
+    'smoke': [(10, 250)],
+    'small': [(10, 250), (50, 500), (100, 1000)],
+    'medium': [(250, 1000), (500, 2500)],
+    'large': [(1000, 2500), (2000, 5000), (5000, 5000)]
+}
+
+
+def _planted_recall(pairs: list, planted: list) -> float:
+    if not planted:
+        return np.nan
+    found = {tuple(sorted(pair)) for pair in pairs}
+    return np.mean([tuple(sorted(pair)) in found for pair in planted])
+
+
+def _stage_find_cointegrated_pairs(context):
+    return eg_coint.find_cointegrated_pairs(context['log_prices'], visualize=False)[2]
+
+
+def _stage_find_cointegrated_pairs_batched(context):
+    return eg_coint.find_cointegrated_pairs_batched(context['log_prices'], visualize=False, output='sparse')[2]
+
+
+def _stage_johansen_test(context):
+    return jj_coint.johansen_test(context['log_prices'])
+
+
+def _stage_johansen_test_batched(context):
+    return jj_coint.johansen_test_batched(context['log_prices'])
+
+
+def _stage_gatev_distance_smallest(context):
+    return gatev_dist.gatev_distance_smallest(context['cum_returns'], top_values=context['top_values'])[0]
+
+
+def _stage_pairs_formation_result_summary(context):
+    hdf.pairs_formation_result_summary(*context['method_pairs'])
+
+
+def _stage_stock_exploration(context):
+    explore_stock.stock_exploration(context['long_feed'])
+
+
+# name: (function, unit of the throughput, default largest number of units, recall of the planted pairs)
+# The per-pair statsmodels loops are capped so that the large presets finish; --no-limits lifts the caps
+STAGES = {
+    'find_cointegrated_pairs': (_stage_find_cointegrated_pairs, 'pairs', 1_225, True),
+    'find_cointegrated_pairs_batched': (_stage_find_cointegrated_pairs_batched, 'pairs', 2_000_000, True),
+    'johansen_test': (_stage_johansen_test, 'pairs', 4_950, True),
+    'johansen_test_batched': (_stage_johansen_test_batched, 'pairs', 20_000_000, True),
+    'gatev_distance_smallest': (_stage_gatev_distance_smallest, 'pairs', 20_000_000, False),
+    'pairs_formation_result_summary': (_stage_pairs_formation_result_summary, 'listed pairs', None, False),
+    'stock_exploration': (_stage_stock_exploration, 'rows', None, False)
+}
+
+
+def prepare_context(universe: dict, top_values: int = 10, seed: int = 0) -> dict:
+
+    """
+    Inputs of every stage for one universe: the filled log prices of the tests (missing prices filled
+    forward then backward, as the preprocessing does), the Gatev cumulative returns, four method lists for
+    the summary (the planted pairs plus random pairs) and the long feed.
+
+    Parameters:
+        universe (dict): Output of synthetic_universe.generate_universe.
+        top_values (int): Number of Gatev pairs. Default is 10.
+        seed (int): Seed of the random pairs of the summary. Default is 0.
+
+    Returns:
+        dict: The stage inputs.
+    """
+    prices = universe['prices'].ffill().bfill()
+    columns = prices.columns.tolist()
+    n = len(columns)
+    n_pairs = n * (n - 1) // 2
+
+    # Method lists of about 5% of the pairs each, overlapping on the planted pairs
+    rng = np.random.default_rng(seed)
+    method_pairs = []
+    for _ in range(4):
+        first = rng.integers(0, n, max(n_pairs // 20, 1))
+        second = (first + rng.integers(1, n, len(first))) % n
+        method_pairs.append(universe['pairs'] + [[columns[i], columns[j]] for i, j in zip(first, second)])
+
+    return {
+        'log_prices': np.log(prices),
+        'cum_returns': gatev_dist.gatev_data_normalize(prices, visualize=False),
+        'top_values': top_values,
+        'method_pairs': method_pairs,
+        'long_feed': synth.to_long_feed(universe),
+        'planted': universe['pairs'],
+        'n_pairs': n_pairs
+    }
+
+
+def measure(function, context: dict, repeat: int = 3, memory: bool = True) -> tuple:
+
+    """
+    Best wall time of repeated calls and peak traced memory of one more call.
+
+    Parameters:
+        function (callable): The stage, called with the context.
+        context (dict): Output of prepare_context.
+        repeat (int): Number of timed calls. Default is 3.
+        memory (bool): Trace the peak memory (one extra call, slower under tracemalloc). Default is True.
+
+    Returns:
+        tuple: Best seconds, peak memory in MB (NaN without memory) and the result of the last timed call.
+    """
+    seconds = []
+    for _ in range(repeat):
+        gc.collect()
+        start_time = time.perf_counter()
+        result = function(context)
+        seconds.append(time.perf_counter() - start_time)
+
+    peak_mb = np.nan
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        function(context)
+        peak_mb = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+        tracemalloc.stop()
+
+    return min(seconds), peak_mb, result
+
+
+def run_benchmarks(
+    sizes: list,
+    stages: list = None,
+    missing_pattern: str = 'random',
+    repeat: int = 3,
+    memory: bool = True,
+    limits: bool = True,
+    seed: int = 0
+) -> pd.DataFrame:
+
+    """
+    Run the stages on a synthetic universe of every size.
+
+    Parameters:
+        sizes (list): (n_tickers, n_bars) of the universes.
+        stages (list or None): Names of STAGES to run. Default is every stage.
+        missing_pattern (str): Missing-data pattern of the universes. Default is 'random'.
+        repeat (int): Number of timed calls per stage. Default is 3.
+        memory (bool): Record the peak traced memory. Default is True.
+        limits (bool): Skip the stages above their default size cap. Default is True.
+        seed (int): Seed of the universes. Default is 0.
+
+    Returns:
+        pandas.DataFrame: One row per (size, stage) with the seconds, throughput, peak memory and recall.
+    """
+    stages = list(STAGES) if stages is None else stages
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        raise ValueError(f"Unknown stages: {sorted(unknown)}")
+
+    records = []
+    for n_tickers, n_bars in sizes:
+        universe = synth.generate_universe(n_tickers, n_bars, missing_pattern=missing_pattern, seed=seed)
+        context = prepare_context(universe, seed=seed)
+
+        for stage in stages:
+            function, unit, max_items, recall = STAGES[stage]
+            items = {
+                'pairs': context['n_pairs'],
+                'listed pairs': sum(len(pairs) for pairs in context['method_pairs']),
+                'rows': len(context['long_feed'])
+            }[unit]
+            record = {
+                'stage': stage, 'n_tickers': n_tickers, 'n_bars': n_bars, 'unit': unit, 'items': items,
+                'seconds': np.nan, 'items_per_second': np.nan, 'peak_memory_mb': np.nan, 'recall': np.nan,
+                'status': 'skipped'
+            }
+
+            if not limits or max_items is None or items <= max_items:
+                seconds, peak_mb, result = measure(function, context, repeat=repeat, memory=memory)
+                record.update({
+                    'seconds': seconds,
+                    'items_per_second': items / seconds if seconds > 0 else np.nan,
+                    'peak_memory_mb': peak_mb,
+                    'recall': _planted_recall(result, context['planted']) if recall else np.nan,
+                    'status': 'ok'
+                })
+
+            records.append(record)
+            print(
+                f"{stage:32s} {n_tickers:5d} x {n_bars:5d}  {record['status']:7s} "
+                f"{record['seconds']:10.4f}s {record['items_per_second']:14.0f} {unit}/s "
+                f"{record['peak_memory_mb']:10.1f} MB",
+                flush=True
+            )
+
+    return pd.DataFrame(records)
+
+
+def _metadata(label: str, **settings) -> dict:
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCHMARKS_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        'label': label,
+        'commit': commit,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'machine': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        **settings
+    }
+
+
+def save_run(report: pd.DataFrame, metadata: dict, output_dir: str = RESULTS_DIR) -> str:
+
+    """
+    Save a benchmark run as <output_dir>/<label>.json.
+
+    Parameters:
+        report (pandas.DataFrame): Output of run_benchmarks.
+        metadata (dict): Label, commit, library versions and settings of the run.
+        output_dir (str): Directory of the saved runs. Default is RESULTS_DIR.
+
+    Returns:
+        str: The path of the file.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, f"{metadata['label']}.json")
+    records = json.loads(report.to_json(orient='records'))
+    with open(path, 'w') as file:
+        json.dump({'metadata': metadata, 'records': records}, file, indent=2)
+
+    return path
+
+
+def load_run(path: str) -> tuple:
+    with open(path) as file:
+        run = json.load(file)
+
+    return run['metadata'], pd.DataFrame(run['records'])
+
+
+def compare_runs(baseline: pd.DataFrame, current: pd.DataFrame, tolerance: float = 0.1) -> pd.DataFrame:
+
+    """
+    Compare two runs stage by stage on the sizes they share.
+
+    Parameters:
+        baseline (pandas.DataFrame): Records of the reference run.
+        current (pandas.DataFrame): Records of the new run.
+        tolerance (float): Relative slowdown or memory growth above which a row is a regression. Default is 0.1.
+
+    Returns:
+        pandas.DataFrame: Seconds and peak memory of both runs, their ratios (current / baseline) and a
+        Regression flag.
+    """
+    keys = ['stage', 'n_tickers', 'n_bars']
+    columns = keys + ['seconds', 'peak_memory_mb']
+    comparison = baseline[columns].merge(current[columns], on=keys, suffixes=('_baseline', '_current'))
+
+    comparison['time_ratio'] = comparison['seconds_current'] / comparison['seconds_baseline']
+    comparison['memory_ratio'] = comparison['peak_memory_mb_current'] / comparison['peak_memory_mb_baseline']
+    comparison['regression'] = (comparison['time_ratio'] > 1 + tolerance) | (comparison['memory_ratio'] > 1 + tolerance)
+
+    return comparison
+
+
+def _parse_size(size: str) -> tuple:
+    n_tickers, n_bars = size.lower().split('x')
+    return int(n_tickers), int(n_bars)
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmarks of the pairs formation stages on synthetic universes')
+    parser.add_argument('--preset', choices=list(PRESETS), default='small', help='Sizes to run')
+    parser.add_argument('--sizes', nargs='+', type=_parse_size, default=None,
+                        help='Sizes as <tickers>x<bars>, e.g. 200x1000 (overrides --preset)')
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES), default=None, help='Stages to run')
+    parser.add_argument('--missing-pattern', choices=synth.MISSING_PATTERNS, default='random')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed calls per stage (best is kept)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', action='store_true', help='Skip the tracemalloc run')
+    parser.add_argument('--no-limits', action='store_true', help='Run the per-pair loops at every size')
+    parser.add_argument('--label', default=None, help='Name of the saved run. Default is the commit and time')
+    parser.add_argument('--output-dir', default=RESULTS_DIR)
+    parser.add_argument('--compare', default=None, help='Saved run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='Regression threshold of --compare')
+    args = parser.parse_args(argv)
+
+    sizes = args.sizes or PRESETS[args.preset]
+    settings = {
+        'sizes': sizes, 'missing_pattern': args.missing_pattern, 'repeat': args.repeat, 'seed': args.seed,
+        'memory': not args.no_memory, 'limits': not args.no_limits
+    }
+    report = run_benchmarks(
+        sizes, stages=args.stages, missing_pattern=args.missing_pattern, repeat=args.repeat,
+        memory=not args.no_memory, limits=not args.no_limits, seed=args.seed
+    )
+
+    metadata = _metadata(None, **settings)
+    metadata['label'] = args.label or f"{metadata['commit'] or 'run'}_{datetime.now():%Y%m%d_%H%M%S}"
+    print(f"Saved to {save_run(report, metadata, args.output_dir)}")
+
+    if args.compare:
+        _, baseline = load_run(args.compare)
+        comparison = compare_runs(baseline, report, tolerance=args.tolerance)
+        print(comparison.to_string(index=False, float_format=lambda value: f'{value:.3f}'))
+        return int(comparison['regression'].any())
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
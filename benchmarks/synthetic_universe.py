@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+
+# Seeded synthetic price panels for the benchmarks: independent random walks with planted cointegrated pairs,
+# optional missing-data patterns, in the layouts of the repo (wide panel of adClose_<code> columns indexed by
+# date, and the long raw feed read by explore_stock.stock_exploration).
+MISSING_PATTERNS = ['none', 'random', 'gaps', 'late_listing']
+
+
+def generate_universe(
+    n_tickers: int,
+    n_bars: int,
+    n_cointegrated_pairs: int = None,
+    missing_pattern: str = 'none',
+    missing_ratio: float = 0.02,
+    start_date: str = '2018-01-01',
+    seed: int = 0
+) -> dict:
+
+    """
+    Random-walk log prices with planted cointegrated pairs: for every planted pair, stock A is
+    alpha + beta * stock B plus a stationary AR(1) spread, so the Engle-Granger and Johansen tests should
+    find it while the other pairs are independent random walks.
+
+    Parameters:
+        n_tickers (int): Number of stocks.
+        n_bars (int): Number of business days.
+        n_cointegrated_pairs (int or None): Number of planted pairs (disjoint stocks). Default is n_tickers // 10.
+        missing_pattern (str): 'none', 'random' (scattered missing prices), 'gaps' (one missing block per
+            affected stock) or 'late_listing' (affected stocks start trading later). Default is 'none'.
+        missing_ratio (float): Share of missing prices for 'random', share of affected stocks otherwise.
+        start_date (str): First date. Default is '2018-01-01'.
+        seed (int): Seed of the generator. Default is 0.
+
+    Returns:
+        dict: 'prices' and 'volumes' (wide panels, one column per stock) and 'pairs', the planted pairs
+        [stock_a, stock_b].
+    """
+    if missing_pattern not in MISSING_PATTERNS:
+        raise ValueError(f"missing_pattern must be one of {MISSING_PATTERNS}")
+    if n_cointegrated_pairs is None:
+        n_cointegrated_pairs = n_tickers // 10
+    if 2 * n_cointegrated_pairs > n_tickers:
+        raise ValueError("At most n_tickers / 2 planted pairs (their stocks are disjoint)")
+
+    rng = np.random.default_rng(seed)
+    codes = [f'S{i:04d}' for i in range(n_tickers)]
+    dates = pd.bdate_range(start_date, periods=n_bars, name='date')
+
+    # Independent random walks of the log prices around a random price level
+    drift = rng.normal(0.0002, 0.0003, n_tickers)
+    volatility = rng.uniform(0.01, 0.03, n_tickers)
+    log_prices = np.log(rng.uniform(5, 100, n_tickers)) + np.cumsum(
+        drift + volatility * rng.standard_normal((n_bars, n_tickers)), axis=0
+    )
+
+    # Planted pairs: A = alpha + beta * B + AR(1) spread with phi in [0.5, 0.9]
+    legs = rng.permutation(n_tickers)[:2 * n_cointegrated_pairs].reshape(-1, 2)
+    beta = rng.uniform(0.5, 1.5, n_cointegrated_pairs)
+    alpha = rng.normal(0, 0.5, n_cointegrated_pairs)
+    phi = rng.uniform(0.5, 0.9, n_cointegrated_pairs)
+    shocks = rng.normal(0, 0.01, (n_bars, n_cointegrated_pairs))
+
+    spread = np.zeros((n_bars, n_cointegrated_pairs))
+    for t in range(1, n_bars):
+        spread[t] = phi * spread[t - 1] + shocks[t]
+    log_prices[:, legs[:, 0]] = alpha + beta * log_prices[:, legs[:, 1]] + spread
+
+    prices = np.exp(log_prices).round(3)
+    volumes = np.round(rng.lognormal(11, 1, (n_bars, n_tickers)))
+
+    # Missing-data patterns
+    if missing_pattern == 'random':
+        prices[rng.random(prices.shape) < missing_ratio] = np.nan
+    elif missing_pattern in ['gaps', 'late_listing']:
+        affected = rng.choice(n_tickers, size=int(round(missing_ratio * n_tickers)), replace=False)
+        for column in affected:
+            length = rng.integers(1, max(n_bars // 10, 2))
+            start = 0 if missing_pattern == 'late_listing' else rng.integers(0, n_bars - length)
+            prices[start:start + length, column] = np.nan
+    volumes[np.isnan(prices)] = np.nan
+
+    columns = [f'adClose_{code}' for code in codes]
+
+    return {
+        'prices': pd.DataFrame(prices, index=dates, columns=columns),
+        'volumes': pd.DataFrame(volumes, index=dates, columns=columns),
+        'pairs': [[columns[a], columns[b]] for a, b in legs]
+    }
+
+
+def to_long_feed(universe: dict, n_floors: int = 3) -> pd.DataFrame:
+
+    """
+    Raw long-format feed of a universe (code, floor, date, nmVolume, adClose), sorted by code then date;
+    missing prices are rows missing from the feed, as in the raw data.
+
+    Parameters:
+        universe (dict): Output of generate_universe.
+        n_floors (int): Number of exchanges the codes are spread over. Default is 3.
+
+    Returns:
+        pandas.DataFrame: The long feed.
+    """
+    prices = universe['prices']
+    codes = [column.split('_', 1)[1] for column in prices.columns]
+    floors = np.array(['HOSE', 'HNX', 'UPCOM'][:n_floors])
+
+    df_long = pd.DataFrame({
+        'code': np.repeat(codes, len(prices)),
+        'floor': np.repeat(floors[np.arange(len(codes)) % len(floors)], len(prices)),
+        'date': np.tile(prices.index.to_numpy(), len(codes)),
+        'nmVolume': universe['volumes'].to_numpy().ravel(order='F'),
+        'adClose': prices.to_numpy().ravel(order='F')
+    })
+
+    return df_long[df_long['adClose'].notna()].reset_index(drop=True)
@@ -1,17 +1,15 @@
 import pandas as pd
-import seaborn as sns 
 import numpy as np
+import pair_reporting as rpt
+import instrumentation as inst
 
 def dist_stock_visualization(df: pd.DataFrame) -> None:
     
-    # List các cột của dataframe 
-    column_name = df.columns.tolist()
-    
-    # Visualize phân phối dữ liệu từng cột 
-    for column in column_name:
-        sns.displot(df[column], kde=True, color='purple') 
+    # Visualize phân phối dữ liệu từng cột (thư viện vẽ chỉ được nạp khi gọi hàm)
+    rpt.distribution_plots(df)
         
         
+@inst.timed('data_transformation.df_natural_log_transformed')
 def df_natural_log_transformed(df: pd.DataFrame) -> pd.DataFrame:
     
     # Dataframe tạm: copy từ dataframe input 
@@ -1,9 +1,19 @@
 import pandas as pd
 from statsmodels.tsa.stattools import coint, adfuller
-import matplotlib.pyplot as plt
-import seaborn as sns
 import numpy as np
+import time_series_analysis_snippets as tsa_snp
+import handling_dataframe as hdf
+import pair_result_formats as prf
+import pair_reporting as rpt
+import instrumentation as inst
 
+# Same collinearity guard as statsmodels' coint: R^2 >= 1 - 100 * sqrt(eps) is not testable
+SQRTEPS = np.sqrt(np.finfo(np.double).eps)
+
+# Memory allowed to the stacked residual ADF regressions of one block of pairs (bytes)
+BLOCK_MEMORY_BUDGET = 256 * 2 ** 20
+
+@inst.timed('engle_granger.find_cointegrated_pairs')
 def find_cointegrated_pairs(
     df: pd.DataFrame, 
     visualize: bool = True
@@ -26,7 +36,8 @@ def find_cointegrated_pairs(
             S1 = df[keys[i]]
             S2 = df[keys[j]]
             
-            result = coint(S1, S2)
+            with inst.latency('engle_granger.coint'):
+                result = coint(S1, S2)
             score = result[0]
             pvalue = result[1]
             score_matrix[i, j] = score
@@ -35,25 +46,16 @@ def find_cointegrated_pairs(
             if pvalue < 0.05:
                 pairs.append([keys[i], keys[j]])
                 
+    inst.count('engle_granger.pairs_tested', n * (n - 1) // 2)
+    inst.count('engle_granger.pairs_passed', len(pairs))
+
     # Visualize the pairs
     if visualize:
-        tickers = df.columns.tolist()
-
-        fig, ax = plt.subplots(figsize=(20,10))
-        sns.heatmap(
-            pvalue_matrix, 
-            xticklabels = tickers, 
-            yticklabels = tickers,
-            cmap = 'RdYlGn_r',
-            mask = (pvalue_matrix >= 0.05), 
-            annot = True
-        )
-
-        plt.title('Engle - Granger Cointegration Test', fontsize = 20)
-        plt.show()
+        rpt.engle_granger_heatmaps([pvalue_matrix], df.columns.tolist(), ['Engle - Granger Cointegration Test'])
                 
     return score_matrix, pvalue_matrix, pairs
 
+@inst.timed('engle_granger.find_cointegrated_pairs_swap')
 def find_cointegrated_pairs_swap(
     df: pd.DataFrame,
     visualize: bool = True
@@ -75,7 +77,8 @@ def find_cointegrated_pairs_swap(
             S1 = df[keys[i]]
             S2 = df[keys[j]]
             
-            result = coint(S2, S1)
+            with inst.latency('engle_granger.coint_swap'):
+                result = coint(S2, S1)
             score = result[0]
             pvalue = result[1]
             score_matrix[i, j] = score
@@ -84,19 +87,337 @@ def find_cointegrated_pairs_swap(
             if pvalue < 0.05:
                 pairs.append([keys[i], keys[j]])
     
+    inst.count('engle_granger.pairs_tested_swap', n * (n - 1) // 2)
+    inst.count('engle_granger.pairs_passed_swap', len(pairs))
+
     # Visualize the pairs
     if visualize:
-        tickers = df.columns.tolist()            
-        fig, ax = plt.subplots(figsize=(20,10))
-        sns.heatmap(pvalue_matrix, 
-                    xticklabels = tickers, 
-                    yticklabels = tickers, 
-                    cmap = 'RdYlGn_r', 
-                    mask = (pvalue_matrix >= 0.05),
-                    annot = True
-                    )
-
-        plt.title('Engle - Granger Cointegration Test (Swap)', fontsize = 20)
-        plt.show()
+        rpt.engle_granger_heatmaps(
+            [pvalue_matrix], df.columns.tolist(), ['Engle - Granger Cointegration Test (Swap)']
+        )
     
-    return score_matrix, pvalue_matrix, pairs
\ No newline at end of file
+    return score_matrix, pvalue_matrix, pairs
+
+
+def _prepare_engle_granger_panel(
+    df: pd.DataFrame,
+    trend: str = 'c'
+) -> tuple:
+
+    # Price panel as a (nobs, n) float array
+    X = df.to_numpy(dtype=float)
+
+    if np.isnan(X).any():
+        raise ValueError("The price panel contains missing values, drop or fill them before the batched test")
+
+    # Partial the deterministic terms out of every column once (Frisch-Waugh): the hedge regression
+    # of any pair is then a one-regressor regression on the detrended columns
+    if trend == 'n':
+        X_detrended = X
+    else:
+        deterministic = tsa_snp._trend_columns(X.shape[0], trend)
+        Q, _ = np.linalg.qr(deterministic)
+        X_detrended = X - Q @ (Q.T @ X)
+
+    sum_squares = np.einsum('ti,ti->i', X_detrended, X_detrended)
+
+    # Total sum of squares used by the R^2 of the hedge regression (uncentered without a constant)
+    if trend == 'n':
+        total_sum_squares = sum_squares
+    else:
+        X_centered = X - X.mean(axis=0)
+        total_sum_squares = np.einsum('ti,ti->i', X_centered, X_centered)
+
+    return X_detrended, sum_squares, total_sum_squares
+
+
+def _engle_granger_features(
+    df: pd.DataFrame,
+    trend: str = 'c',
+    feature_store: dict = None
+) -> tuple:
+
+    # Tickers and prepared panel, taken from the feature store when one is given
+    if feature_store is None:
+        return df.keys(), _prepare_engle_granger_panel(df, trend)
+
+    features = feature_store['engle_granger']
+    if features['trend'] != trend:
+        raise ValueError(f"The feature store was built for trend '{features['trend']}', not '{trend}'")
+
+    return pd.Index(feature_store['tickers']), (
+        features['X_detrended'], features['sum_squares'], features['total_sum_squares']
+    )
+
+
+def _residual_adf_scores(
+    residuals: np.ndarray,
+    rsquared: np.ndarray,
+    trend: str = 'c',
+    maxlag: int = None,
+    autolag: str = 'aic'
+) -> tuple:
+
+    # (Almost) perfectly colinear pairs get -inf, exactly like coint
+    score = np.full(residuals.shape[1], -np.inf)
+    testable = rsquared < 1 - 100 * SQRTEPS
+    if np.any(testable):
+        score[testable] = tsa_snp.adfuller_batched(
+            residuals[:, testable], maxlag=maxlag, regression='n', autolag=autolag
+        )[0]
+
+    pvalue = tsa_snp.mackinnonp_batched(score, regression=trend, N=2)
+
+    return score, pvalue
+
+
+def _adf_block_size(
+    nobs: int,
+    maxlag: int = None,
+    n_directions: int = 1,
+    memory_budget: int = BLOCK_MEMORY_BUDGET
+) -> int:
+
+    # Pairs per block such that the lagged ADF designs, about nobs x (maxlag + 2) float64 values
+    # per residual series, stay within the memory budget
+    if maxlag is None:
+        maxlag = int(np.ceil(12.0 * np.power(nobs / 100.0, 1 / 4.0)))
+    per_pair = nobs * (maxlag + 2) * 8 * n_directions
+
+    return max(1, int(memory_budget // per_pair))
+
+
+def _engle_granger_block(
+    X_detrended: np.ndarray,
+    sum_squares: np.ndarray,
+    total_sum_squares: np.ndarray,
+    dependent: np.ndarray,
+    regressor: np.ndarray,
+    trend: str = 'c',
+    maxlag: int = None,
+    autolag: str = 'aic'
+) -> tuple:
+
+    # Hedge ratios of a block of pairs from the cross-products of the detrended columns
+    cross_products = np.einsum('ti,ti->i', X_detrended[:, dependent], X_detrended[:, regressor])
+    hedge_ratio = cross_products / sum_squares[regressor]
+    residuals = X_detrended[:, dependent] - hedge_ratio * X_detrended[:, regressor]
+
+    sum_squared_resid = sum_squares[dependent] - hedge_ratio * cross_products
+    rsquared = 1 - sum_squared_resid / total_sum_squares[dependent]
+
+    return _residual_adf_scores(residuals, rsquared, trend=trend, maxlag=maxlag, autolag=autolag)
+
+
+def _engle_granger_bidirectional_block(
+    X_detrended: np.ndarray,
+    sum_squares: np.ndarray,
+    total_sum_squares: np.ndarray,
+    first: np.ndarray,
+    second: np.ndarray,
+    trend: str = 'c',
+    maxlag: int = None,
+    autolag: str = 'aic'
+) -> tuple:
+
+    # Both hedge directions share the pair's cross-product and the two sums of squares:
+    # coint(S1, S2) regresses the first leg on the second, coint(S2, S1) the other way round
+    S1 = X_detrended[:, first]
+    S2 = X_detrended[:, second]
+    cross_products = np.einsum('ti,ti->i', S1, S2)
+
+    hedge_ratio = cross_products / sum_squares[second]
+    hedge_ratio_swap = cross_products / sum_squares[first]
+
+    residuals = np.hstack([S1 - hedge_ratio * S2, S2 - hedge_ratio_swap * S1])
+    rsquared = np.concatenate([
+        1 - (sum_squares[first] - hedge_ratio * cross_products) / total_sum_squares[first],
+        1 - (sum_squares[second] - hedge_ratio_swap * cross_products) / total_sum_squares[second]
+    ])
+
+    # One stacked ADF pass for the two directions
+    score, pvalue = _residual_adf_scores(residuals, rsquared, trend=trend, maxlag=maxlag, autolag=autolag)
+    n_pairs = len(first)
+
+    return score[:n_pairs], pvalue[:n_pairs], score[n_pairs:], pvalue[n_pairs:]
+
+
+@inst.timed('engle_granger.find_cointegrated_pairs_batched')
+def find_cointegrated_pairs_batched(
+    df: pd.DataFrame,
+    significance_level: float = 0.05,
+    trend: str = 'c',
+    maxlag: int = None,
+    autolag: str = 'aic',
+    block_size: int = None,
+    pairs: list = None,
+    visualize: bool = True,
+    output: str = 'dense',
+    feature_store: dict = None
+) -> tuple:
+
+    """
+    Batched Engle-Granger test of every pair of columns, equivalent to calling coint(S1, S2)
+    for each pair in find_cointegrated_pairs. The hedge regressions are solved from the
+    cross-products of the (detrended) price panel and the residual ADF regressions are run
+    block by block as stacked array operations.
+
+    Parameters:
+        df (pandas.DataFrame): Price panel with one column per stock, without missing values.
+        significance_level (float): Pairs with a p-value below this level are returned. Default is 0.05.
+        trend (str): Deterministic terms of the hedge regression ('n', 'c', 'ct' or 'ctt'). Default is 'c'.
+        maxlag (int or None): Maximum lag of the residual ADF regression. Default is coint's rule.
+        autolag (str or None): Lag selection of the residual ADF regression. Default is 'aic'.
+        block_size (int or None): Number of pairs whose residual ADF regressions are solved together. Default is
+            derived from the number of observations and maxlag so that a block stays within BLOCK_MEMORY_BUDGET.
+        pairs (list or None): Candidate pairs [stock_a, stock_b] to test. Default is every pair; untested
+            entries keep the score 0 and p-value 1 of the matrices.
+        visualize (bool): Draw the p-value heatmap. Default is True.
+        output (str): Format of the score and p-value results: 'dense' n x n matrices, 'condensed' float32
+            upper triangles or 'sparse' significant pairs only (see pair_result_formats). Default is 'dense'.
+        feature_store (dict or None): Output of pair_feature_store.build_feature_store with the same trend.
+            When given, its precomputed panel and tickers are used and df is ignored (may be None).
+
+    Returns:
+        tuple: score_matrix, pvalue_matrix and the list of cointegrated pairs, as in find_cointegrated_pairs.
+    """
+    keys, (X_detrended, sum_squares, total_sum_squares) = _engle_granger_features(df, trend, feature_store)
+    n = len(keys)
+
+    # Pairs in the same order as the double loop: (0, 1), (0, 2), ..., (1, 2), ...
+    row_idx, col_idx = hdf.pairs_to_column_positions(keys.tolist(), pairs)
+    if block_size is None:
+        block_size = _adf_block_size(X_detrended.shape[0], maxlag)
+
+    # Results of the tested pairs only, arranged in the requested format at the end
+    scores = np.empty(len(row_idx))
+    pvalues = np.empty(len(row_idx))
+
+    for start in range(0, len(row_idx), block_size):
+        rows = row_idx[start:start + block_size]
+        cols = col_idx[start:start + block_size]
+
+        with inst.latency('engle_granger.batched_pair', weight=len(rows)):
+            scores[start:start + block_size], pvalues[start:start + block_size] = _engle_granger_block(
+                X_detrended, sum_squares, total_sum_squares, rows, cols,
+                trend=trend, maxlag=maxlag, autolag=autolag
+            )
+
+    selected = pvalues < significance_level
+    pairs = [[keys[i], keys[j]] for i, j in zip(row_idx[selected], col_idx[selected])]
+
+    inst.count('engle_granger.pairs_tested', len(row_idx))
+    inst.count('engle_granger.pairs_passed', len(pairs))
+
+    score_matrix = prf.format_pair_values(scores, row_idx, col_idx, n, 0.0, output=output, keep=selected)
+    pvalue_matrix = prf.format_pair_values(pvalues, row_idx, col_idx, n, 1.0, output=output, keep=selected)
+
+    # Visualize the pairs
+    if visualize:
+        rpt.engle_granger_heatmaps(
+            [prf.format_pair_values(pvalues, row_idx, col_idx, n, 1.0)], keys.tolist(),
+            ['Engle - Granger Cointegration Test'], significance_level=significance_level
+        )
+
+    return score_matrix, pvalue_matrix, pairs
+
+
+@inst.timed('engle_granger.find_cointegrated_pairs_bidirectional')
+def find_cointegrated_pairs_bidirectional(
+    df: pd.DataFrame,
+    significance_level: float = 0.05,
+    trend: str = 'c',
+    maxlag: int = None,
+    autolag: str = 'aic',
+    block_size: int = None,
+    pairs: list = None,
+    visualize: bool = True,
+    output: str = 'dense',
+    feature_store: dict = None
+) -> dict:
+
+    """
+    Engle-Granger test of every pair in both hedge directions in a single scan. Replaces running
+    find_cointegrated_pairs and find_cointegrated_pairs_swap one after the other: the panel is
+    prepared once and each pair's cross-product and sums of squares serve both regressions.
+
+    Parameters:
+        df (pandas.DataFrame): Price panel with one column per stock, without missing values.
+        significance_level (float): Pairs with a p-value below this level are selected. Default is 0.05.
+        trend (str): Deterministic terms of the hedge regression ('n', 'c', 'ct' or 'ctt'). Default is 'c'.
+        maxlag (int or None): Maximum lag of the residual ADF regression. Default is coint's rule.
+        autolag (str or None): Lag selection of the residual ADF regression. Default is 'aic'.
+        block_size (int or None): Number of pairs whose residual ADF regressions are solved together. Default is
+            derived from the number of observations and maxlag so that a block stays within BLOCK_MEMORY_BUDGET.
+        pairs (list or None): Candidate pairs [stock_a, stock_b] to test. Default is every pair; untested
+            entries keep the score 0 and p-value 1 of the matrices.
+        visualize (bool): Draw the p-value heatmaps of both directions. Default is True.
+        output (str): Format of the score and p-value results: 'dense' n x n matrices, 'condensed' float32
+            upper triangles or 'sparse' significant pairs only (see pair_result_formats). Default is 'dense'.
+        feature_store (dict or None): Output of pair_feature_store.build_feature_store with the same trend.
+            When given, its precomputed panel and tickers are used and df is ignored (may be None).
+
+    Returns:
+        dict: 'score_matrix', 'pvalue_matrix' and 'pairs' for coint(S1, S2) (find_cointegrated_pairs),
+        'score_matrix_swap', 'pvalue_matrix_swap' and 'pairs_swap' for coint(S2, S1)
+        (find_cointegrated_pairs_swap), 'pairs_either' for pairs significant in at least one direction
+        and 'pairs_both' for pairs significant in both directions.
+    """
+    keys, (X_detrended, sum_squares, total_sum_squares) = _engle_granger_features(df, trend, feature_store)
+    n = len(keys)
+
+    row_idx, col_idx = hdf.pairs_to_column_positions(keys.tolist(), pairs)
+    if block_size is None:
+        block_size = _adf_block_size(X_detrended.shape[0], maxlag, n_directions=2)
+
+    scores, pvalues, scores_swap, pvalues_swap = (np.empty(len(row_idx)) for _ in range(4))
+
+    for start in range(0, len(row_idx), block_size):
+        rows = row_idx[start:start + block_size]
+        cols = col_idx[start:start + block_size]
+        block = slice(start, start + block_size)
+
+        with inst.latency('engle_granger.bidirectional_pair', weight=len(rows)):
+            scores[block], pvalues[block], scores_swap[block], pvalues_swap[block] = _engle_granger_bidirectional_block(
+                X_detrended, sum_squares, total_sum_squares, rows, cols,
+                trend=trend, maxlag=maxlag, autolag=autolag
+            )
+
+    selected = pvalues < significance_level
+    selected_swap = pvalues_swap < significance_level
+
+    inst.count('engle_granger.pairs_tested', len(row_idx))
+    inst.count('engle_granger.pairs_passed', int(selected.sum()))
+    inst.count('engle_granger.pairs_tested_swap', len(row_idx))
+    inst.count('engle_granger.pairs_passed_swap', int(selected_swap.sum()))
+
+    def to_pairs(mask):
+        return [[keys[i], keys[j]] for i, j in zip(row_idx[mask], col_idx[mask])]
+
+    def to_output(values, fill, keep):
+        return prf.format_pair_values(values, row_idx, col_idx, n, fill, output=output, keep=keep)
+
+    result = {
+        'score_matrix': to_output(scores, 0.0, selected),
+        'pvalue_matrix': to_output(pvalues, 1.0, selected),
+        'pairs': to_pairs(selected),
+        'score_matrix_swap': to_output(scores_swap, 0.0, selected_swap),
+        'pvalue_matrix_swap': to_output(pvalues_swap, 1.0, selected_swap),
+        'pairs_swap': to_pairs(selected_swap),
+        'pairs_either': to_pairs(selected | selected_swap),
+        'pairs_both': to_pairs(selected & selected_swap)
+    }
+
+    # Visualize the pairs of both directions
+    if visualize:
+        rpt.engle_granger_heatmaps(
+            [
+                prf.format_pair_values(pvalues, row_idx, col_idx, n, 1.0),
+                prf.format_pair_values(pvalues_swap, row_idx, col_idx, n, 1.0)
+            ],
+            keys.tolist(),
+            ['Engle - Granger Cointegration Test', 'Engle - Granger Cointegration Test (Swap)'],
+            significance_level=significance_level
+        )
+
+    return result
@@ -1,78 +1,75 @@
 import pandas as pd 
-import explore_stats as xstats
 
 
-def stock_exploration(
-    df: pd.DataFrame
-    ) -> pd.DataFrame:
+def _grouped_column_stats(
+    df: pd.DataFrame,
+    column_name: str,
+    in_range: pd.Series = None
+    ) -> tuple:
 
-  lst_stock_code = []
-  lst_floor = []
-  lst_start_date = []
-  lst_end_date = []
-  lst_number_of_days = []
-  lst_vol_non_null_all = []
-  lst_vol_missing_pct_all = []
-  lst_vol_avg_all = []
-  lst_vol_std_all = []
-  lst_adclose_non_null_all = []
-  lst_adclose_missing_pct_all = []
+  # Same statistics as explore_stats.calculate_stats_within_date_range, for every code in one grouped pass
+  column = df[column_name]
+  rows = pd.Series(True, index=df.index) if in_range is None else in_range
+  column = column.where(rows)
 
-  # Iterate each stock in the code column
-  for code in df['code'].unique():
+  grouped_rows = rows.groupby(df['code'], sort=False)
+  grouped_column = column.groupby(df['code'], sort=False)
 
-    lst_stock_code.append(code)
+  total_values = grouped_rows.sum()
+  non_null_count = grouped_column.count()
+  missing_percentage = (total_values - non_null_count) / total_values * 100.0
+  average = grouped_column.mean().round(2)
+  std_deviation = grouped_column.std().round(2)
 
-    # Select the subdataframe based on the current stock code
-    df_stock_temp = df[df['code'] == code]
+  return non_null_count, missing_percentage, average, std_deviation
 
-    # Add the floor which the stock is listed to the lst_floor
-    lst_floor.append(df_stock_temp['floor'].unique()[0])
 
-    # Sort the date column
-    df_stock_temp_sorted = df_stock_temp.sort_values(by='date')
-
-    # Datetime -----------------------------------------
-    # Select the first date and last date
-    first_date = df_stock_temp_sorted['date'].min()
-    last_date = df_stock_temp_sorted['date'].max()
-    number_of_days = len(df_stock_temp_sorted['date'])
+def stock_exploration(
+    df: pd.DataFrame,
+    date_ranges: dict = None
+    ) -> pd.DataFrame:
 
-    lst_start_date.append(first_date)
-    lst_end_date.append(last_date)
-    lst_number_of_days.append(number_of_days)
+  """
+  Summary of every stock code of the raw long-format feed, computed with grouped aggregations
+  in a single pass over the rows.
 
-    # Volume Stats -----------------------------------------
-    # The number of non-null values and the missing value percentages of volume
-    non_null_count_vol_all, missing_pct_vol_all, average_vol_all, std_vol_all = xstats.calculate_stats_within_date_range(
-        df_stock_temp_sorted, column_name = 'nmVolume'
-    )
-    lst_vol_non_null_all.append(non_null_count_vol_all)
-    lst_vol_missing_pct_all.append(missing_pct_vol_all)
-    lst_vol_avg_all.append(average_vol_all)
-    lst_vol_std_all.append(std_vol_all)
-
-    # adClose Stats -----------------------------------------
-    # The number of non-null values and the missing value percentages of adClose
-    non_null_count_adclose_all, missing_pct_adclose_all, _, _ = xstats.calculate_stats_within_date_range(
-        df_stock_temp_sorted, column_name = 'adClose'
-    )
-    lst_adclose_non_null_all.append(non_null_count_adclose_all)
-    lst_adclose_missing_pct_all.append(missing_pct_adclose_all)
+  Parameters:
+      df (pandas.DataFrame): Long-format feed with the code, floor, date, nmVolume and adClose columns.
+      date_ranges (dict or None): Optional windows {suffix: (start_date, end_date)}. Each window adds the
+          vol_*_<suffix> and adclose_*_<suffix> columns computed on the rows within the dates (inclusive).
 
+  Returns:
+      pandas.DataFrame: One row per code in order of first appearance: floor, first and last date, number of
+      rows, non-null count and missing percentage of nmVolume and adClose, mean and standard deviation of nmVolume.
+  """
+  # Floor of the first row of each code, codes in order of first appearance
+  first_rows = df.drop_duplicates(subset='code')
+  grouped_dates = df['date'].groupby(df['code'], sort=False)
 
+  # Datetime -----------------------------------------
   result_df = pd.DataFrame({
-      'code': lst_stock_code,
-      'floor': lst_floor,
-      'start_date': lst_start_date,
-      'end_date': lst_end_date,
-      'number_of_days': lst_number_of_days,
-      'vol_non_null_all': lst_vol_non_null_all,
-      'vol_missing_pct_all': lst_vol_missing_pct_all,
-      'vol_avg_all': lst_vol_avg_all,
-      'vol_std_all': lst_vol_std_all,
-      'adclose_non_null_all': lst_adclose_non_null_all,
-      'adclose_missing_pct_all': lst_adclose_missing_pct_all
+      'code': first_rows['code'].to_numpy(),
+      'floor': first_rows['floor'].to_numpy(),
+      'start_date': grouped_dates.min().to_numpy(),
+      'end_date': grouped_dates.max().to_numpy(),
+      'number_of_days': grouped_dates.size().to_numpy()
   })
 
+  windows = {'all': None}
+  for suffix, (start_date, end_date) in (date_ranges or {}).items():
+    windows[suffix] = (df['date'] >= start_date) & (df['date'] <= end_date)
+
+  for suffix, in_range in windows.items():
+    # Volume Stats -----------------------------------------
+    non_null, missing_pct, average, std = _grouped_column_stats(df, 'nmVolume', in_range)
+    result_df[f'vol_non_null_{suffix}'] = non_null.to_numpy()
+    result_df[f'vol_missing_pct_{suffix}'] = missing_pct.to_numpy()
+    result_df[f'vol_avg_{suffix}'] = average.to_numpy()
+    result_df[f'vol_std_{suffix}'] = std.to_numpy()
+
+    # adClose Stats -----------------------------------------
+    non_null, missing_pct, _, _ = _grouped_column_stats(df, 'adClose', in_range)
+    result_df[f'adclose_non_null_{suffix}'] = non_null.to_numpy()
+    result_df[f'adclose_missing_pct_{suffix}'] = missing_pct.to_numpy()
+
   return result_df
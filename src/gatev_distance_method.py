@@ -1,9 +1,10 @@
 import pandas as pd
-import plotly.express as px
 import numpy as np
-import itertools
-from heapq import nsmallest, nlargest
+import pair_result_formats as prf
+import pair_reporting as rpt
+import instrumentation as inst
 
+@inst.timed('gatev.gatev_data_normalize')
 def gatev_data_normalize(
     df: pd.DataFrame, 
     visualize=True
@@ -23,71 +24,174 @@ def gatev_data_normalize(
     df_cum_daily_returns_pct = df_cum_daily_returns_pct*100
     
     if visualize:
-        fig = px.line(df_cum_daily_returns_pct,
-              title='Performance - Daily Cumulative Returns', 
-              width=1000, height=600,
-              )
-        fig.update_layout(yaxis_title="Daily Cumulative returns (%)")
-        fig.show()
+        rpt.cumulative_returns_chart(df_cum_daily_returns_pct)
     
     return df_cum_daily_returns_pct
 
 
-def gatev_distance_matrix(df: pd.DataFrame) -> None:
-    
-    col =  df.columns.tolist()
-    
+def _gatev_features(df: pd.DataFrame) -> dict:
+
+    # Per-stock normalized series, centered on each date, and their squared norms
+    X = df.to_numpy(dtype=float)
+
+    if np.isnan(X).any():
+        raise ValueError("The normalized prices contain missing values, drop or fill them first")
+
+    # Subtracting the same value from every stock on a date leaves all distances unchanged and
+    # keeps the Gram entries small, which limits cancellation in the expansion below
+    X = np.ascontiguousarray(X - X.mean(axis=1, keepdims=True))
+
+    return {'X': X, 'sq_norms': np.einsum('ti,ti->i', X, X)}
+
+
+def _gatev_store_features(df: pd.DataFrame, feature_store: dict = None) -> tuple:
+
+    # Tickers and features, taken from the feature store when one is given
+    if feature_store is None:
+        return df.columns.tolist(), _gatev_features(df)
+
+    return feature_store['tickers'], feature_store['gatev']
+
+
+@inst.timed('gatev.gatev_squared_distances')
+def gatev_squared_distances(df: pd.DataFrame, feature_store: dict = None) -> tuple:
+
+    """
+    Squared Euclidean (SSD) distances of every pair of columns from a single Gram matrix product,
+    ||S1 - S2||^2 = ||S1||^2 + ||S2||^2 - 2 S1'S2.
+
+    Parameters:
+        df (pandas.DataFrame): Normalized prices (e.g. output of gatev_data_normalize), without missing values.
+        feature_store (dict or None): Output of pair_feature_store.build_feature_store. When given, its
+            precomputed normalized series are used and df is ignored (may be None).
+
+    Returns:
+        tuple: The condensed squared distances of the pairs (i, j), i < j, in itertools.combinations
+        order, and the two index arrays i and j.
+    """
+    _, features = _gatev_store_features(df, feature_store)
+    X, sq_norms = features['X'], features['sq_norms']
+
+    gram = X.T @ X
+
+    row_idx, col_idx = np.triu_indices(X.shape[1], k=1)
+    sq_dist = sq_norms[row_idx] + sq_norms[col_idx] - 2 * gram[row_idx, col_idx]
+
+    inst.count('gatev.pairs_tested', len(sq_dist))
+
+    return np.maximum(sq_dist, 0.0), row_idx, col_idx
+
+
+def _smallest_positions(sq_dist: np.ndarray, top_values: int) -> np.ndarray:
+
+    # k-th smallest value, then everything strictly below it and as many ties as needed, in pair order
+    top_values = min(top_values, len(sq_dist))
+    if top_values <= 0:
+        return np.empty(0, dtype=int)
+
+    kth_value = np.partition(sq_dist, top_values - 1)[top_values - 1]
+    below = np.flatnonzero(sq_dist < kth_value)
+    ties = np.flatnonzero(sq_dist == kth_value)[:top_values - len(below)]
+
+    return np.concatenate([below, ties])
+
+
+@inst.timed('gatev.gatev_smallest_pairs')
+def gatev_smallest_pairs(
+    df: pd.DataFrame,
+    top_values: int = 10,
+    feature_store: dict = None
+) -> tuple:
+
+    """
+    Exactly top_values pairs with the smallest Gatev distance. Candidates come from a partial sort of
+    the Gram-matrix distances, ties at the cut-off are broken by pair order, and the distances of the
+    winners are recomputed directly from the series.
+
+    Parameters:
+        df (pandas.DataFrame): Normalized prices (e.g. output of gatev_data_normalize), without missing values.
+        top_values (int): The number of pairs to return. Default is 10.
+        feature_store (dict or None): Precomputed features (see gatev_squared_distances). Default is None.
+
+    Returns:
+        tuple: The list of pairs [stock_a, stock_b] sorted by increasing distance and the array of their distances.
+    """
+    keys, features = _gatev_store_features(df, feature_store)
+    sq_dist, row_idx, col_idx = gatev_squared_distances(df, feature_store=feature_store)
+    chosen = _smallest_positions(sq_dist, top_values)
+
+    if len(chosen) == 0:
+        return [], np.empty(0)
+
+    X = features['X']
+    distances = np.linalg.norm(X[:, row_idx[chosen]] - X[:, col_idx[chosen]], axis=0)
+
+    order = np.lexsort((chosen, distances))
+    chosen = chosen[order]
+    distances = distances[order]
+
+    pairs = [[keys[row_idx[k]], keys[col_idx[k]]] for k in chosen]
+
+    return pairs, distances
+
+
+@inst.timed('gatev.gatev_distance_matrix')
+def gatev_distance_matrix(
+    df: pd.DataFrame,
+    output: str = 'dense',
+    top_values: int = None,
+    feature_store: dict = None,
+    visualize: bool = True
+):
+
+    """
+    Gatev distances of every pair. The dense matrix (upper triangle filled) is drawn as a heatmap
+    (pair_reporting.distance_heatmap); the condensed and sparse formats of pair_result_formats skip the
+    figure and the n x n allocation.
+
+    Parameters:
+        df (pandas.DataFrame): Normalized prices (e.g. output of gatev_data_normalize), without missing values.
+        output (str): 'dense', 'condensed' (float32 upper triangle) or 'sparse'. Default is 'dense'.
+        top_values (int or None): With the sparse format, keep only the top_values closest pairs. Default keeps all.
+        feature_store (dict or None): Precomputed features (see gatev_squared_distances). Default is None.
+        visualize (bool): Draw the heatmap of the dense matrix. Default is True.
+
+    Returns:
+        numpy.ndarray or dict: The distances in the requested format.
+    """
+    col, _ = _gatev_store_features(df, feature_store)
+    sq_dist, row_idx, col_idx = gatev_squared_distances(df, feature_store=feature_store)
+
+    if output != 'dense':
+        keep = None
+        if top_values is not None:
+            keep = np.zeros(len(sq_dist), dtype=bool)
+            keep[_smallest_positions(sq_dist, top_values)] = True
+        return prf.format_pair_values(np.sqrt(sq_dist), row_idx, col_idx, len(col), 0.0, output=output, keep=keep)
+
+    # Upper triangle filled with the pairwise distances of the shared engine
     dist_gatev = np.zeros((len(col), len(col)))
-    
-    keys = df.keys()
-    for i in range(len(col)):
-        for j in range(i+1, len(col)):
-            S1 = df[keys[i]]
-            S2 = df[keys[j]]
-            dist = round(np.linalg.norm(S1 - S2),1)
-            dist_gatev[i,j] = dist
-
-    fig = px.imshow(dist_gatev,
-                    labels=dict(x="Stock", y="Stock", color="Distance"),
-                    x=col,
-                    y=col,  color_continuous_scale='reds',
-                width=1000, height=600)
-    fig.update_xaxes(side="top")
-    fig.show()
-    
-    
+    dist_gatev[row_idx, col_idx] = np.sqrt(sq_dist)
+
+    if visualize:
+        rpt.distance_heatmap(dist_gatev, list(col))
+
+    return dist_gatev
+
+
+@inst.timed('gatev.gatev_distance_smallest')
 def gatev_distance_smallest(
     df: pd.DataFrame, 
     top_values: int = 10
 ) -> tuple:
     
-    # Lấy tổ hợp chập 2 các phần tử trong danh sách các cột 
-    col_combi = list(itertools.combinations(df.columns.tolist(), 2))
-
-    # Tính khoảng cách euclide của từng cặp 
-    value_list = [] 
-    for col in col_combi:
-        dist = round(np.linalg.norm(
-            df[col[0]] - df[col[1]]), 1)
-        
-        value_list.append(dist)
-
-    # Chọn ra các cặp có giá trị khoảng cách nhỏ nhất 
-    top_smallest = nsmallest(top_values, value_list)
-    
-    # List các tổ hợp các gặp có khoảng cách ngắn nhất 
-    list_smallest_pair_gatev = []
-    
+    # Chọn ra đúng top_values cặp có khoảng cách nhỏ nhất (sắp xếp tăng dần theo khoảng cách)
+    list_smallest_pair_gatev, distances = gatev_smallest_pairs(df, top_values=top_values)
+
     # List kết quả của các cặp có khoảng cách ngắn nhất 
-    list_result_smallest_dist = []
-    
-    for col in col_combi:
-        dist = round(np.linalg.norm(
-            df[col[0]] - df[col[1]]), 1)
-        
-        if dist in top_smallest:
-            pair = [col[0], col[1]]
-            list_smallest_pair_gatev.append(pair)
-            list_result_smallest_dist.append(f"Khoảng cách Euclide của {col[0]} và {col[1]}: {dist}")
-
-    return list_smallest_pair_gatev, list_result_smallest_dist
\ No newline at end of file
+    list_result_smallest_dist = [
+        f"Khoảng cách Euclide của {pair[0]} và {pair[1]}: {round(dist, 1)}"
+        for pair, dist in zip(list_smallest_pair_gatev, distances)
+    ]
+
+    return list_smallest_pair_gatev, list_result_smallest_dist
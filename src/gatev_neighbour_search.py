@@ -0,0 +1,358 @@
+import pandas as pd
+import numpy as np
+from scipy.spatial import cKDTree
+
+# Tree candidates per requested neighbour before exact re-ranking. Exact mode only needs a first radius, which
+# the ball search then makes exact; approximate mode keeps only the re-ranked candidates, and 4 per neighbour
+# give a mean recall of about 1.0 (minimum 0.8) on the synthetic benchmark universes of 2,000 to 5,000 stocks
+DEFAULT_OVERSAMPLE = {'exact': 1, 'approximate': 4}
+
+
+def build_gatev_neighbour_index(
+    df: pd.DataFrame,
+    mode: str = 'exact',
+    n_components: int = 16
+) -> dict:
+
+    """
+    Build a KD-tree index over low-dimensional projections of the normalized series (one point per stock)
+    so that nearest Gatev partners can be found without filling the full distance matrix.
+
+    The index pays off on large universes only. gatev_smallest_pairs costs one n x n Gram product, O(n^2 T)
+    for n stocks and T bars; the index costs the covariance of the bars, O(n T^2), its eigendecomposition,
+    O(T^3), and tree searches that grow close to linearly in n. It wins when there are many more stocks
+    than bars (a few thousand stocks on a few hundred bars) and loses on small universes or long panels,
+    where the T x T eigendecomposition dominates: use gatev_smallest_pairs there.
+
+    Parameters:
+        df (pandas.DataFrame): Normalized prices (e.g. output of gatev_data_normalize), without missing values.
+        mode (str): Both modes project on the leading principal components, which never lengthens a distance.
+            'exact' adds a ball search around the exact candidates, which makes the neighbours exact.
+            'approximate' only re-ranks the tree candidates: faster per-stock queries, recall below 1
+            (see gatev_neighbour_recall).
+        n_components (int): Dimension of the projected space. Default is 16.
+
+    Returns:
+        dict: The index: stock names, centered series, projected points, KD-tree and mode.
+    """
+    if mode not in ('exact', 'approximate'):
+        raise ValueError("mode must be 'exact' or 'approximate'")
+
+    X = df.to_numpy(dtype=float)
+
+    if np.isnan(X).any():
+        raise ValueError("The normalized prices contain missing values, drop or fill them first")
+
+    # One point per stock. Removing the cross-sectional mean of every date leaves distances unchanged
+    points = np.ascontiguousarray((X - X.mean(axis=1, keepdims=True)).T)
+    n_components = min(n_components, points.shape[0], points.shape[1])
+
+    # Orthonormal principal directions: ||P'(a - b)|| <= ||a - b||. The eigenvectors of the dates x dates
+    # covariance are the right singular vectors of the centered points, at a fraction of the SVD cost
+    centered = points - points.mean(axis=0)
+    _, eigenvectors = np.linalg.eigh(centered.T @ centered)
+    projection = np.ascontiguousarray(eigenvectors[:, ::-1][:, :n_components])
+
+    projected = points @ projection
+
+    return {
+        'tickers': df.columns.tolist(),
+        'points': points,
+        'sq_norms': np.einsum('ij,ij->i', points, points),
+        'projected': projected,
+        'tree': cKDTree(projected),
+        'mode': mode
+    }
+
+
+def _pair_distances(
+    index: dict,
+    query: np.ndarray,
+    owner: np.ndarray,
+    members: np.ndarray,
+    block_size: int = 256
+) -> np.ndarray:
+
+    # Exact distances of the (query[owner[p]], members[p]) stock pairs. Queries are taken in KD-tree leaf
+    # order, so a block of neighbouring queries shares most of its candidates: each block costs one Gram
+    # product against the union of its candidates instead of one gathered series per pair
+    points = index['points']
+    sq_norms = index['sq_norms']
+
+    leaf_rank = np.empty(len(index['tickers']), dtype=int)
+    leaf_rank[index['tree'].indices] = np.arange(len(leaf_rank))
+    query_order = np.argsort(leaf_rank[query], kind='stable')
+    query_block = np.empty(len(query), dtype=int)
+    query_block[query_order] = np.arange(len(query)) // block_size
+    query_row = np.empty(len(query), dtype=int)
+    query_row[query_order] = np.arange(len(query)) % block_size
+
+    pair_order = np.argsort(query_block[owner], kind='stable')
+    bounds = np.searchsorted(query_block[owner][pair_order], np.arange(query_block.max(initial=-1) + 2))
+    cross = np.empty(len(owner))
+
+    for block in range(len(bounds) - 1):
+        pairs = pair_order[bounds[block]:bounds[block + 1]]
+        block_queries = query[query_order[block * block_size:(block + 1) * block_size]]
+        union, column = np.unique(members[pairs], return_inverse=True)
+        gram = points[block_queries] @ points[union].T
+        cross[pairs] = gram[query_row[owner[pairs]], column]
+
+    sq_dist = sq_norms[query[owner]] + sq_norms[members] - 2 * cross
+
+    return np.sqrt(np.maximum(sq_dist, 0.0))
+
+
+def _direct_distances(index: dict, first: np.ndarray, second: np.ndarray) -> np.ndarray:
+
+    # Distances of a few pairs recomputed directly from the series
+    points = index['points']
+
+    return np.linalg.norm(points[first] - points[second], axis=1)
+
+
+def _rerank(index: dict, query: np.ndarray, members: np.ndarray, lengths: np.ndarray, k: int) -> tuple:
+
+    # Exact k nearest among the candidate members of every query stock (self excluded). members holds the
+    # candidates of all queries back to back, lengths[r] of them for query r, and all are ranked in one flat sort
+    owner = np.repeat(np.arange(len(query)), lengths)
+    keep = members != query[owner]
+    owner, members = owner[keep], members[keep]
+
+    exact = _pair_distances(index, query, owner, members)
+
+    # Sorted by query, then distance, then stock position (ties); the first k of every query win
+    order = np.lexsort((members, exact, owner))
+    owner, members, exact = owner[order], members[order], exact[order]
+    starts = np.searchsorted(owner, np.arange(len(query)))
+    rank = np.arange(len(owner)) - starts[owner]
+    top = rank < k
+
+    neighbours = np.empty((len(query), k), dtype=int)
+    distances = np.empty((len(query), k))
+    neighbours[owner[top], rank[top]] = members[top]
+    distances[owner[top], rank[top]] = exact[top]
+
+    return neighbours, distances
+
+
+def _distances_to_all(index: dict, query: np.ndarray) -> np.ndarray:
+
+    # Distances from each query stock to every stock, as one Gram product (n_queries x n)
+    points = index['points']
+    sq_norms = index['sq_norms']
+    sq_dist = sq_norms[query][:, None] + sq_norms[None, :] - 2 * (points[query] @ points.T)
+
+    return np.sqrt(np.maximum(sq_dist, 0.0))
+
+
+def _query_neighbours(
+    index: dict,
+    query: np.ndarray,
+    k: int,
+    oversample: int = None
+) -> tuple:
+
+    # k nearest partners (self excluded) of every query stock, as (n_query, k) index and distance arrays
+    n = len(index['tickers'])
+    k = min(k, n - 1)
+
+    if k <= 0 or len(query) == 0:
+        return np.empty((len(query), max(k, 0)), dtype=int), np.empty((len(query), max(k, 0)))
+
+    if oversample is None:
+        oversample = DEFAULT_OVERSAMPLE[index['mode']]
+    n_candidates = min(n, max(k * oversample, k) + 1)
+
+    _, candidates = index['tree'].query(index['projected'][query], k=n_candidates)
+    candidates = candidates.reshape(len(query), n_candidates)
+    neighbours, distances = _rerank(
+        index, query, candidates.ravel(), np.full(len(query), n_candidates), k
+    )
+
+    if index['mode'] == 'exact':
+        # Every stock closer than the current k-th distance lies inside that radius in the projected
+        # space too, so re-ranking the ball members makes the result exact
+        radius = distances[:, -1] * (1 + 1e-9) + 1e-12
+        balls = index['tree'].query_ball_point(index['projected'][query], radius)
+        lengths = np.fromiter((len(ball) for ball in balls), dtype=int, count=len(balls))
+        members = np.fromiter((member for ball in balls for member in ball), dtype=int, count=lengths.sum())
+        neighbours, distances = _rerank(index, query, members, lengths, k)
+
+    return neighbours, distances
+
+
+def gatev_nearest_neighbours(
+    index: dict,
+    k: int = 5,
+    stocks: list = None,
+    oversample: int = None
+) -> pd.DataFrame:
+
+    """
+    The k closest Gatev partners of each stock.
+
+    Parameters:
+        index (dict): Output of build_gatev_neighbour_index.
+        k (int): The number of partners per stock. Default is 5.
+        stocks (list or None): Stocks to query. Default is every stock of the index.
+        oversample (int or None): Tree candidates per requested neighbour before exact re-ranking.
+            Default is DEFAULT_OVERSAMPLE of the index mode.
+
+    Returns:
+        pandas.DataFrame: One row per (stock, partner) with the partner's rank and exact distance.
+    """
+    tickers = index['tickers']
+    if stocks is None:
+        query = np.arange(len(tickers))
+    else:
+        position = {ticker: i for i, ticker in enumerate(tickers)}
+        query = np.array([position[stock] for stock in stocks], dtype=int)
+
+    neighbours, distances = _query_neighbours(index, query, k, oversample=oversample)
+    k = neighbours.shape[1]
+
+    return pd.DataFrame({
+        'Stock': np.repeat(np.array(tickers, dtype=object)[query], k),
+        'Neighbour': np.array(tickers, dtype=object)[neighbours.ravel()],
+        'Rank': np.tile(np.arange(1, k + 1), len(query)),
+        'Distance': distances.ravel()
+    })
+
+
+def _exact_top_pairs(index: dict, top_values: int) -> tuple:
+
+    # Global top_values pairs of an exact index without per-stock lists. The top_values-th smallest distance
+    # among any top_values real pairs bounds the true one, and the projection never lengthens a distance, so
+    # every winning pair lies within that radius in the projected space
+    n = len(index['tickers'])
+    tree = index['tree']
+
+    # Candidate pairs: the nearest projected partners of every stock, enough of them for top_values pairs
+    partners = min(n - 1, -(-2 * top_values // n))
+    _, candidates = tree.query(index['projected'], k=partners + 1)
+    first = np.repeat(np.arange(n), partners + 1)
+    second = candidates.ravel()
+    keep = first != second
+    codes = np.unique(np.minimum(first, second)[keep] * n + np.maximum(first, second)[keep])
+
+    query, owner = np.unique(codes // n, return_inverse=True)
+    chosen = codes[np.argpartition(_pair_distances(index, query, owner, codes % n), top_values - 1)[:top_values]]
+
+    # Radius from the series themselves, free of the cancellation of the Gram expansion
+    radius = _direct_distances(index, chosen // n, chosen % n).max()
+
+    pairs = tree.query_pairs(radius * (1 + 1e-9) + 1e-12, output_type='ndarray')
+    codes = np.sort(pairs.min(axis=1) * n + pairs.max(axis=1))
+
+    return codes, _direct_distances(index, codes // n, codes % n)
+
+
+def gatev_top_pairs(
+    index: dict,
+    top_values: int = 10,
+    neighbours_per_stock: int = None,
+    oversample: int = None
+) -> tuple:
+
+    """
+    The global top_values pairs with the smallest Gatev distance. An exact index searches the pairs within
+    the top_values-th distance directly and gives the same pairs as gatev_smallest_pairs. Otherwise the pairs
+    come from per-stock neighbour lists: a pair among the global top N is among each leg's N nearest partners.
+
+    Parameters:
+        index (dict): Output of build_gatev_neighbour_index.
+        top_values (int): The number of pairs to return. Default is 10.
+        neighbours_per_stock (int or None): Partners collected per stock. Default is None: the direct search
+            in exact mode, top_values partners per stock in approximate mode.
+        oversample (int or None): Tree candidates per requested neighbour before exact re-ranking.
+            Default is DEFAULT_OVERSAMPLE of the index mode.
+
+    Returns:
+        tuple: The list of pairs [stock_a, stock_b] sorted by increasing distance and the array of their distances.
+    """
+    tickers = index['tickers']
+    n = len(tickers)
+    top_values = min(top_values, n * (n - 1) // 2)
+
+    if top_values <= 0:
+        return [], np.empty(0)
+
+    if index['mode'] == 'exact' and neighbours_per_stock is None:
+        pair_codes, pair_dist = _exact_top_pairs(index, top_values)
+    else:
+        if neighbours_per_stock is None:
+            neighbours_per_stock = top_values
+        neighbours, distances = _query_neighbours(
+            index, np.arange(n), neighbours_per_stock, oversample=oversample
+        )
+
+        # Canonical (i < j) pairs, each kept once
+        first = np.repeat(np.arange(n), neighbours.shape[1])
+        second = neighbours.ravel()
+        pair_a = np.minimum(first, second)
+        pair_b = np.maximum(first, second)
+        pair_codes, unique_idx = np.unique(pair_a * n + pair_b, return_index=True)
+        pair_dist = distances.ravel()[unique_idx]
+
+        # Winners ranked on distances recomputed from the series, as gatev_smallest_pairs does
+        chosen = pair_codes[np.lexsort((pair_codes, pair_dist))[:top_values]]
+        pair_codes, pair_dist = chosen, _direct_distances(index, chosen // n, chosen % n)
+
+    order = np.lexsort((pair_codes, pair_dist))[:top_values]
+    pairs = [[tickers[code // n], tickers[code % n]] for code in pair_codes[order]]
+
+    return pairs, pair_dist[order]
+
+
+def gatev_neighbour_recall(
+    index: dict,
+    k: int = 5,
+    n_queries: int = 100,
+    oversample: int = None,
+    random_state: int = 0
+) -> dict:
+
+    """
+    Recall report of the index: share of the true k nearest partners it returns, measured against
+    brute force on a random sample of stocks.
+
+    Parameters:
+        index (dict): Output of build_gatev_neighbour_index.
+        k (int): The number of partners per stock. Default is 5.
+        n_queries (int): The number of sampled stocks. Default is 100.
+        oversample (int or None): Tree candidates per requested neighbour before exact re-ranking.
+            Default is DEFAULT_OVERSAMPLE of the index mode.
+        random_state (int): Seed of the stock sample. Default is 0.
+
+    Returns:
+        dict: The mode, k, number of queries, mean and minimum recall.
+    """
+    n = len(index['tickers'])
+    k = min(k, n - 1)
+
+    if k <= 0:
+        return {'mode': index['mode'], 'k': 0, 'n_queries': 0, 'recall_mean': np.nan, 'recall_min': np.nan}
+
+    rng = np.random.default_rng(random_state)
+    query = np.sort(rng.choice(n, size=min(n_queries, n), replace=False))
+
+    neighbours, _ = _query_neighbours(index, query, k, oversample=oversample)
+
+    # Brute force ground truth for the sampled stocks only
+    exact = _distances_to_all(index, query)
+    exact[np.arange(len(query)), query] = np.inf
+    truth = np.argsort(exact, axis=1, kind='stable')[:, :k]
+
+    # Partners tied with the true k-th distance count as found
+    kth_distance = np.take_along_axis(exact, truth[:, -1:], axis=1)
+    found = np.take_along_axis(exact, neighbours, axis=1) <= kth_distance * (1 + 1e-9)
+    recall = found.sum(axis=1) / k
+
+    return {
+        'mode': index['mode'],
+        'k': k,
+        'n_queries': len(query),
+        'recall_mean': float(recall.mean()),
+        'recall_min': float(recall.min())
+    }
@@ -1,6 +1,7 @@
 import pandas as pd 
-import itertools
-from itertools import combinations
+import numpy as np
+from collections import Counter
+import instrumentation as inst
 
 
 def reformat_dataframe(
@@ -37,20 +38,26 @@ def reformat_dataframe(
 
 
 
+def _missing_percentage_frame(columns: list, missing_count, n_rows: int) -> pd.DataFrame:
+    # Layout of calculate_missing_percentage from the missing counts of each column
+    missing_count = np.asarray(missing_count)
+
+    return pd.DataFrame(
+        {
+            'column': list(columns),
+            'percentage': missing_count * 100 / n_rows,
+            'count': missing_count
+        }
+    )
+
+
 def calculate_missing_percentage(df: pd.DataFrame) -> pd.DataFrame:
     # Calculate missing percentage for each column
     missing_count = (df.isnull() | df.isna()).sum()
-    missing_percentage = (missing_count * 100 / df.index.size)
-    
+
     # Create a DataFrame to store the results
-    missing_percentage_df = pd.DataFrame(
-        {
-            'column': missing_percentage.index, 
-            'percentage': missing_percentage.values,
-            'count': missing_count.values
-        }
-    )
-    
+    missing_percentage_df = _missing_percentage_frame(missing_count.index, missing_count.values, df.index.size)
+
     return missing_percentage_df
 
 
@@ -77,15 +84,53 @@ def resample_dataframe(
     space_freq: str = 'D'
     ):
 
-    # Ensure the date column is in datetime format
-    df[date_column] = pd.to_datetime(df[date_column])
-    
+    # Ensure the date column is in datetime format, without converting the caller's column in place
+    df = df.assign(**{date_column: pd.to_datetime(df[date_column])})
+
     # Resample the DataFrame at the specified frequency
     resampled_df = df.set_index(date_column).resample(space_freq).asfreq()
     
     return resampled_df
 
 
+@inst.timed('handling_dataframe.pairs_formation_summary')
+def pairs_formation_summary(method_pairs: dict) -> pd.DataFrame:
+
+    """
+    Summary table of the pairs selected by any number of pairs formation methods. Each method's pairs are
+    canonicalized (stock order ignored) into a hash-based counter, so the table is built in one pass over
+    the selected pairs instead of scanning every method list for every combination of tickers.
+
+    Parameters:
+        method_pairs (dict): {column name: list of pairs [stock_a, stock_b]} for every method.
+
+    Returns:
+        pandas.DataFrame: One row per pair found by at least one method, sorted by Stock A then Stock B, with
+        'x' in the column of every method that found it and Count, the number of times the pair appears in
+        the method lists. Methods without any pair get no column.
+    """
+    # Occurrences of every canonical pair (a < b) per method; pairs of a stock with itself are not pairs
+    counters = {
+        method: Counter(tuple(sorted(pair)) for pair in pairs if pair[0] != pair[1])
+        for method, pairs in method_pairs.items()
+    }
+    all_pairs = sorted(set().union(*counters.values()))
+
+    df_pairs = pd.DataFrame(all_pairs, columns=['Stock A', 'Stock B'])
+    count = np.zeros(len(all_pairs), dtype=int)
+
+    for method, counter in counters.items():
+        if not counter:
+            continue
+        occurrences = np.array([counter.get(pair, 0) for pair in all_pairs], dtype=int)
+        df_pairs[method] = np.where(occurrences > 0, 'x', '')
+        count += occurrences
+
+    df_pairs['Count'] = count
+
+    return df_pairs
+
+
 def pairs_formation_result_summary(
     gatev_pairs_list: list,
     eg_pairs_list: list,
@@ -93,73 +138,11 @@ def pairs_formation_result_summary(
     johansen_pairs_list: list
 ) -> pd.DataFrame:
     
-    # Combine all four lists into a single list
-    all_pairs = gatev_pairs_list + eg_pairs_list + eg_pairs_swap_list + johansen_pairs_list
-
-    # Use a set to store unique values
-    unique_values = set()
-
-    # Iterate through the lists and add their elements to the set
-    for pair in all_pairs:
-        unique_values.update(pair)
-
-    # Convert the set back to a list
-    unique_values_list = list(unique_values)
-
-    # Sort the list if needed
-    unique_values_list.sort()
-    
-    # Create a list to store the combinations
-    combinations_list = []
+    methods = ['Gatev Pairs', 'EG Pairs', 'EG Pairs Swap', 'Johansen Pairs']
+    df_pairs = pairs_formation_summary(
+        dict(zip(methods, [gatev_pairs_list, eg_pairs_list, eg_pairs_swap_list, johansen_pairs_list]))
+    )
 
-    # Use itertools.combinations to generate the combinations
-    for combo in combinations(unique_values_list, 2):
-        combinations_list.append(combo)
-    
-    # Create an empty DataFrame with the specified columns
-    columns = ['Stock A', 'Stock B', 'Gatev Pairs', 'EG Pairs', 'EG Pairs Swap', 'Johansen Pairs', 'Count']
-    df = pd.DataFrame(columns=columns)
-    
-    # Create an empty list of dictionaries
-    data = []
-
-    # Iterate through combinations and check if they appear in the given lists
-    for combo in combinations_list:
-        stock_a, stock_b = combo
-        row = {'Stock A': stock_a, 'Stock B': stock_b, 'Count': 0}
-
-        if gatev_pairs_list:
-            for pair in gatev_pairs_list:
-                if [stock_a, stock_b] == pair or [stock_b, stock_a] == pair:
-                    row['Gatev Pairs'] = 'x'
-                    row['Count'] += 1
-
-        if eg_pairs_list:
-            for pair in eg_pairs_list:
-                if [stock_a, stock_b] == pair or [stock_b, stock_a] == pair:
-                    row['EG Pairs'] = 'x'
-                    row['Count'] += 1
-
-        if eg_pairs_swap_list:
-            for pair in eg_pairs_swap_list:
-                if [stock_a, stock_b] == pair or [stock_b, stock_a] == pair:
-                    row['EG Pairs Swap'] = 'x'
-                    row['Count'] += 1
-
-        if johansen_pairs_list:
-            for pair in johansen_pairs_list:
-                if [stock_a, stock_b] == pair or [stock_b, stock_a] == pair:
-                    row['Johansen Pairs'] = 'x'
-                    row['Count'] += 1
-
-        data.append(row)
-
-    # Create the DataFrame from the list of dictionaries
-    df = pd.DataFrame(data)
-
-    # Fill NaN values with an empty string for better representation
-    df = df.fillna('')   
-    
     count_element_in_list = [
         len(gatev_pairs_list), 
         len(eg_pairs_list), 
@@ -169,25 +152,45 @@ def pairs_formation_result_summary(
     if 0 not in count_element_in_list: 
         # Define the desired column order as a list
         desired_column_order = ['Stock A', 'Stock B', 'Gatev Pairs', 'EG Pairs', 'EG Pairs Swap', 'Johansen Pairs', 'Count']
-    
-         # Reorder the DataFrame based on the desired column order
-        df = df[desired_column_order]
     else:
-        # Define the name of the column you want to move to the last position
-        column_name_to_move = 'Count'
-
-        # Check if the column exists in the DataFrame
-        if column_name_to_move in df.columns:
-            # Get the list of column names, excluding the one you want to move
-            column_order = [col for col in df.columns if col != column_name_to_move]
-            # Add the column at the last position
-            column_order.append(column_name_to_move)
-            # Reorder the DataFrame based on the new column order
-            df = df[column_order]
-
-    # Select pairs that satisfy more than one of the tests
-    df_pairs = df[df['Count'] > 0]
-    
-    df_pairs = df_pairs.reset_index(drop=True)
+        # Method columns in order of first appearance down the table, Count at the last position
+        present = [method for method in methods if method in df_pairs.columns]
+        present.sort(key=lambda method: ((df_pairs[method] == 'x').idxmax(), methods.index(method)))
+        desired_column_order = ['Stock A', 'Stock B'] + present + ['Count']
+
+    # Reorder the DataFrame based on the desired column order
+    df_pairs = df_pairs[desired_column_order]
     
-    return df_pairs
\ No newline at end of file
+    return df_pairs
+
+
+def pairs_to_column_positions(
+    columns: list,
+    pairs: list = None
+) -> tuple:
+
+    """
+    Positions of pairs of stocks in a list of columns, as two index arrays (i, j) with i < j sorted in
+    the order of the double loop over the columns (itertools.combinations order).
+
+    Parameters:
+        columns (list): The column names of the price panel.
+        pairs (list or None): Pairs [stock_a, stock_b] in any orientation. Default is every pair of columns.
+
+    Returns:
+        tuple: The index arrays i and j.
+    """
+    n = len(columns)
+
+    if pairs is None:
+        return np.triu_indices(n, k=1)
+
+    position = {column: i for i, column in enumerate(columns)}
+    positions = np.array([[position[a], position[b]] for a, b in pairs], dtype=int).reshape(-1, 2)
+    row_idx = positions.min(axis=1)
+    col_idx = positions.max(axis=1)
+
+    # Canonical order without duplicates or self-pairs
+    codes = np.unique(row_idx[row_idx != col_idx] * n + col_idx[row_idx != col_idx])
+
+    return codes // n, codes % n
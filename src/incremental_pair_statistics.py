@@ -0,0 +1,317 @@
+import pandas as pd
+import numpy as np
+import engle_granger_cointegration_method as eg_coint
+import johansen_cointegration_method as jj_coint
+
+
+def _bar_terms(state: dict, prices: np.ndarray) -> tuple:
+
+    # Prices relative to the first bar ever seen (Gatev sums) and log prices relative to it (hedge
+    # regression sums): the fixed reference keeps the running sums of order one and limits cancellation
+    relative = prices / state['reference']
+    log_relative = np.log(relative)
+
+    return relative, log_relative
+
+
+def _add_bar_to_sums(state: dict, prices: np.ndarray, sign: float) -> None:
+
+    # O(pairs) update of every running sum with one bar, sign = +1 to add it and -1 to remove it
+    relative, log_relative = _bar_terms(state, prices)
+    row_idx, col_idx = state['row_idx'], state['col_idx']
+
+    state['sq_relative'] += sign * relative ** 2
+    state['cross_relative'] += sign * relative[row_idx] * relative[col_idx]
+
+    state['sum_log'] += sign * log_relative
+    state['sq_log'] += sign * log_relative ** 2
+    state['cross_log'] += sign * log_relative[row_idx] * log_relative[col_idx]
+
+
+def init_pair_state(df: pd.DataFrame, window: int = None) -> dict:
+
+    """
+    Running sufficient statistics of every pair of a price panel, updated bar by bar with append_bar:
+    relative-price sums and cross-products for the Gatev distances, log-price sums and cross-products
+    for the Engle-Granger hedge regression, and a ring buffer of the window's bars for the final tests.
+
+    Parameters:
+        df (pandas.DataFrame): Price panel of the initial formation window, one column per stock, without missing values.
+        window (int or None): Length of the rolling window. Once it is full, every new bar drops the oldest one.
+            None keeps every bar (expanding window).
+
+    Returns:
+        dict: The state.
+    """
+    if window is not None and window < 2:
+        raise ValueError("window must be at least 2 bars")
+    if window is not None:
+        df = df.iloc[-window:]
+
+    prices = df.to_numpy(dtype=float)
+
+    if np.isnan(prices).any():
+        raise ValueError("The price panel contains missing values, drop or fill them first")
+    if (prices <= 0).any():
+        raise ValueError("Prices must be positive")
+
+    n = prices.shape[1]
+    row_idx, col_idx = np.triu_indices(n, k=1)
+    capacity = window if window is not None else max(2 * len(prices), 16)
+
+    state = {
+        'tickers': df.columns.tolist(),
+        'window': window,
+        'reference': prices[0].copy(),
+        'row_idx': row_idx,
+        'col_idx': col_idx,
+        'buffer': np.empty((capacity, n)),
+        'dates': np.empty(capacity, dtype=object),
+        'start': 0,
+        'length': 0,
+        'sq_relative': np.zeros(n),
+        'cross_relative': np.zeros(len(row_idx)),
+        'sum_log': np.zeros(n),
+        'sq_log': np.zeros(n),
+        'cross_log': np.zeros(len(row_idx))
+    }
+
+    for date, bar in zip(df.index, prices):
+        append_bar(state, bar, date)
+
+    return state
+
+
+def drop_oldest_bar(state: dict) -> None:
+
+    """
+    Remove the oldest bar of the window from the running sums.
+
+    Parameters:
+        state (dict): Output of init_pair_state.
+    """
+    if state['length'] == 0:
+        raise ValueError("The window is empty")
+
+    position = state['start']
+    _add_bar_to_sums(state, state['buffer'][position], -1.0)
+    state['start'] = (position + 1) % len(state['buffer'])
+    state['length'] -= 1
+
+
+def append_bar(state: dict, prices, date=None) -> None:
+
+    """
+    Append one bar to the window in O(pairs) time. With a rolling window that is full,
+    the oldest bar is dropped first, so the window slides by one bar.
+
+    Parameters:
+        state (dict): Output of init_pair_state.
+        prices (array-like or pandas.Series): Prices of the bar. A Series is aligned on the state's tickers.
+        date (optional): Date of the bar. Default is the Series' name when prices is a Series.
+    """
+    if isinstance(prices, pd.Series):
+        if date is None:
+            date = prices.name
+        prices = prices.reindex(state['tickers'])
+    prices = np.asarray(prices, dtype=float)
+
+    if prices.shape != (len(state['tickers']),):
+        raise ValueError("The bar must have one price per ticker")
+    if np.isnan(prices).any() or (prices <= 0).any():
+        raise ValueError("The bar contains missing or non-positive prices")
+
+    capacity = len(state['buffer'])
+    if state['length'] == capacity:
+        if state['window'] is not None:
+            drop_oldest_bar(state)
+        else:
+            # Expanding window: double the ring buffer, bars in chronological order
+            order = (state['start'] + np.arange(state['length'])) % capacity
+            state['buffer'] = np.vstack([state['buffer'][order], np.empty_like(state['buffer'])])
+            state['dates'] = np.concatenate([state['dates'][order], np.empty(capacity, dtype=object)])
+            state['start'] = 0
+            capacity *= 2
+
+    position = (state['start'] + state['length']) % capacity
+    state['buffer'][position] = prices
+    state['dates'][position] = date
+    state['length'] += 1
+    _add_bar_to_sums(state, prices, 1.0)
+
+
+def resync_pair_state(state: dict) -> None:
+
+    """
+    Recompute the running sums from the bars of the window, clearing the rounding error accumulated
+    by many add/remove updates. Worth calling every few thousand bars on long-running rolling states.
+
+    Parameters:
+        state (dict): Output of init_pair_state.
+    """
+    for key in ['sq_relative', 'cross_relative', 'sum_log', 'sq_log', 'cross_log']:
+        state[key][:] = 0.0
+
+    for bar in pair_state_frame(state).to_numpy():
+        _add_bar_to_sums(state, bar, 1.0)
+
+
+def pair_state_frame(state: dict) -> pd.DataFrame:
+
+    """
+    The bars of the current window as a price panel.
+
+    Parameters:
+        state (dict): Output of init_pair_state.
+
+    Returns:
+        pandas.DataFrame: One row per bar in chronological order, one column per ticker.
+    """
+    order = (state['start'] + np.arange(state['length'])) % len(state['buffer'])
+
+    return pd.DataFrame(state['buffer'][order], index=list(state['dates'][order]), columns=state['tickers'])
+
+
+def incremental_gatev_squared_distances(state: dict) -> tuple:
+
+    """
+    Squared Gatev distances of every pair over the current window, from the running sums only.
+    Same values and layout as gatev_squared_distances(gatev_data_normalize(window prices)):
+    with b the window's first bar, sum_t (100 (P_i/b_i - P_j/b_j))^2 expands into per-ticker
+    sums of squares and per-pair cross-products, and the first bar itself contributes zero.
+
+    Parameters:
+        state (dict): Output of init_pair_state.
+
+    Returns:
+        tuple: The condensed squared distances of the pairs (i, j), i < j, and the index arrays i and j.
+    """
+    row_idx, col_idx = state['row_idx'], state['col_idx']
+    base, _ = _bar_terms(state, state['buffer'][state['start']])
+    scaled_sq = state['sq_relative'] / base ** 2
+
+    sq_dist = 1e4 * (
+        scaled_sq[row_idx] + scaled_sq[col_idx]
+        - 2 * state['cross_relative'] / (base[row_idx] * base[col_idx])
+    )
+
+    return np.maximum(sq_dist, 0.0), row_idx, col_idx
+
+
+def _centered_log_moments(state: dict) -> tuple:
+
+    # Centered sums of squares and cross-products of the log prices over the window
+    nobs = state['length']
+    row_idx, col_idx = state['row_idx'], state['col_idx']
+    mean_log = state['sum_log'] / nobs
+
+    sq_centered = state['sq_log'] - nobs * mean_log ** 2
+    cross_centered = state['cross_log'] - nobs * mean_log[row_idx] * mean_log[col_idx]
+
+    return mean_log, sq_centered, cross_centered
+
+
+def incremental_hedge_ratios(state: dict) -> tuple:
+
+    """
+    Engle-Granger hedge ratios (OLS with a constant on the log prices) of every pair over the current window,
+    from the running sums only.
+
+    Parameters:
+        state (dict): Output of init_pair_state.
+
+    Returns:
+        tuple: The condensed hedge ratios of the first leg on the second (coint(S1, S2)), of the second leg on
+        the first (coint(S2, S1)), and the index arrays i and j.
+    """
+    row_idx, col_idx = state['row_idx'], state['col_idx']
+    _, sq_centered, cross_centered = _centered_log_moments(state)
+
+    return cross_centered / sq_centered[col_idx], cross_centered / sq_centered[row_idx], row_idx, col_idx
+
+
+def incremental_engle_granger(
+    state: dict,
+    significance_level: float = 0.05,
+    maxlag: int = None,
+    autolag: str = 'aic',
+    block_size: int = None,
+    swap: bool = False
+) -> tuple:
+
+    """
+    Engle-Granger test (constant trend, log prices) of every pair over the current window. The hedge
+    regressions come from the running sums; only the residual ADF tests are evaluated on the window's bars.
+
+    Parameters:
+        state (dict): Output of init_pair_state.
+        significance_level (float): Pairs with a p-value below this level are returned. Default is 0.05.
+        maxlag (int or None): Maximum lag of the residual ADF regression. Default is coint's rule.
+        autolag (str or None): Lag selection of the residual ADF regression. Default is 'aic'.
+        block_size (int or None): Number of pairs tested per stacked ADF pass. Default is derived from the
+            window length and maxlag (engle_granger_cointegration_method.BLOCK_MEMORY_BUDGET).
+        swap (bool): Regress the second leg on the first (coint(S2, S1), find_cointegrated_pairs_swap).
+            Default is False.
+
+    Returns:
+        tuple: score_matrix, pvalue_matrix and the list of cointegrated pairs, as find_cointegrated_pairs_batched.
+    """
+    tickers = state['tickers']
+    n = len(tickers)
+    row_idx, col_idx = state['row_idx'], state['col_idx']
+
+    log_prices = np.log(pair_state_frame(state).to_numpy() / state['reference'])
+    mean_log, sq_centered, cross_centered = _centered_log_moments(state)
+    log_centered = log_prices - mean_log
+    dependent_idx, regressor_idx = (col_idx, row_idx) if swap else (row_idx, col_idx)
+    hedge_ratio = cross_centered / sq_centered[regressor_idx]
+    if block_size is None:
+        block_size = eg_coint._adf_block_size(len(log_centered), maxlag)
+
+    score = np.empty(len(row_idx))
+    pvalue = np.empty(len(row_idx))
+
+    for start in range(0, len(row_idx), block_size):
+        block = slice(start, start + block_size)
+        dependent, regressor = dependent_idx[block], regressor_idx[block]
+
+        residuals = log_centered[:, dependent] - hedge_ratio[block] * log_centered[:, regressor]
+        rsquared = hedge_ratio[block] * cross_centered[block] / sq_centered[dependent]
+
+        score[block], pvalue[block] = eg_coint._residual_adf_scores(
+            residuals, rsquared, trend='c', maxlag=maxlag, autolag=autolag
+        )
+
+    score_matrix = np.zeros((n, n))
+    pvalue_matrix = np.ones((n, n))
+    score_matrix[row_idx, col_idx] = score
+    pvalue_matrix[row_idx, col_idx] = pvalue
+
+    selected = pvalue < significance_level
+    pairs = [[tickers[i], tickers[j]] for i, j in zip(row_idx[selected], col_idx[selected])]
+
+    return score_matrix, pvalue_matrix, pairs
+
+
+def incremental_johansen_test(
+    state: dict,
+    confidence_level: int = 95,
+    check_eigen: bool = False
+) -> list:
+
+    """
+    Johansen test of every pair on the log prices of the current window (johansen_test_batched).
+
+    Parameters:
+        state (dict): Output of init_pair_state.
+        confidence_level (int): Trace test confidence level (90, 95 or 99). Default is 95.
+        check_eigen (bool): Also require the maximum eigenvalue test. Default is False.
+
+    Returns:
+        list: The cointegrated pairs [stock_a, stock_b].
+    """
+    return jj_coint.johansen_test_batched(
+        np.log(pair_state_frame(state)),
+        confidence_level=confidence_level,
+        check_eigen=check_eigen
+    )
@@ -0,0 +1,422 @@
+import json
+import time
+import bisect
+import functools
+import tracemalloc
+from contextlib import contextmanager
+import pandas as pd
+
+# Opt-in instrumentation of the formation stages. Disabled by default: stage(), latency() and timed functions
+# then cost one flag check, so the hooks stay in the hot paths. Once enabled, the module records
+#     stages     wall and CPU time, number of calls and, with trace_memory, peak traced allocations
+#     latencies  histograms of per-pair latencies (one coint call, or a batched block spread over its pairs),
+#                log-spaced buckets
+#     counters   integer counts (e.g. pairs tested and passed)
+# every entry keyed by the current labels (e.g. sector, period, method) and the stage name.
+# snapshot() gives a JSON-serializable report, merge_snapshots() combines the reports of worker processes.
+
+# Latency bucket upper edges: 1 microsecond to 100 seconds, 4 buckets per decade, plus an overflow bucket
+BUCKET_EDGES = [10 ** (exponent / 4) for exponent in range(-24, 9)]
+
+
+def _new_state(enabled: bool = False, trace_memory: bool = False, labels: dict = None) -> dict:
+    return {
+        'enabled': enabled,
+        'trace_memory': trace_memory,
+        'labels': dict(labels or {}),
+        'stages': {},
+        'latencies': {},
+        'counters': {},
+        'open_peaks': [],
+        'started_tracing': False
+    }
+
+
+_STATE = _new_state()
+
+
+class _NullContext:
+
+    # Shared no-op context manager returned while disabled
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL = _NullContext()
+
+
+def enable(trace_memory: bool = False) -> None:
+
+    """
+    Start recording. With trace_memory, tracemalloc is started (if not already, and stopped by disable())
+    to record peak allocations per stage; it slows down allocation-heavy code, so it is off by default.
+
+    Parameters:
+        trace_memory (bool): Record the peak traced memory of every stage. Default is False.
+    """
+    _STATE['enabled'] = True
+    _STATE['trace_memory'] = trace_memory
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _STATE['started_tracing'] = True
+
+
+def disable() -> None:
+    _STATE['enabled'] = False
+    if _STATE['started_tracing']:
+        tracemalloc.stop()
+        _STATE['started_tracing'] = False
+
+
+def reset() -> None:
+
+    # Drop the recorded values, keep the enabled flag, memory tracing and labels
+    _STATE.update({'stages': {}, 'latencies': {}, 'counters': {}, 'open_peaks': []})
+
+
+def is_enabled() -> bool:
+    return _STATE['enabled']
+
+
+def _key(name: str) -> tuple:
+    return tuple(sorted(_STATE['labels'].items())), name
+
+
+@contextmanager
+def labels(**values):
+
+    """
+    Attach labels (e.g. sector='tech', period='first', method='EG Pairs') to everything recorded inside.
+
+    Parameters:
+        **values: The labels, added to the labels already set.
+    """
+    previous = _STATE['labels']
+    _STATE['labels'] = {**previous, **values}
+    try:
+        yield
+    finally:
+        _STATE['labels'] = previous
+
+
+class _Stage:
+
+    def __init__(self, name: str):
+        self.key = _key(name)
+
+    def __enter__(self):
+        if _STATE['trace_memory'] and tracemalloc.is_tracing():
+            # The peak of the enclosing stages includes everything allocated so far, then the peak restarts
+            current_peak = tracemalloc.get_traced_memory()[1]
+            _STATE['open_peaks'] = [max(peak, current_peak) for peak in _STATE['open_peaks']] + [0]
+            tracemalloc.reset_peak()
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc_info):
+        wall = time.perf_counter() - self.wall
+        cpu = time.process_time() - self.cpu
+
+        record = _STATE['stages'].setdefault(
+            self.key, {'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'peak_memory_mb': None}
+        )
+        record['calls'] += 1
+        record['wall_seconds'] += wall
+        record['cpu_seconds'] += cpu
+
+        if _STATE['trace_memory'] and tracemalloc.is_tracing() and _STATE['open_peaks']:
+            current_peak = tracemalloc.get_traced_memory()[1]
+            peaks = [max(peak, current_peak) for peak in _STATE['open_peaks']]
+            peak_mb = peaks.pop() / 1024 ** 2
+            _STATE['open_peaks'] = peaks
+            record['peak_memory_mb'] = max(record['peak_memory_mb'] or 0.0, peak_mb)
+
+        return False
+
+
+def stage(name: str):
+
+    """
+    Context manager timing a stage (wall and CPU time, peak memory with trace_memory).
+
+    Parameters:
+        name (str): The stage name, e.g. 'engle_granger.find_cointegrated_pairs'.
+
+    Returns:
+        A context manager (a shared no-op while disabled).
+    """
+    if not _STATE['enabled']:
+        return _NULL
+
+    return _Stage(name)
+
+
+def timed(name: str):
+
+    """
+    Decorator timing every call of a function as the stage name.
+
+    Parameters:
+        name (str): The stage name.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _STATE['enabled']:
+                return function(*args, **kwargs)
+            with _Stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def record_latency(name: str, seconds: float, weight: int = 1) -> None:
+
+    """
+    Add a latency to the histogram name.
+
+    Parameters:
+        name (str): The histogram name, e.g. 'engle_granger.coint'.
+        seconds (float): The latency of one item.
+        weight (int): Number of items with this latency, e.g. the pairs of a batched block timed as a whole
+            and recorded at its per-pair average. Default is 1.
+    """
+    if not _STATE['enabled'] or weight <= 0:
+        return
+
+    histogram = _STATE['latencies'].setdefault(
+        _key(name), {'count': 0, 'total_seconds': 0.0, 'min_seconds': None, 'max_seconds': None,
+                     'buckets': [0] * (len(BUCKET_EDGES) + 1)}
+    )
+    histogram['count'] += weight
+    histogram['total_seconds'] += seconds * weight
+    histogram['min_seconds'] = seconds if histogram['min_seconds'] is None else min(histogram['min_seconds'], seconds)
+    histogram['max_seconds'] = seconds if histogram['max_seconds'] is None else max(histogram['max_seconds'], seconds)
+    histogram['buckets'][bisect.bisect_left(BUCKET_EDGES, seconds)] += weight
+
+
+class _Latency:
+
+    def __init__(self, name: str, weight: int):
+        self.name = name
+        self.weight = weight
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.weight > 0:
+            record_latency(self.name, (time.perf_counter() - self.start) / self.weight, self.weight)
+        return False
+
+
+def latency(name: str, weight: int = 1):
+
+    """
+    Context manager adding the latency of its block to the histogram name (e.g. around one coint call).
+    A block processing several items (e.g. a batched block of pairs) passes their number as weight and is
+    recorded as weight items of the average latency.
+
+    Parameters:
+        name (str): The histogram name.
+        weight (int): Number of items processed by the block. Default is 1.
+
+    Returns:
+        A context manager (a shared no-op while disabled).
+    """
+    if not _STATE['enabled']:
+        return _NULL
+
+    return _Latency(name, weight)
+
+
+def count(name: str, value: int = 1) -> None:
+
+    """
+    Add value to the counter name (e.g. 'engle_granger.pairs_tested').
+
+    Parameters:
+        name (str): The counter name.
+        value (int): The increment. Default is 1.
+    """
+    if not _STATE['enabled']:
+        return
+
+    key = _key(name)
+    _STATE['counters'][key] = _STATE['counters'].get(key, 0) + int(value)
+
+
+def _percentile(histogram: dict, quantile: float) -> float:
+
+    # Upper edge of the bucket holding the quantile, at most the largest latency
+    target = quantile * histogram['count']
+    cumulative = 0
+    for position, bucket_count in enumerate(histogram['buckets']):
+        cumulative += bucket_count
+        if cumulative >= target and bucket_count:
+            if position == len(BUCKET_EDGES):
+                return histogram['max_seconds']
+            return min(BUCKET_EDGES[position], histogram['max_seconds'])
+
+    return histogram['max_seconds']
+
+
+def _report(stages: dict, latencies: dict, counters: dict) -> dict:
+
+    # Keyed records as lists of records with their labels, histograms with their percentiles
+    def entries(records):
+        return [{'labels': dict(labels_key), 'name': name, **value} for (labels_key, name), value in records.items()]
+
+    latency_records = entries(latencies)
+    for histogram in latency_records:
+        histogram['buckets'] = list(histogram['buckets'])
+        for quantile in [0.5, 0.9, 0.99]:
+            histogram[f'p{int(quantile * 100)}_seconds'] = _percentile(histogram, quantile)
+
+    return {
+        'stages': entries(stages),
+        'latencies': latency_records,
+        'counters': [{'labels': dict(labels_key), 'name': name, 'value': value}
+                     for (labels_key, name), value in counters.items()]
+    }
+
+
+def snapshot() -> dict:
+
+    """
+    Report of everything recorded so far, JSON-serializable.
+
+    Returns:
+        dict: 'stages', 'latencies' and 'counters', lists of records with their 'labels' and 'name'.
+    """
+    return _report(_STATE['stages'], _STATE['latencies'], _STATE['counters'])
+
+
+def merge_snapshots(snapshots: list) -> dict:
+
+    """
+    Combine reports (e.g. of the worker processes of one run): same labels and name are added up.
+
+    Parameters:
+        snapshots (list): Outputs of snapshot().
+
+    Returns:
+        dict: The combined report.
+    """
+    stages, latencies, counters = {}, {}, {}
+
+    for report in snapshots:
+        for record in report['stages']:
+            key = (tuple(sorted(record['labels'].items())), record['name'])
+            merged = stages.setdefault(key, {'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'peak_memory_mb': None})
+            merged['calls'] += record['calls']
+            merged['wall_seconds'] += record['wall_seconds']
+            merged['cpu_seconds'] += record['cpu_seconds']
+            if record['peak_memory_mb'] is not None:
+                merged['peak_memory_mb'] = max(merged['peak_memory_mb'] or 0.0, record['peak_memory_mb'])
+
+        for record in report['latencies']:
+            key = (tuple(sorted(record['labels'].items())), record['name'])
+            if key not in latencies:
+                latencies[key] = {'count': 0, 'total_seconds': 0.0, 'min_seconds': None, 'max_seconds': None,
+                                  'buckets': [0] * (len(BUCKET_EDGES) + 1)}
+            merged = latencies[key]
+            merged['count'] += record['count']
+            merged['total_seconds'] += record['total_seconds']
+            merged['min_seconds'] = min(
+                value for value in [merged['min_seconds'], record['min_seconds']] if value is not None
+            )
+            merged['max_seconds'] = max(
+                value for value in [merged['max_seconds'], record['max_seconds']] if value is not None
+            )
+            merged['buckets'] = [a + b for a, b in zip(merged['buckets'], record['buckets'])]
+
+        for record in report['counters']:
+            key = (tuple(sorted(record['labels'].items())), record['name'])
+            counters[key] = counters.get(key, 0) + record['value']
+
+    # Percentiles recomputed on the merged buckets
+    return _report(stages, latencies, counters)
+
+
+@contextmanager
+def session(trace_memory: bool = False, **session_labels):
+
+    """
+    Record a block in a fresh, enabled state, independent of (and restoring) the current one. The yielded
+    dict receives the report of the block under 'report' on exit. Used to instrument the tasks of the
+    formation pipeline in their worker processes.
+
+    Parameters:
+        trace_memory (bool): Record the peak traced memory of every stage. Default is False.
+        **session_labels: Labels of everything recorded in the block.
+    """
+    global _STATE
+    previous = _STATE
+    started_tracing = trace_memory and not tracemalloc.is_tracing()
+
+    _STATE = _new_state(enabled=True, trace_memory=trace_memory, labels=session_labels)
+    if started_tracing:
+        tracemalloc.start()
+
+    holder = {}
+    try:
+        yield holder
+    finally:
+        holder['report'] = snapshot()
+        if started_tracing:
+            tracemalloc.stop()
+        _STATE = previous
+
+
+def report_frames(report: dict = None) -> dict:
+
+    """
+    Reports as DataFrames, one column per label, e.g. to compare the methods per sector and period.
+
+    Parameters:
+        report (dict or None): Output of snapshot() or merge_snapshots(). Default is the current snapshot().
+
+    Returns:
+        dict: 'stages', 'latencies' (without the raw buckets) and 'counters' DataFrames.
+    """
+    report = snapshot() if report is None else report
+
+    def to_frame(records, drop=()):
+        rows = [
+            {**record['labels'], **{key: value for key, value in record.items() if key not in ('labels', *drop)}}
+            for record in records
+        ]
+        return pd.DataFrame(rows)
+
+    return {
+        'stages': to_frame(report['stages']),
+        'latencies': to_frame(report['latencies'], drop=('buckets',)),
+        'counters': to_frame(report['counters'])
+    }
+
+
+def write_report(path: str, report: dict = None, metadata: dict = None) -> str:
+
+    """
+    Write a report as JSON.
+
+    Parameters:
+        path (str): The JSON file.
+        report (dict or None): Output of snapshot() or merge_snapshots(). Default is the current snapshot().
+        metadata (dict or None): Extra information on the run (config, date, ...). Default is None.
+
+    Returns:
+        str: The path of the file.
+    """
+    report = snapshot() if report is None else report
+    with open(path, 'w') as file:
+        json.dump({'metadata': metadata or {}, 'bucket_edges_seconds': BUCKET_EDGES, **report}, file, indent=2)
+
+    return path
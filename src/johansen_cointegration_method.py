@@ -1,9 +1,13 @@
 from statsmodels.tsa.vector_ar.vecm import coint_johansen
+from statsmodels.tsa.coint_tables import c_sjt, c_sja
 import numpy as np
 import pandas as pd
 import more_itertools
 import itertools
+import handling_dataframe as hdf
+import instrumentation as inst
 
+@inst.timed('johansen.johansen_test')
 def johansen_test(df: pd.DataFrame) -> list:    
     
     # Create all combinations of stocks regardless of order of appearance 
@@ -19,7 +23,8 @@ def johansen_test(df: pd.DataFrame) -> list:
 
         # The second and third parameters indicate constant term, with a lag of 1.
         # See Chan, Algorithmic Trading, chapter 2.
-        result = coint_johansen(pair_closes, 0, 1)
+        with inst.latency('johansen.coint_johansen'):
+            result = coint_johansen(pair_closes, 0, 1)
 
         # the 90%, 95%, and 99% confidence levels for the trace statistic and maximum
         # eigenvalue statistic are stored in the first, second, and third column of
@@ -45,5 +50,214 @@ def johansen_test(df: pd.DataFrame) -> list:
             # Append the cointegrating pair as a list [sid_1, sid_2]
             cointegrating_pairs.append([sid_1, sid_2])
             cointegration_pairs.append([sid_1, sid_2])
+
+    inst.count('johansen.pairs_tested', len(all_pairs))
+    inst.count('johansen.pairs_passed', len(cointegration_pairs))
             
     return cointegration_pairs
+
+
+def _johansen_pair_features(df: pd.DataFrame) -> tuple:
+
+    # Per-stock series of coint_johansen(pair, 0, 1): with a constant term and one lagged
+    # difference every regression of the test works on demeaned versions of
+    #   D: the difference at t, Z: the lagged difference, L: the lagged level
+    X = df.to_numpy(dtype=float)
+
+    # Dates where every stock is missing are dropped, as the per-pair dropna of johansen_test does.
+    # Partly missing dates would give every pair its own sample, which the shared series cannot hold
+    missing = np.isnan(X)
+    X = X[~missing.all(axis=1)]
+
+    if missing.any(axis=1).sum() > missing.all(axis=1).sum():
+        raise ValueError("The price panel contains missing values, drop or fill them before the batched test")
+
+    dx = np.diff(X, axis=0)
+    D = dx[1:] - dx[1:].mean(axis=0)
+    Z = dx[:-1] - dx[:-1].mean(axis=0)
+    L = X[1:-1] - X[1:-1].mean(axis=0)
+
+    return D, Z, L
+
+
+def _johansen_panel_features(df: pd.DataFrame) -> dict:
+
+    # Per-stock series and own-stock moments shared by every pair of the panel
+    D, Z, L = _johansen_pair_features(df)
+
+    return {
+        'D': D,
+        'Z': Z,
+        'L': L,
+        'diagonals': {
+            'DD': np.einsum('ti,ti->i', D, D),
+            'ZZ': np.einsum('ti,ti->i', Z, Z),
+            'LL': np.einsum('ti,ti->i', L, L),
+            'DZ': np.einsum('ti,ti->i', D, Z),
+            'LZ': np.einsum('ti,ti->i', L, Z),
+            'LD': np.einsum('ti,ti->i', L, D)
+        }
+    }
+
+
+def _pair_moments(
+    A: np.ndarray,
+    B: np.ndarray,
+    diagonal: np.ndarray,
+    first: np.ndarray,
+    second: np.ndarray
+) -> np.ndarray:
+
+    # Stacked 2x2 cross-moment matrices [[A1'B1, A1'B2], [A2'B1, A2'B2]] of a block of pairs.
+    # The own-stock moments on the diagonal are computed once per stock
+    moments = np.empty((len(first), 2, 2))
+    moments[:, 0, 0] = diagonal[first]
+    moments[:, 1, 1] = diagonal[second]
+    moments[:, 0, 1] = np.einsum('ti,ti->i', A[:, first], B[:, second])
+    if A is B:
+        moments[:, 1, 0] = moments[:, 0, 1]
+    else:
+        moments[:, 1, 0] = np.einsum('ti,ti->i', A[:, second], B[:, first])
+
+    return moments
+
+
+def _johansen_eigenvalues_block(
+    D: np.ndarray,
+    Z: np.ndarray,
+    L: np.ndarray,
+    diagonals: dict,
+    first: np.ndarray,
+    second: np.ndarray
+) -> np.ndarray:
+
+    S_DD = _pair_moments(D, D, diagonals['DD'], first, second)
+    S_ZZ = _pair_moments(Z, Z, diagonals['ZZ'], first, second)
+    S_LL = _pair_moments(L, L, diagonals['LL'], first, second)
+    S_DZ = _pair_moments(D, Z, diagonals['DZ'], first, second)
+    S_LZ = _pair_moments(L, Z, diagonals['LZ'], first, second)
+    S_LD = _pair_moments(L, D, diagonals['LD'], first, second)
+
+    # Moments of the residuals after partialling out the lagged differences (Schur complements)
+    S_ZZ_inv = np.linalg.inv(S_ZZ)
+    S_ZD = S_DZ.transpose(0, 2, 1)
+    S_ZL = S_LZ.transpose(0, 2, 1)
+    S00 = S_DD - S_DZ @ S_ZZ_inv @ S_ZD
+    Skk = S_LL - S_LZ @ S_ZZ_inv @ S_ZL
+    Sk0 = S_LD - S_LZ @ S_ZZ_inv @ S_ZD
+
+    # Generalised eigenproblem det(Sk0 S00^-1 S0k - lambda Skk) = 0 is a quadratic for 2x2 matrices
+    A = Sk0 @ np.linalg.inv(S00) @ Sk0.transpose(0, 2, 1)
+    det_A = A[:, 0, 0] * A[:, 1, 1] - A[:, 0, 1] * A[:, 1, 0]
+    det_B = Skk[:, 0, 0] * Skk[:, 1, 1] - Skk[:, 0, 1] * Skk[:, 1, 0]
+    middle = A[:, 0, 0] * Skk[:, 1, 1] + A[:, 1, 1] * Skk[:, 0, 0] - A[:, 0, 1] * Skk[:, 1, 0] - A[:, 1, 0] * Skk[:, 0, 1]
+
+    discriminant = np.sqrt(np.maximum(middle ** 2 - 4 * det_A * det_B, 0.0))
+    eigenvalues = np.column_stack([
+        (middle + discriminant) / (2 * det_B),
+        (middle - discriminant) / (2 * det_B)
+    ])
+
+    return eigenvalues
+
+
+@inst.timed('johansen.johansen_statistics_batched')
+def johansen_statistics_batched(
+    df: pd.DataFrame,
+    block_size: int = 8192,
+    pairs: list = None,
+    feature_store: dict = None
+) -> tuple:
+
+    """
+    Bivariate Johansen test (constant term, one lagged difference) of every pair of columns at once,
+    equivalent to coint_johansen(df[[sid_1, sid_2]], 0, 1) for each pair in johansen_test. The residual
+    moment matrices of all pairs are built as stacked 2x2 arrays and the eigenvalues are solved in closed form.
+
+    Parameters:
+        df (pandas.DataFrame): Price panel with one column per stock, without missing values.
+        block_size (int): Number of pairs processed together.
+        pairs (list or None): Candidate pairs [stock_a, stock_b] to test. Default is every pair.
+        feature_store (dict or None): Output of pair_feature_store.build_feature_store. When given, its
+            precomputed series and tickers are used and df is ignored (may be None).
+
+    Returns:
+        tuple: lr1 (trace statistics) and lr2 (maximum eigenvalue statistics) of shape (n_pairs, 2) for the
+        hypotheses r <= 0 and r <= 1, the critical values cvt and cvm of shape (2, 3) for the 90%, 95% and
+        99% confidence levels (same layout as coint_johansen), and the list of tested pairs in itertools.combinations order.
+    """
+    if feature_store is None:
+        keys = df.columns.tolist()
+        features = _johansen_panel_features(df)
+    else:
+        keys = feature_store['tickers']
+        features = feature_store['johansen']
+
+    D, Z, L, diagonals = features['D'], features['Z'], features['L'], features['diagonals']
+    t = D.shape[0]
+
+    first_idx, second_idx = hdf.pairs_to_column_positions(keys, pairs)
+    eigenvalues = np.empty((len(first_idx), 2))
+
+    for start in range(0, len(first_idx), block_size):
+        first = first_idx[start:start + block_size]
+        second = second_idx[start:start + block_size]
+        with inst.latency('johansen.batched_pair', weight=len(first)):
+            eigenvalues[start:start + block_size] = _johansen_eigenvalues_block(D, Z, L, diagonals, first, second)
+
+    # Trace and maximum eigenvalue statistics for r <= 0 and r <= 1
+    log_complement = np.log(1 - eigenvalues)
+    lr1 = -t * np.column_stack([log_complement.sum(axis=1), log_complement[:, 1]])
+    lr2 = -t * log_complement
+
+    cvt = np.vstack([c_sjt(2, 0), c_sjt(1, 0)])
+    cvm = np.vstack([c_sja(2, 0), c_sja(1, 0)])
+
+    pairs = [(keys[i], keys[j]) for i, j in zip(first_idx, second_idx)]
+
+    return lr1, lr2, cvt, cvm, pairs
+
+
+@inst.timed('johansen.johansen_test_batched')
+def johansen_test_batched(
+    df: pd.DataFrame,
+    confidence_level: int = 95,
+    check_eigen: bool = False,
+    block_size: int = 8192,
+    pairs: list = None,
+    feature_store: dict = None
+) -> list:
+
+    """
+    Batched version of johansen_test: pairs whose trace statistic for r <= 0 exceeds the critical value.
+
+    Parameters:
+        df (pandas.DataFrame): Price panel with one column per stock, without missing values.
+        confidence_level (int): 90, 95 or 99. Default is 95, as in johansen_test.
+        check_eigen (bool): Also require the maximum eigenvalue statistic to exceed its critical value. Default is False.
+        block_size (int): Number of pairs processed together.
+        pairs (list or None): Candidate pairs [stock_a, stock_b] to test. Default is every pair.
+        feature_store (dict or None): Precomputed features (see johansen_statistics_batched). Default is None.
+
+    Returns:
+        list: The cointegrating pairs as [sid_1, sid_2] lists.
+    """
+    confidence_level_cols = {
+        90: 0,
+        95: 1,
+        99: 2
+    }
+    confidence_level_col = confidence_level_cols[confidence_level]
+
+    lr1, lr2, cvt, cvm, pairs = johansen_statistics_batched(
+        df, block_size=block_size, pairs=pairs, feature_store=feature_store
+    )
+
+    selected = lr1[:, 0] >= cvt[0, confidence_level_col]
+    if check_eigen:
+        selected &= lr2[:, 0] >= cvm[0, confidence_level_col]
+
+    inst.count('johansen.pairs_tested', len(pairs))
+    inst.count('johansen.pairs_passed', int(selected.sum()))
+
+    return [[sid_1, sid_2] for (sid_1, sid_2), keep in zip(pairs, selected) if keep]
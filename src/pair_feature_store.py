@@ -0,0 +1,100 @@
+import pandas as pd
+import numpy as np
+import data_transformation_snippets as data_transform_snp
+import engle_granger_cointegration_method as eg_coint
+import johansen_cointegration_method as jj_coint
+import gatev_distance_method as gatev_dist
+
+METHODS = ['engle_granger', 'johansen', 'gatev']
+
+
+def build_feature_store(
+    df: pd.DataFrame,
+    trend: str = 'c',
+    methods: list = None
+) -> dict:
+
+    """
+    Per-ticker features of one formation window, computed once and shared by every pair test:
+        - 'log_prices': natural log prices (df_natural_log_transformed), the input of the cointegration tests;
+        - 'engle_granger': log prices with the deterministic terms partialled out, their sums of squares
+          and total sums of squares (find_cointegrated_pairs_batched / _bidirectional);
+        - 'johansen': demeaned differences, lagged differences and lagged levels of the log prices with their
+          own-stock moments (johansen_statistics_batched / johansen_test_batched);
+        - 'gatev': cumulative returns (gatev_data_normalize) centered on each date and their squared norms
+          (gatev_squared_distances / gatev_smallest_pairs / gatev_distance_matrix).
+    Pass the store to those functions with feature_store=store.
+
+    Parameters:
+        df (pandas.DataFrame): Raw price panel of the window, one column per stock, without missing values.
+        trend (str): Deterministic terms of the Engle-Granger hedge regression. Default is 'c'.
+        methods (list or None): Subset of 'engle_granger', 'johansen' and 'gatev' to prepare. Default is all three.
+
+    Returns:
+        dict: The store: 'tickers', 'dates', 'log_prices' and one dict of arrays per prepared method.
+    """
+    methods = METHODS if methods is None else methods
+    unknown = set(methods) - set(METHODS)
+    if unknown:
+        raise ValueError(f"Unknown methods: {sorted(unknown)}")
+
+    df_log = data_transform_snp.df_natural_log_transformed(df)
+
+    store = {
+        'tickers': df.columns.tolist(),
+        'dates': df.index,
+        'log_prices': np.ascontiguousarray(df_log.to_numpy(dtype=float))
+    }
+
+    if 'engle_granger' in methods:
+        X_detrended, sum_squares, total_sum_squares = eg_coint._prepare_engle_granger_panel(df_log, trend)
+        store['engle_granger'] = {
+            'trend': trend,
+            'X_detrended': np.ascontiguousarray(X_detrended),
+            'sum_squares': sum_squares,
+            'total_sum_squares': total_sum_squares
+        }
+
+    if 'johansen' in methods:
+        features = jj_coint._johansen_panel_features(df_log)
+        for key in ['D', 'Z', 'L']:
+            features[key] = np.ascontiguousarray(features[key])
+        store['johansen'] = features
+
+    if 'gatev' in methods:
+        store['gatev'] = gatev_dist._gatev_features(gatev_dist.gatev_data_normalize(df, visualize=False))
+
+    return store
+
+
+def _store_arrays(store: dict, prefix: str = ''):
+
+    # (name, array) of every array held by the store, nested dicts flattened with dotted names
+    for key, value in store.items():
+        if isinstance(value, dict):
+            yield from _store_arrays(value, f'{prefix}{key}.')
+        elif isinstance(value, np.ndarray):
+            yield f'{prefix}{key}', value
+
+
+def feature_store_memory(store: dict) -> pd.DataFrame:
+
+    """
+    Memory footprint of a feature store.
+
+    Parameters:
+        store (dict): Output of build_feature_store.
+
+    Returns:
+        pandas.DataFrame: One row per array (feature, shape, dtype, MB) and a final Total row.
+    """
+    report = pd.DataFrame(
+        [
+            {'feature': name, 'shape': array.shape, 'dtype': str(array.dtype), 'MB': array.nbytes / 1024 ** 2}
+            for name, array in _store_arrays(store)
+        ],
+        columns=['feature', 'shape', 'dtype', 'MB']
+    )
+    total = pd.DataFrame([{'feature': 'Total', 'shape': None, 'dtype': None, 'MB': report['MB'].sum()}])
+
+    return pd.concat([report, total], ignore_index=True)
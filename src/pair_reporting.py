@@ -0,0 +1,314 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pair_result_formats as prf
+import instrumentation as inst
+
+# Reporting layer of the pair methods. matplotlib, seaborn and plotly are only imported inside the functions
+# below, so importing the compute modules (and this one) never loads the visualization stack.
+#     path=None    draws interactively (pyplot / fig.show()), as the notebooks do
+#     path=...     renders to a file without pyplot or a GUI backend (matplotlib Figure, plotly HTML)
+# Large universes are limited to the tickers of the significant (or closest) pairs before drawing.
+MAX_TICKERS = 50
+ANNOTATE_TICKERS = 30
+
+_EXECUTOR = None
+_FUTURES = []
+
+
+def _new_figure(path: str, figsize: tuple, ncols: int = 1) -> tuple:
+
+    # Interactive figures go through pyplot; file figures are plain Figure objects (no backend, no global state)
+    if path is None:
+        import matplotlib.pyplot as plt
+        fig, axes = plt.subplots(1, ncols, figsize=figsize)
+    else:
+        from matplotlib.figure import Figure
+        fig = Figure(figsize=figsize)
+        axes = fig.subplots(1, ncols)
+
+    return fig, np.atleast_1d(axes)
+
+
+def _finish_figure(fig, path: str, dpi: int = 100):
+
+    if path is None:
+        import matplotlib.pyplot as plt
+        plt.show()
+        return None
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    fig.savefig(path, dpi=dpi, bbox_inches='tight')
+
+    return path
+
+
+def _finish_plotly(fig, path: str):
+
+    if path is None:
+        fig.show()
+        return None
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    fig.write_html(path, include_plotlyjs='cdn')
+
+    return path
+
+
+def _to_dense(matrix, fill: float) -> np.ndarray:
+
+    # Dense view of a dense, condensed or sparse pair result (pair_result_formats)
+    if isinstance(matrix, dict) or np.ndim(matrix) == 1:
+        return prf.to_dense(matrix, fill=fill)
+
+    return np.asarray(matrix, dtype=float)
+
+
+def significant_tickers(
+    pvalue_matrices: list,
+    significance_level: float = 0.05,
+    max_tickers: int = MAX_TICKERS
+) -> np.ndarray:
+
+    """
+    Positions of the tickers to draw: every ticker when there are at most max_tickers, otherwise the tickers
+    of the significant pairs, ranked by their smallest p-value and truncated to max_tickers.
+
+    Parameters:
+        pvalue_matrices (list): Dense n x n p-value matrices (upper triangle holds the pairs).
+        significance_level (float): Significance level of the pairs. Default is 0.05.
+        max_tickers (int): Largest number of tickers drawn. Default is MAX_TICKERS.
+
+    Returns:
+        numpy.ndarray: The ticker positions, in their original order; empty when a large universe has no
+        significant pair.
+    """
+    n = pvalue_matrices[0].shape[0]
+    if n <= max_tickers:
+        return np.arange(n)
+
+    # Smallest p-value of every ticker over both legs and every matrix
+    best = np.ones(n)
+    for matrix in pvalue_matrices:
+        upper = np.triu(matrix, k=1) + np.tril(np.ones((n, n)))
+        best = np.minimum(best, np.minimum(upper.min(axis=1), upper.min(axis=0)))
+
+    candidates = np.flatnonzero(best < significance_level)
+    candidates = candidates[np.argsort(best[candidates], kind='stable')][:max_tickers]
+
+    return np.sort(candidates)
+
+
+@inst.timed('reporting.engle_granger_heatmaps')
+def engle_granger_heatmaps(
+    pvalue_matrices: list,
+    tickers: list,
+    titles: list,
+    significance_level: float = 0.05,
+    path: str = None,
+    max_tickers: int = MAX_TICKERS
+):
+
+    """
+    Engle-Granger p-value heatmaps side by side, non-significant entries masked
+    (find_cointegrated_pairs, find_cointegrated_pairs_swap, find_cointegrated_pairs_batched and
+    find_cointegrated_pairs_bidirectional). Large universes are limited to the tickers of the significant
+    pairs and only small heatmaps are annotated.
+
+    Parameters:
+        pvalue_matrices (list): p-value results in any format of pair_result_formats, one per heatmap.
+        tickers (list): Ticker names of the rows and columns.
+        titles (list): Title of every heatmap.
+        significance_level (float): Entries at or above this level are masked. Default is 0.05.
+        path (str or None): Image file to render to. Default is None (draw with pyplot).
+        max_tickers (int): Largest number of tickers drawn. Default is MAX_TICKERS.
+
+    Returns:
+        str or None: The path of the rendered file; None without drawing when a large universe has no
+        significant pair.
+    """
+    import seaborn as sns
+
+    matrices = [_to_dense(matrix, fill=1.0) for matrix in pvalue_matrices]
+    shown = significant_tickers(matrices, significance_level, max_tickers)
+    if len(shown) == 0:
+        return None
+
+    labels = [tickers[i] for i in shown]
+
+    fig, axes = _new_figure(path, figsize=(10 + 10 * len(matrices), 10), ncols=len(matrices))
+
+    for ax, matrix, title in zip(axes, matrices, titles):
+        matrix = matrix[np.ix_(shown, shown)]
+        sns.heatmap(
+            matrix,
+            xticklabels = labels,
+            yticklabels = labels,
+            cmap = 'RdYlGn_r',
+            mask = (matrix >= significance_level),
+            annot = len(shown) <= ANNOTATE_TICKERS,
+            ax = ax
+        )
+        ax.set_title(title, fontsize = 20)
+
+    return _finish_figure(fig, path)
+
+
+@inst.timed('reporting.distance_heatmap')
+def distance_heatmap(
+    dist_matrix,
+    tickers: list,
+    path: str = None,
+    max_tickers: int = MAX_TICKERS
+):
+
+    """
+    Gatev distance heatmap (gatev_distance_matrix). Large universes are limited to the tickers of the
+    closest pairs.
+
+    Parameters:
+        dist_matrix (numpy.ndarray or dict): Distances in any format of pair_result_formats.
+        tickers (list): Ticker names of the rows and columns.
+        path (str or None): HTML file to render to. Default is None (fig.show()).
+        max_tickers (int): Largest number of tickers drawn. Default is MAX_TICKERS.
+
+    Returns:
+        str or None: The path of the rendered file.
+    """
+    import plotly.express as px
+
+    dist_matrix = _to_dense(dist_matrix, fill=0.0)
+    n = len(tickers)
+    shown = np.arange(n)
+
+    if n > max_tickers:
+        # Tickers of the closest pairs first, until max_tickers distinct tickers are collected
+        row_idx, col_idx = np.triu_indices(n, k=1)
+        order = np.argsort(dist_matrix[row_idx, col_idx], kind='stable')
+        legs = np.column_stack([row_idx[order], col_idx[order]]).ravel()
+        _, first_seen = np.unique(legs, return_index=True)
+        shown = np.sort(legs[np.sort(first_seen)][:max_tickers])
+
+    labels = [tickers[i] for i in shown]
+
+    fig = px.imshow(dist_matrix[np.ix_(shown, shown)].round(1),
+                    labels=dict(x="Stock", y="Stock", color="Distance"),
+                    x=labels,
+                    y=labels,  color_continuous_scale='reds',
+                width=1000, height=600)
+    fig.update_xaxes(side="top")
+
+    return _finish_plotly(fig, path)
+
+
+@inst.timed('reporting.cumulative_returns_chart')
+def cumulative_returns_chart(
+    df_cum_returns_pct,
+    path: str = None,
+    max_points: int = None
+):
+
+    """
+    Line chart of the daily cumulative returns (gatev_data_normalize).
+
+    Parameters:
+        df_cum_returns_pct (pandas.DataFrame): Cumulative returns in percent, one column per stock.
+        path (str or None): HTML file to render to. Default is None (fig.show()).
+        max_points (int or None): Downsample every line to about this many dates, keeping the last one.
+            Default is None (every date).
+
+    Returns:
+        str or None: The path of the rendered file.
+    """
+    import plotly.express as px
+
+    if max_points is not None and len(df_cum_returns_pct) > max_points:
+        stride = int(np.ceil(len(df_cum_returns_pct) / max_points))
+        rows = np.unique(np.append(np.arange(0, len(df_cum_returns_pct), stride), len(df_cum_returns_pct) - 1))
+        df_cum_returns_pct = df_cum_returns_pct.iloc[rows]
+
+    fig = px.line(df_cum_returns_pct,
+          title='Performance - Daily Cumulative Returns',
+          width=1000, height=600,
+          )
+    fig.update_layout(yaxis_title="Daily Cumulative returns (%)")
+
+    return _finish_plotly(fig, path)
+
+
+@inst.timed('reporting.distribution_plots')
+def distribution_plots(df, path: str = None) -> list:
+
+    """
+    Histogram with KDE of every column (dist_stock_visualization).
+
+    Parameters:
+        df (pandas.DataFrame): The data, one column per stock.
+        path (str or None): Directory to render one image per column to. Default is None (draw with seaborn).
+
+    Returns:
+        list: The paths of the rendered files (empty when drawing interactively).
+    """
+    import seaborn as sns
+
+    if path is None:
+        for column in df.columns.tolist():
+            sns.displot(df[column], kde=True, color='purple')
+        return []
+
+    paths = []
+    for column in df.columns.tolist():
+        file_path = os.path.join(path, f'{column}.png')
+        fig, axes = _new_figure(file_path, figsize=(5, 5))
+        sns.histplot(df[column], kde=True, color='purple', ax=axes[0])
+        paths.append(_finish_figure(fig, file_path))
+
+    return paths
+
+
+def render_in_background(function, *args, **kwargs):
+
+    """
+    Run a file rendering function of this module on the reporting thread so that the computation can go on.
+    Renders are executed one at a time, in submission order. The arrays passed in must not be modified
+    until the render is done.
+
+    Parameters:
+        function (callable): e.g. engle_granger_heatmaps, called with path= set.
+        *args, **kwargs: Arguments of the function.
+
+    Returns:
+        concurrent.futures.Future: The future of the rendered path.
+    """
+    global _EXECUTOR
+
+    if kwargs.get('path') is None:
+        raise ValueError("Background rendering needs a path, interactive figures must be drawn on the main thread")
+
+    if _EXECUTOR is None:
+        _EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix='pair-reporting')
+
+    future = _EXECUTOR.submit(function, *args, **kwargs)
+    _FUTURES.append(future)
+
+    return future
+
+
+def wait_for_reports() -> list:
+
+    """
+    Wait for every render submitted with render_in_background and stop the reporting thread.
+
+    Returns:
+        list: The rendered paths, in submission order. Errors of the renders are raised here.
+    """
+    global _EXECUTOR
+
+    paths = [future.result() for future in _FUTURES]
+    _FUTURES.clear()
+
+    if _EXECUTOR is not None:
+        _EXECUTOR.shutdown()
+        _EXECUTOR = None
+
+    return paths
@@ -0,0 +1,437 @@
+import os
+import json
+import uuid
+import pickle
+import hashlib
+import contextlib
+import pandas as pd
+import numpy as np
+import handling_dataframe as hdf
+import engle_granger_cointegration_method as eg_coint
+import johansen_cointegration_method as jj_coint
+
+
+INDEX_FILE = 'index.json'
+LOCK_FILE = 'index.lock'
+
+
+@contextlib.contextmanager
+def _file_lock(path: str):
+
+    # Exclusive lock held on a lock file, so processes sharing a cache directory update the index one at a time
+    with open(path, 'a+b') as file:
+        if os.name == 'nt':
+            import msvcrt
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+
+def _replace_atomically(path: str, write) -> None:
+
+    # Write to a temporary file private to this process, then rename it over the target
+    tmp_path = f'{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp'
+    try:
+        with open(tmp_path, 'wb') as file:
+            write(file)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class PairResultCache:
+
+    """
+    Content-addressed on-disk cache for pair test results with a size cap and LRU eviction. Several
+    processes (e.g. pipeline workers) can share a cache directory: the index is only changed under a
+    file lock, re-read first and replaced atomically.
+
+    Two kinds of entries are stored:
+        - whole results, keyed by a hash of the price matrix (values, dates, tickers), the method and its parameters;
+        - per-pair segments, one per batch of newly computed pairs of a method and parameters, holding the
+          content hashes of the two legs and the values. A lookup only loads the segments containing its
+          tickers and a store only writes the new pairs, so a panel where only one ticker changed only
+          recomputes and writes the pairs involving that ticker.
+
+    Parameters:
+        cache_dir (str): Directory of the cache files (ignored by git under the default name).
+        max_bytes (int): Size cap of the cache directory. Least recently used entries are evicted beyond it.
+    """
+
+    def __init__(self, cache_dir: str = '.pair_result_cache', max_bytes: int = 2 * 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.pair_hits = 0
+        self.pair_misses = 0
+        self.evictions = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._index_path = os.path.join(cache_dir, INDEX_FILE)
+        self._lock_path = os.path.join(cache_dir, LOCK_FILE)
+
+    # Storage -----------------------------------------
+    def _read_index(self) -> dict:
+        try:
+            with open(self._index_path) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {'tick': 0, 'entries': {}}
+
+    @contextlib.contextmanager
+    def _update_index(self):
+        # Read-modify-write of the index under the lock
+        with _file_lock(self._lock_path):
+            index = self._read_index()
+            yield index
+            _replace_atomically(self._index_path, lambda file: file.write(json.dumps(index).encode()))
+
+    @staticmethod
+    def _touch(index: dict, name: str, **fields) -> None:
+        index['tick'] += 1
+        entry = index['entries'].setdefault(name, {'size': 0})
+        entry['tick'] = index['tick']
+        entry.update(fields)
+
+    def _load(self, name: str):
+        try:
+            with open(os.path.join(self.cache_dir, name), 'rb') as file:
+                value = pickle.load(file)
+        except FileNotFoundError:
+            return None
+
+        with self._update_index() as index:
+            if name not in index['entries']:
+                return None
+            self._touch(index, name)
+
+        return value
+
+    def _store(self, name: str, write, **fields) -> None:
+        path = os.path.join(self.cache_dir, name)
+        _replace_atomically(path, write)
+
+        with self._update_index() as index:
+            self._touch(index, name, size=os.path.getsize(path), **fields)
+            self._evict(index, keep=name)
+
+    def _evict(self, index: dict, keep: str = None) -> None:
+        # Drop least recently used entries until the cache fits under the size cap
+        entries = index['entries']
+        total = sum(entry['size'] for entry in entries.values())
+        for name in sorted(entries, key=lambda name: entries[name]['tick']):
+            if total <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            total -= entries[name]['size']
+            del entries[name]
+            self.evictions += 1
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                pass
+
+    # Whole results -----------------------------------------
+    def get(self, key: str):
+        value = self._load(f'result_{key}.pkl')
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        return value
+
+    def put(self, key: str, value) -> None:
+        self._store(
+            f'result_{key}.pkl', lambda file: pickle.dump(value, file, protocol=pickle.HIGHEST_PROTOCOL)
+        )
+
+    # Per-pair results -----------------------------------------
+    def get_pairs(
+        self,
+        store_key: str,
+        leg_a: np.ndarray,
+        leg_b: np.ndarray
+    ) -> tuple:
+
+        """
+        Look up pairs by the content hashes of their legs.
+
+        Parameters:
+            store_key (str): Identity of the method and parameters.
+            leg_a (numpy.ndarray): uint64 content hashes of the first legs.
+            leg_b (numpy.ndarray): uint64 content hashes of the second legs.
+
+        Returns:
+            tuple: Boolean array of the pairs found and the array of their stored values (NaN rows when missing).
+        """
+        # Segments of the method holding one of the requested legs, oldest first so newer values win
+        wanted = set(np.concatenate([leg_a, leg_b]).tolist())
+        with self._update_index() as index:
+            entries = index['entries']
+            names = sorted(
+                (name for name, entry in entries.items()
+                 if entry.get('store') == store_key and not wanted.isdisjoint(entry['legs'])),
+                key=lambda name: entries[name]['created']
+            )
+            for name in names:
+                self._touch(index, name)
+
+        segments = []
+        for name in names:
+            try:
+                with np.load(os.path.join(self.cache_dir, name)) as segment:
+                    segments.append({key: segment[key] for key in ['leg_a', 'leg_b', 'values']})
+            except FileNotFoundError:
+                continue
+
+        found = np.zeros(len(leg_a), dtype=bool)
+        values = None
+        if segments:
+            stored_index = pd.MultiIndex.from_arrays([
+                np.concatenate([segment['leg_a'] for segment in segments]),
+                np.concatenate([segment['leg_b'] for segment in segments])
+            ])
+            stored_values = np.vstack([segment['values'] for segment in segments])
+            latest = ~stored_index.duplicated(keep='last')
+
+            position = stored_index[latest].get_indexer(pd.MultiIndex.from_arrays([leg_a, leg_b]))
+            found = position >= 0
+            values = np.full((len(leg_a), stored_values.shape[1]), np.nan)
+            values[found] = stored_values[latest][position[found]]
+
+        self.pair_hits += int(found.sum())
+        self.pair_misses += int((~found).sum())
+
+        return found, values
+
+    def put_pairs(
+        self,
+        store_key: str,
+        leg_a: np.ndarray,
+        leg_b: np.ndarray,
+        values: np.ndarray
+    ) -> None:
+
+        # A new segment with the new pairs only; for the same pair the newest segment wins at lookup
+        if len(leg_a) == 0:
+            return
+
+        with self._update_index() as index:
+            index['created'] = index.get('created', 0) + 1
+            created = index['created']
+
+        self._store(
+            f'pairs_{store_key}_{uuid.uuid4().hex}.npz',
+            lambda file: np.savez(file, leg_a=leg_a, leg_b=leg_b, values=values),
+            store=store_key,
+            created=created,
+            legs=sorted(set(np.concatenate([leg_a, leg_b]).tolist()))
+        )
+
+    def statistics(self) -> dict:
+        entries = self._read_index()['entries']
+
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'pair_hits': self.pair_hits,
+            'pair_misses': self.pair_misses,
+            'evictions': self.evictions,
+            'entries': len(entries),
+            'bytes': sum(entry['size'] for entry in entries.values())
+        }
+
+    def clear(self) -> None:
+        with self._update_index() as index:
+            for name in list(index['entries']):
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:
+                    pass
+            index['entries'] = {}
+
+
+def _column_fingerprints(df: pd.DataFrame) -> np.ndarray:
+
+    # uint64 content hash of every column: its values together with the dates they belong to
+    index_digest = hashlib.blake2b(
+        pd.util.hash_pandas_object(df.index, index=False).to_numpy().tobytes(), digest_size=16
+    ).digest()
+    X = np.asfortranarray(df.to_numpy(dtype=float))
+
+    return np.array([
+        int.from_bytes(hashlib.blake2b(index_digest + X[:, i].tobytes(), digest_size=8).digest(), 'little')
+        for i in range(X.shape[1])
+    ], dtype=np.uint64)
+
+
+def _key(*parts) -> str:
+    return hashlib.blake2b(json.dumps(parts, sort_keys=True, default=str).encode(), digest_size=16).hexdigest()
+
+
+def _cached_pair_values(
+    df: pd.DataFrame,
+    cache: PairResultCache,
+    method: str,
+    params: dict,
+    compute
+) -> tuple:
+
+    # Per-pair values of every pair (i < j) of df: stored pairs are read, only the others are computed
+    fingerprints = _column_fingerprints(df)
+    rows, cols = np.triu_indices(df.shape[1], k=1)
+    store_key = _key(method, params)
+
+    found, values = cache.get_pairs(store_key, fingerprints[rows], fingerprints[cols])
+
+    if not found.all():
+        keys = df.columns.tolist()
+        missing_pairs = [[keys[i], keys[j]] for i, j in zip(rows[~found], cols[~found])]
+        computed = compute(df, missing_pairs)
+        if values is None:
+            values = np.full((len(rows), computed.shape[1]), np.nan)
+        values[~found] = computed
+        cache.put_pairs(store_key, fingerprints[rows][~found], fingerprints[cols][~found], computed)
+
+    return rows, cols, values
+
+
+def cached_find_cointegrated_pairs(
+    df: pd.DataFrame,
+    cache: PairResultCache,
+    significance_level: float = 0.05,
+    trend: str = 'c',
+    maxlag: int = None,
+    autolag: str = 'aic'
+) -> tuple:
+
+    """
+    find_cointegrated_pairs_batched with the result cache: a whole-result hit returns immediately,
+    otherwise only the pairs missing from the per-pair store are tested.
+
+    Parameters:
+        df (pandas.DataFrame): Price panel with one column per stock, without missing values.
+        cache (PairResultCache): The cache.
+        significance_level (float): Pairs with a p-value below this level are returned. Default is 0.05.
+        trend (str): Deterministic terms of the hedge regression. Default is 'c'.
+        maxlag (int or None): Maximum lag of the residual ADF regression. Default is coint's rule.
+        autolag (str or None): Lag selection of the residual ADF regression. Default is 'aic'.
+
+    Returns:
+        tuple: score_matrix, pvalue_matrix and the list of cointegrated pairs.
+    """
+    params = {'trend': trend, 'maxlag': maxlag, 'autolag': autolag}
+    result_key = _key(
+        'engle_granger', params, significance_level, df.columns.tolist(), _column_fingerprints(df).tolist()
+    )
+    result = cache.get(result_key)
+    if result is not None:
+        return result
+
+    def compute(df_missing, missing_pairs):
+        score_matrix, pvalue_matrix, _ = eg_coint.find_cointegrated_pairs_batched(
+            df_missing, pairs=missing_pairs, visualize=False, **params
+        )
+        i, j = hdf.pairs_to_column_positions(df_missing.columns.tolist(), missing_pairs)
+        return np.column_stack([score_matrix[i, j], pvalue_matrix[i, j]])
+
+    rows, cols, values = _cached_pair_values(df, cache, 'engle_granger', params, compute)
+
+    n = df.shape[1]
+    keys = df.keys()
+    score_matrix = np.zeros((n, n))
+    pvalue_matrix = np.ones((n, n))
+    score_matrix[rows, cols] = values[:, 0]
+    pvalue_matrix[rows, cols] = values[:, 1]
+
+    selected = values[:, 1] < significance_level
+    pairs = [[keys[i], keys[j]] for i, j in zip(rows[selected], cols[selected])]
+
+    result = (score_matrix, pvalue_matrix, pairs)
+    cache.put(result_key, result)
+
+    return result
+
+
+def cached_johansen_statistics(
+    df: pd.DataFrame,
+    cache: PairResultCache
+) -> tuple:
+
+    """
+    johansen_statistics_batched with the result cache.
+
+    Parameters:
+        df (pandas.DataFrame): Price panel with one column per stock, without missing values.
+        cache (PairResultCache): The cache.
+
+    Returns:
+        tuple: lr1, lr2, cvt, cvm and the list of pairs, as johansen_statistics_batched.
+    """
+    result_key = _key('johansen', {}, df.columns.tolist(), _column_fingerprints(df).tolist())
+    result = cache.get(result_key)
+    if result is not None:
+        return result
+
+    def compute(df_missing, missing_pairs):
+        lr1, lr2, _, _, _ = jj_coint.johansen_statistics_batched(df_missing, pairs=missing_pairs)
+        return np.hstack([lr1, lr2])
+
+    rows, cols, values = _cached_pair_values(df, cache, 'johansen', {}, compute)
+
+    keys = df.columns.tolist()
+    cvt = np.vstack([jj_coint.c_sjt(2, 0), jj_coint.c_sjt(1, 0)])
+    cvm = np.vstack([jj_coint.c_sja(2, 0), jj_coint.c_sja(1, 0)])
+    result = (values[:, :2], values[:, 2:], cvt, cvm, [(keys[i], keys[j]) for i, j in zip(rows, cols)])
+    cache.put(result_key, result)
+
+    return result
+
+
+def cached_gatev_squared_distances(
+    df: pd.DataFrame,
+    cache: PairResultCache
+) -> tuple:
+
+    """
+    Squared Gatev distances of every pair with the result cache, same contract as gatev_squared_distances.
+    Missing pairs are computed directly from their two legs.
+
+    Parameters:
+        df (pandas.DataFrame): Normalized prices (e.g. output of gatev_data_normalize), without missing values.
+        cache (PairResultCache): The cache.
+
+    Returns:
+        tuple: The condensed squared distances and the index arrays i and j.
+    """
+    result_key = _key('gatev', {}, df.columns.tolist(), _column_fingerprints(df).tolist())
+    result = cache.get(result_key)
+    if result is not None:
+        return result
+
+    def compute(df_missing, missing_pairs):
+        X = df_missing.to_numpy(dtype=float)
+        i, j = hdf.pairs_to_column_positions(df_missing.columns.tolist(), missing_pairs)
+        return np.einsum('ti,ti->i', X[:, i] - X[:, j], X[:, i] - X[:, j])[:, None]
+
+    rows, cols, values = _cached_pair_values(df, cache, 'gatev', {}, compute)
+
+    result = (values[:, 0], rows, cols)
+    cache.put(result_key, result)
+
+    return result
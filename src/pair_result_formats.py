@@ -0,0 +1,161 @@
+import numpy as np
+
+# Pair results of n stocks only have n(n-1)/2 meaningful entries, the upper triangle (i < j).
+# Besides the dense n x n matrices, results can be kept as:
+#     condensed: a float32 array of length n(n-1)/2, pair (i, j) at k = i*n - i*(i+1)/2 + (j-i-1),
+#                the row-major upper triangle (same layout as scipy's pdist)
+#     sparse:    a dict with the kept pairs only: 'n', 'rows', 'cols', 'values' and the 'fill' of the other entries
+OUTPUTS = ['dense', 'condensed', 'sparse']
+
+
+def n_from_condensed(length: int) -> int:
+
+    # Number of stocks n of a condensed array of length n(n-1)/2
+    n = int(round((1 + np.sqrt(1 + 8 * length)) / 2))
+    if n * (n - 1) // 2 != length:
+        raise ValueError("The length is not n(n-1)/2 for any n")
+
+    return n
+
+
+def condensed_index(i, j, n: int) -> np.ndarray:
+
+    """
+    Position of the pairs (i, j), i < j, in a condensed array of n stocks.
+
+    Parameters:
+        i (array-like): First legs.
+        j (array-like): Second legs, j > i.
+        n (int): The number of stocks.
+
+    Returns:
+        numpy.ndarray: The condensed positions.
+    """
+    i = np.asarray(i, dtype=np.int64)
+    j = np.asarray(j, dtype=np.int64)
+
+    return i * n - i * (i + 1) // 2 + (j - i - 1)
+
+
+def condensed_pair_positions(k, n: int) -> tuple:
+
+    """
+    Inverse of condensed_index: the legs (i, j) of condensed positions k.
+
+    Parameters:
+        k (array-like): Condensed positions.
+        n (int): The number of stocks.
+
+    Returns:
+        tuple: The arrays i and j.
+    """
+    k = np.asarray(k, dtype=np.int64)
+
+    # Row i starts at s(i) = i*n - i*(i+1)/2; solve s(i) <= k for the largest i, then fix rounding
+    i = np.floor((2 * n - 1 - np.sqrt((2 * n - 1) ** 2 - 8 * k)) / 2).astype(np.int64)
+    i -= condensed_index(i, i + 1, n) > k
+    i += condensed_index(i + 1, i + 2, n) <= k
+    j = k - condensed_index(i, i + 1, n) + i + 1
+
+    return i, j
+
+
+def format_pair_values(
+    values: np.ndarray,
+    row_idx: np.ndarray,
+    col_idx: np.ndarray,
+    n: int,
+    fill: float,
+    output: str = 'dense',
+    keep: np.ndarray = None
+):
+
+    """
+    Arrange per-pair values in one of the result formats.
+
+    Parameters:
+        values (numpy.ndarray): Values of the pairs (row_idx, col_idx), i < j.
+        row_idx (numpy.ndarray): First legs.
+        col_idx (numpy.ndarray): Second legs.
+        n (int): The number of stocks.
+        fill (float): Value of the entries without a result (e.g. 0 for scores, 1 for p-values).
+        output (str): 'dense' (n x n float64 matrix), 'condensed' (float32) or 'sparse'. Default is 'dense'.
+        keep (numpy.ndarray or None): Boolean mask of the pairs kept by the sparse format. Default is every pair.
+
+    Returns:
+        numpy.ndarray or dict: The result in the requested format.
+    """
+    if output == 'dense':
+        matrix = np.full((n, n), fill, dtype=float)
+        matrix[row_idx, col_idx] = values
+        return matrix
+
+    if output == 'condensed':
+        condensed = np.full(n * (n - 1) // 2, fill, dtype=np.float32)
+        condensed[condensed_index(row_idx, col_idx, n)] = values
+        return condensed
+
+    if output == 'sparse':
+        if keep is None:
+            keep = np.ones(len(values), dtype=bool)
+        return {
+            'n': n,
+            'rows': np.asarray(row_idx)[keep].astype(np.int32),
+            'cols': np.asarray(col_idx)[keep].astype(np.int32),
+            'values': np.asarray(values)[keep].astype(np.float32),
+            'fill': fill
+        }
+
+    raise ValueError(f"output must be one of {OUTPUTS}")
+
+
+def to_dense(result, fill: float = None) -> np.ndarray:
+
+    """
+    Dense n x n float64 matrix of a condensed or sparse result, on demand. The upper triangle holds the pairs,
+    the diagonal and lower triangle hold fill, as in the matrices of the original pair functions.
+
+    Parameters:
+        result (numpy.ndarray or dict): A condensed array or a sparse dict.
+        fill (float or None): Value outside the upper triangle (e.g. 1 for p-values, 0 for scores and distances).
+            Default is the sparse fill; required for condensed arrays, which do not carry one.
+
+    Returns:
+        numpy.ndarray: The dense matrix.
+    """
+    if isinstance(result, dict):
+        n = result['n']
+        matrix = np.full((n, n), result['fill'] if fill is None else fill, dtype=float)
+        if fill is not None:
+            matrix[np.triu_indices(n, k=1)] = result['fill']
+        matrix[result['rows'], result['cols']] = result['values']
+        return matrix
+
+    if fill is None:
+        raise ValueError("fill is required for condensed results (e.g. 1 for p-values, 0 for scores)")
+
+    n = n_from_condensed(len(result))
+    matrix = np.full((n, n), fill, dtype=float)
+    matrix[np.triu_indices(n, k=1)] = result
+
+    return matrix
+
+
+def to_sparse(condensed: np.ndarray, keep: np.ndarray, fill: float = 0.0) -> dict:
+
+    """
+    Sparse form of a condensed result keeping only the masked pairs (e.g. pvalue < 0.05).
+
+    Parameters:
+        condensed (numpy.ndarray): The condensed values.
+        keep (numpy.ndarray): Boolean mask over the condensed positions.
+        fill (float): Value of the dropped entries. Default is 0.
+
+    Returns:
+        dict: The sparse result.
+    """
+    n = n_from_condensed(len(condensed))
+    k = np.flatnonzero(keep)
+    rows, cols = condensed_pair_positions(k, n)
+
+    return format_pair_values(condensed[k], rows, cols, n, fill, output='sparse')
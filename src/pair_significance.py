@@ -0,0 +1,332 @@
+import time
+import warnings
+import numpy as np
+import pandas as pd
+import handling_dataframe as hdf
+import pair_result_formats as prf
+import engle_granger_cointegration_method as eg_coint
+import johansen_cointegration_method as jj_coint
+import instrumentation as inst
+
+# Selection over the whole pair grid instead of a fixed per-pair threshold:
+#     adjust_pvalues / correct_pair_pvalues   family-wise (Bonferroni, Holm) and false discovery rate
+#                                             (Benjamini-Hochberg, Benjamini-Yekutieli) corrections
+#     bootstrap_pair_pvalues                  bootstrap p-values of the Engle-Granger and Johansen statistics,
+#                                             every candidate pair tested on the same resampled panel at once
+CORRECTIONS = ['bonferroni', 'holm', 'fdr_bh', 'fdr_by']
+
+
+def adjust_pvalues(pvalues, method: str = 'fdr_bh', n_tests: int = None) -> np.ndarray:
+
+    """
+    Adjusted p-values of a family of tests (same values as statsmodels' multipletests), vectorized over
+    the whole family with one sort. NaN p-values are left out of the family and stay NaN.
+
+    Parameters:
+        pvalues (array-like): The raw p-values.
+        method (str): 'bonferroni', 'holm' (family-wise error rate), 'fdr_bh' (Benjamini-Hochberg) or
+            'fdr_by' (Benjamini-Yekutieli, any dependence) false discovery rate. Default is 'fdr_bh'.
+        n_tests (int or None): Size of the family when only its smallest p-values are given (e.g. the pairs
+            kept by a sparse result); the missing tests count as p-values of 1. Default is the number of p-values.
+
+    Returns:
+        numpy.ndarray: The adjusted p-values, same shape as pvalues.
+    """
+    if method not in CORRECTIONS:
+        raise ValueError(f"method must be one of {CORRECTIONS}")
+
+    pvalues = np.asarray(pvalues, dtype=float)
+    adjusted = np.full(pvalues.shape, np.nan)
+    valid = ~np.isnan(pvalues)
+    p = pvalues[valid]
+
+    m = len(p) if n_tests is None else n_tests
+    if n_tests is not None and n_tests < len(p):
+        raise ValueError("n_tests is smaller than the number of p-values")
+    if len(p) == 0:
+        return adjusted
+
+    order = np.argsort(p, kind='stable')
+    ranks = np.arange(1, len(p) + 1)
+    sorted_p = p[order]
+
+    if method == 'bonferroni':
+        sorted_adjusted = sorted_p * m
+    elif method == 'holm':
+        # Step-down: running maximum of (m - k + 1) p_(k)
+        sorted_adjusted = np.maximum.accumulate((m - ranks + 1) * sorted_p)
+    else:
+        # Step-up: running minimum from the largest p-value of m / k p_(k); the missing tests (p = 1) cap it at 1
+        scale = 1.0 if method == 'fdr_bh' else np.sum(1.0 / np.arange(1, m + 1))
+        sorted_adjusted = np.minimum.accumulate((sorted_p * m * scale / ranks)[::-1])[::-1]
+        if len(p) < m:
+            sorted_adjusted = np.minimum(sorted_adjusted, scale)
+
+    values = np.empty(len(p))
+    values[order] = np.minimum(sorted_adjusted, 1.0)
+    adjusted[valid] = values
+
+    return adjusted
+
+
+def correct_pair_pvalues(
+    pvalue_result,
+    tickers: list,
+    alpha: float = 0.05,
+    method: str = 'fdr_bh',
+    pairs: list = None
+) -> dict:
+
+    """
+    Correct the p-value grid of a pair test (e.g. the pvalue_matrix of find_cointegrated_pairs or of the
+    batched functions) for the number of pairs tested, and select the pairs still significant.
+
+    Parameters:
+        pvalue_result (numpy.ndarray or dict): p-values in any format of pair_result_formats: dense n x n
+            (upper triangle), condensed, or sparse (the kept pairs are taken as the smallest p-values of
+            the tested pairs; exact for the selection when alpha is at most the sparse cut-off).
+        tickers (list): The tickers of the rows and columns.
+        alpha (float): Level of the corrected selection (FWER or FDR). Default is 0.05.
+        method (str): One of CORRECTIONS. Default is 'fdr_bh'.
+        pairs (list or None): The tested pairs, when only some pairs were tested (pairs argument of the
+            batched functions). Default is every pair.
+
+    Returns:
+        dict: 'adjusted' (the adjusted p-values, same format as pvalue_result, untested entries keep their
+        fill) and 'pairs' (the selected pairs [stock_a, stock_b] in pair order).
+    """
+    n = len(tickers)
+    tested_rows, tested_cols = hdf.pairs_to_column_positions(tickers, pairs)
+
+    if isinstance(pvalue_result, dict):
+        adjusted = adjust_pvalues(pvalue_result['values'], method=method, n_tests=len(tested_rows))
+        row_idx, col_idx = pvalue_result['rows'], pvalue_result['cols']
+        order = np.lexsort((col_idx, row_idx))
+        selected = order[adjusted[order] <= alpha]
+        result = {**pvalue_result, 'values': adjusted.astype(np.float32)}
+        return {
+            'adjusted': result,
+            'pairs': [[tickers[row_idx[k]], tickers[col_idx[k]]] for k in selected]
+        }
+
+    row_idx, col_idx = tested_rows, tested_cols
+
+    if np.ndim(pvalue_result) == 1:
+        positions = prf.condensed_index(row_idx, col_idx, n)
+        adjusted = np.array(pvalue_result, dtype=np.float32, copy=True)
+        values = adjust_pvalues(adjusted[positions].astype(float), method=method)
+        adjusted[positions] = values
+    else:
+        adjusted = np.array(pvalue_result, dtype=float, copy=True)
+        values = adjust_pvalues(adjusted[row_idx, col_idx], method=method)
+        adjusted[row_idx, col_idx] = values
+
+    selected = values <= alpha
+
+    return {
+        'adjusted': adjusted,
+        'pairs': [[tickers[i], tickers[j]] for i, j in zip(row_idx[selected], col_idx[selected])]
+    }
+
+
+def _engle_granger_statistics(X: np.ndarray, row_idx, col_idx, trend: str, maxlag: int, block_size: int):
+
+    # Residual ADF statistics of coint(S1, S2) with a fixed lag, every pair of the panel X at once
+    X_detrended, sum_squares, total_sum_squares = eg_coint._prepare_engle_granger_panel(pd.DataFrame(X), trend)
+    scores = np.empty(len(row_idx))
+
+    for start in range(0, len(row_idx), block_size):
+        block = slice(start, start + block_size)
+        scores[block] = eg_coint._engle_granger_block(
+            X_detrended, sum_squares, total_sum_squares, row_idx[block], col_idx[block],
+            trend=trend, maxlag=maxlag, autolag=None
+        )[0]
+
+    return scores
+
+
+def _johansen_trace_statistics(X: np.ndarray, row_idx, col_idx, block_size: int):
+
+    # Trace statistic for r <= 0 of coint_johansen(pair, 0, 1), every pair of the panel X at once
+    features = jj_coint._johansen_panel_features(pd.DataFrame(X))
+    t = features['D'].shape[0]
+    trace = np.empty(len(row_idx))
+
+    for start in range(0, len(row_idx), block_size):
+        block = slice(start, start + block_size)
+        eigenvalues = jj_coint._johansen_eigenvalues_block(
+            features['D'], features['Z'], features['L'], features['diagonals'], row_idx[block], col_idx[block]
+        )
+        trace[block] = -t * np.log(1 - eigenvalues).sum(axis=1)
+
+    return trace
+
+
+def _resampled_rows(rng: np.random.Generator, n_rows: int, block_length: int) -> np.ndarray:
+
+    # Moving-block bootstrap of row positions (iid rows with block_length=1)
+    n_blocks = -(-n_rows // block_length)
+    starts = rng.integers(0, n_rows - block_length + 1, n_blocks)
+
+    return (starts[:, None] + np.arange(block_length)).ravel()[:n_rows]
+
+
+@inst.timed('significance.bootstrap_pair_pvalues')
+def bootstrap_pair_pvalues(
+    df: pd.DataFrame,
+    pairs: list = None,
+    methods: list = None,
+    n_boot: int = 199,
+    block_length: int = 1,
+    trend: str = 'c',
+    maxlag: int = 1,
+    seed: int = 0,
+    max_seconds: float = None,
+    block_size: int = 8192,
+    pooled: bool = True
+) -> pd.DataFrame:
+
+    """
+    Bootstrap p-values of the Engle-Granger (residual ADF statistic of coint(S1, S2) with a fixed lag) and
+    Johansen (trace statistic for r <= 0) tests under the null of no cointegration. Each replicate resamples
+    the rows of the panel's demeaned differences (blocks of block_length rows, the same rows for every stock so the
+    cross-sectional dependence is kept) and cumulates them into random walks from the first prices; the
+    statistics of every candidate pair are then computed on that panel in one batched pass. The p-value of
+    a pair is (1 + null statistics at least as extreme) / (1 + null statistics), the null statistics being
+    those of every pair in every replicate (pooled, resolution 1 / (n_boot * n_pairs), so that the p-values
+    can survive a correction over many pairs) or those of the pair itself (resolution 1 / n_boot).
+
+    Parameters:
+        df (pandas.DataFrame): Log price panel (as for find_cointegrated_pairs), without missing values.
+        pairs (list or None): Candidate pairs [stock_a, stock_b], tested as coint(stock_a, stock_b) with the
+            stocks in column order. Default is every pair.
+        methods (list or None): 'engle_granger' and/or 'johansen'. Default is both.
+        n_boot (int): Number of replicates. Default is 199.
+        block_length (int): Length of the resampled row blocks (1 for an iid bootstrap of the differences).
+        trend (str): Deterministic terms of the Engle-Granger regression. Default is 'c'.
+        maxlag (int): Fixed lag of the residual ADF regressions, so every replicate costs the same. Default is 1.
+        seed (int): Seed of the resampling; runs with the same seed and n_boot are identical. Default is 0.
+        max_seconds (float or None): Time budget of the replicates. The number of replicates is sized from the
+            time of the first one (at least one always runs, at most n_boot) and the p-values use the replicates
+            done (attrs['n_boot']). That number depends on the machine load, so the p-values are only
+            reproducible when max_seconds is None. Default is None (all replicates).
+        block_size (int): Number of pairs whose statistics are computed together.
+        pooled (bool): Compare every pair with the null statistics of all pairs (the null distributions of the
+            pairs are the same: Dickey-Fuller for the fixed-lag residual ADF, Johansen trace for r <= 0). Keeps
+            n_boot * n_pairs statistics per method in memory. Default is True.
+
+    Returns:
+        pandas.DataFrame: One row per pair (Stock A, Stock B), with the EG Statistic and EG Bootstrap P-Value
+        and/or the Johansen Trace and Johansen Bootstrap P-Value; attrs['n_boot'] is the number of replicates
+        and attrs['min_pvalue'] the smallest p-value the replicates can give.
+    """
+    methods = ['engle_granger', 'johansen'] if methods is None else methods
+    unknown = set(methods) - {'engle_granger', 'johansen'}
+    if unknown:
+        raise ValueError(f"Unknown methods: {sorted(unknown)}")
+    if block_length < 1 or n_boot < 1:
+        raise ValueError("block_length and n_boot must be positive")
+
+    keys = df.columns.tolist()
+    X = df.to_numpy(dtype=float)
+    if np.isnan(X).any():
+        raise ValueError("The price panel contains missing values, drop or fill them first")
+
+    row_idx, col_idx = hdf.pairs_to_column_positions(keys, pairs)
+    statistics = {}
+    if 'engle_granger' in methods:
+        statistics['engle_granger'] = _engle_granger_statistics(X, row_idx, col_idx, trend, maxlag, block_size)
+    if 'johansen' in methods:
+        statistics['johansen'] = _johansen_trace_statistics(X, row_idx, col_idx, block_size)
+
+    null_statistics = {method: [] for method in methods}
+    differences = np.diff(X, axis=0)
+    # Demeaned so that the null random walks have no drift
+    differences -= differences.mean(axis=0)
+    rng = np.random.default_rng(seed)
+    n_target = n_boot
+    done = 0
+
+    while done < n_target:
+        start_time = time.perf_counter()
+        rows = _resampled_rows(rng, len(differences), block_length)
+        X_null = np.vstack([X[:1], X[:1] + np.cumsum(differences[rows], axis=0)])
+
+        if 'engle_granger' in methods:
+            null_statistics['engle_granger'].append(
+                _engle_granger_statistics(X_null, row_idx, col_idx, trend, maxlag, block_size)
+            )
+        if 'johansen' in methods:
+            null_statistics['johansen'].append(_johansen_trace_statistics(X_null, row_idx, col_idx, block_size))
+
+        done += 1
+        if done == 1 and max_seconds is not None:
+            # Replicates all cost the same: size the run from the first one. The replicates are drawn in
+            # order from the seeded generator, so the result equals a run with n_boot=attrs['n_boot']
+            elapsed = time.perf_counter() - start_time
+            n_target = max(1, min(n_boot, int(max_seconds / elapsed) if elapsed > 0 else n_boot))
+
+    # Null statistics at least as extreme: lower ADF statistics, higher trace statistics
+    pvalues = {}
+    for method in methods:
+        null = np.vstack(null_statistics.pop(method))
+        if pooled:
+            null = np.sort(null, axis=None)
+            if method == 'engle_granger':
+                extreme = np.searchsorted(null, statistics[method], side='right')
+            else:
+                extreme = len(null) - np.searchsorted(null, statistics[method], side='left')
+            pvalues[method] = (1 + extreme) / (1 + len(null))
+        else:
+            if method == 'engle_granger':
+                extreme = (null <= statistics[method]).sum(axis=0)
+            else:
+                extreme = (null >= statistics[method]).sum(axis=0)
+            pvalues[method] = (1 + extreme) / (1 + done)
+
+    df_pvalues = pd.DataFrame({
+        'Stock A': [keys[i] for i in row_idx],
+        'Stock B': [keys[j] for j in col_idx]
+    })
+    if 'engle_granger' in methods:
+        df_pvalues['EG Statistic'] = statistics['engle_granger']
+        df_pvalues['EG Bootstrap P-Value'] = pvalues['engle_granger']
+    if 'johansen' in methods:
+        df_pvalues['Johansen Trace'] = statistics['johansen']
+        df_pvalues['Johansen Bootstrap P-Value'] = pvalues['johansen']
+    df_pvalues.attrs['n_boot'] = done
+    df_pvalues.attrs['min_pvalue'] = 1 / (1 + done * (len(row_idx) if pooled else 1))
+
+    return df_pvalues
+
+
+def select_significant_pairs(
+    df_pvalues: pd.DataFrame,
+    column: str,
+    alpha: float = 0.05,
+    method: str = 'fdr_bh'
+) -> list:
+
+    """
+    Pairs of a p-value table (e.g. bootstrap_pair_pvalues) significant after the correction of the column.
+    Warns when the bootstrap resolution (attrs['min_pvalue']) is too coarse for any pair to pass.
+
+    Parameters:
+        df_pvalues (pandas.DataFrame): Table with Stock A, Stock B and the p-value column.
+        column (str): The p-value column, e.g. 'EG Bootstrap P-Value'.
+        alpha (float): Level of the corrected selection. Default is 0.05.
+        method (str): One of CORRECTIONS. Default is 'fdr_bh'.
+
+    Returns:
+        list: The selected pairs [stock_a, stock_b].
+    """
+    min_pvalue = df_pvalues.attrs.get('min_pvalue')
+    if min_pvalue is not None and min_pvalue * len(df_pvalues) > alpha:
+        warnings.warn(
+            f"With {len(df_pvalues)} pairs the smallest bootstrap p-value {min_pvalue:.2g} cannot pass a "
+            f"Bonferroni correction at {alpha}; use pooled=True or more replicates"
+        )
+
+    selected = adjust_pvalues(df_pvalues[column].to_numpy(), method=method) <= alpha
+
+    return df_pvalues.loc[selected, ['Stock A', 'Stock B']].values.tolist()
@@ -0,0 +1,172 @@
+import pandas as pd
+import numpy as np
+
+
+def _pair_legs(pairs, columns: list) -> tuple:
+
+    # Column positions of the two legs, pairs given as a list of [stock_a, stock_b]
+    # or as a summary table with 'Stock A' and 'Stock B' (pairs_formation_result_summary)
+    if isinstance(pairs, pd.DataFrame):
+        pairs = pairs[['Stock A', 'Stock B']].values.tolist()
+
+    position = {column: i for i, column in enumerate(columns)}
+    missing = sorted({stock for pair in pairs for stock in pair if stock not in position})
+    if missing:
+        raise KeyError(f"Stocks not in the price panel: {missing}")
+
+    first = np.array([position[pair[0]] for pair in pairs], dtype=int)
+    second = np.array([position[pair[1]] for pair in pairs], dtype=int)
+
+    return first, second, pd.MultiIndex.from_arrays(
+        [[pair[0] for pair in pairs], [pair[1] for pair in pairs]], names=['Stock A', 'Stock B']
+    )
+
+
+def _half_life(phi: np.ndarray) -> np.ndarray:
+
+    # Half-life -ln 2 / ln|phi| of an AR(1) coefficient. Any |phi| < 1 reverts: phi in (-1, 0) by oscillating
+    # and phi = 0 (white noise) at once, a half-life of 0. Only |phi| >= 1 never reverts and gives NaN
+    magnitude = np.abs(phi)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        half_life = -np.log(2) / np.log(np.where(magnitude < 1, magnitude, np.nan))
+
+    return np.where(magnitude == 0, 0.0, half_life)
+
+
+def _ar1_half_life(spread: np.ndarray) -> np.ndarray:
+
+    # Ornstein-Uhlenbeck half-life from the AR(1) regression dS_t = c + b S_{t-1}, column by column:
+    # phi = 1 + b, half-life = -ln 2 / ln|phi| (see _half_life)
+    lagged = spread[:-1] - spread[:-1].mean(axis=0)
+    delta = np.diff(spread, axis=0)
+    delta = delta - delta.mean(axis=0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = np.einsum('ti,ti->i', lagged, delta) / np.einsum('ti,ti->i', lagged, lagged)
+
+    return _half_life(1 + slope)
+
+
+def _rolling_moments(A: np.ndarray, B: np.ndarray, window: int) -> tuple:
+
+    # Rolling means of A and B, variance of B and covariance of A and B (ddof=1) over the last window rows,
+    # every column at once from cumulative sums; the first window - 1 rows are NaN.
+    # Columns are centered first so that the window sums stay small. Windows longer than the series give NaN
+    if window < 2:
+        raise ValueError("window must be at least 2")
+
+    center_a = A.mean(axis=0)
+    center_b = B.mean(axis=0)
+    A = A - center_a
+    B = B - center_b
+
+    def rolling_sum(values):
+        cumulative = np.vstack([np.zeros((1, values.shape[1])), np.cumsum(values, axis=0)])
+        sums = np.full(values.shape, np.nan)
+        if window <= len(values):
+            sums[window - 1:] = cumulative[window:] - cumulative[:-window]
+        return sums
+
+    sum_a, sum_b = rolling_sum(A), rolling_sum(B)
+    var_b = (rolling_sum(B * B) - sum_b ** 2 / window) / (window - 1)
+    cov_ab = (rolling_sum(A * B) - sum_a * sum_b / window) / (window - 1)
+
+    return sum_a / window + center_a, sum_b / window + center_b, var_b, cov_ab
+
+
+def pair_spread_analytics(
+    pairs,
+    train_df: pd.DataFrame,
+    test_df: pd.DataFrame = None,
+    log_prices: bool = True,
+    window: int = None
+) -> dict:
+
+    """
+    Hedge ratios, spreads, z-scores and Ornstein-Uhlenbeck half-lives of many pairs at once, as stacked array
+    operations over a (dates, pairs) layout. The hedge regression stock_a = alpha + beta * stock_b and the
+    spread moments are estimated on the formation (train) period and applied to the trading (test) period.
+
+    Parameters:
+        pairs (list or pandas.DataFrame): Pairs [stock_a, stock_b], or a table with 'Stock A' and 'Stock B'
+            columns such as the output of pairs_formation_result_summary.
+        train_df (pandas.DataFrame): Formation period prices (e.g. from splitting_data), one column per stock,
+            without missing values.
+        test_df (pandas.DataFrame or None): Trading period prices with the same columns, without missing values.
+            Default is None.
+        log_prices (bool): Work on natural log prices, like the cointegration tests. Default is True.
+        window (int or None): Length of the rolling estimates (z-score, hedge ratio, half-life) computed over
+            the train and test periods joined together, between 2 and their number of rows. Default is None
+            (no rolling estimates).
+
+    Returns:
+        dict: 'summary' (one row per pair: hedge ratio, intercept, spread mean and standard deviation, half-life,
+        last z-score), 'spread' and 'zscore' (dates x pairs, z-scores standardized with the train moments) and,
+        with a window, 'rolling_zscore', 'rolling_hedge_ratio' and 'rolling_half_life'.
+    """
+    columns = train_df.columns.tolist()
+    first, second, pair_index = _pair_legs(pairs, columns)
+
+    prices = train_df if test_df is None else pd.concat([train_df, test_df[columns]])
+    X = prices.to_numpy(dtype=float)
+    if log_prices:
+        X = np.log(X)
+    n_train = len(train_df)
+
+    if np.isnan(X).any():
+        raise ValueError("The price panels contain missing values, drop or fill them first")
+
+    # Hedge regressions of every pair from the centered formation period (one cross-product per pair)
+    train = X[:n_train]
+    train_mean = train.mean(axis=0)
+    centered = train - train_mean
+    sum_squares = np.einsum('ti,ti->i', centered, centered)
+    cross_products = np.einsum('ti,ti->i', centered[:, first], centered[:, second])
+
+    hedge_ratio = cross_products / sum_squares[second]
+    intercept = train_mean[first] - hedge_ratio * train_mean[second]
+
+    spread = X[:, first] - hedge_ratio * X[:, second] - intercept
+    spread_mean = spread[:n_train].mean(axis=0)
+    spread_std = spread[:n_train].std(axis=0, ddof=1)
+    zscore = (spread - spread_mean) / spread_std
+    half_life = _ar1_half_life(spread[:n_train])
+
+    def to_frame(values):
+        return pd.DataFrame(values, index=prices.index, columns=pair_index)
+
+    result = {
+        'summary': pd.DataFrame({
+            'Stock A': pair_index.get_level_values(0),
+            'Stock B': pair_index.get_level_values(1),
+            'Hedge Ratio': hedge_ratio,
+            'Intercept': intercept,
+            'Spread Mean': spread_mean,
+            'Spread Std': spread_std,
+            'Half Life': half_life,
+            'Last Z-Score': zscore[-1]
+        }),
+        'spread': to_frame(spread),
+        'zscore': to_frame(zscore)
+    }
+
+    if window is not None:
+        if not 2 <= window <= len(spread):
+            raise ValueError(f"window must be between 2 and the number of rows ({len(spread)})")
+
+        # Rolling z-score of the spread against its own rolling mean and standard deviation
+        spread_rolling_mean, _, _, spread_rolling_var = _rolling_moments(spread, spread, window)
+        result['rolling_zscore'] = to_frame((spread - spread_rolling_mean) / np.sqrt(spread_rolling_var))
+
+        # Rolling OLS slope of every pair: the legs' rolling covariance over the regressor's rolling variance
+        _, _, var_b, cov_ab = _rolling_moments(X[:, first], X[:, second], window)
+        result['rolling_hedge_ratio'] = to_frame(cov_ab / var_b)
+
+        # Rolling AR(1) slope of the spread changes on the lagged spread
+        _, _, var_lagged, cov_delta = _rolling_moments(np.diff(spread, axis=0), spread[:-1], window)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            half_life = _half_life(1 + cov_delta / var_lagged)
+        result['rolling_half_life'] = to_frame(np.vstack([np.full((1, spread.shape[1]), np.nan), half_life]))
+
+    return result
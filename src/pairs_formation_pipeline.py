@@ -0,0 +1,487 @@
+import os
+import sys
+import glob
+import json
+import time
+import hashlib
+import types
+import argparse
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import pandas as pd
+import config_snippets as config_snp
+import splitting_data as splitting_data
+import gatev_distance_method as gatev_dist
+import data_transformation_snippets as data_transform_snp
+import time_series_analysis_snippets as tsa_snp
+import engle_granger_cointegration_method as eg_coint
+import johansen_cointegration_method as jj_coint
+import handling_dataframe as hdf
+import handling_datetime as hdt
+import instrumentation as inst
+
+# Batch version of the pairs formation notebooks (one per sector and period). The config is expanded into
+# a task graph: for every sector x period, a 'prepare' task (load, dropna, split, log, integration order)
+# feeds one task per method (the two Engle-Granger directions share one), and a 'summary' task writes
+# the usual result file
+#     <results_dir>/<sector>/<sector>_pairs_formation_<period>_period_<ddmmyyyy>.csv
+# Independent tasks run concurrently in worker processes. A manifest in results_dir records the fingerprint
+# (input file, parameters, source code) of every written file, so up-to-date sector x period are skipped.
+PERIODS = ['first', 'second', 'third']
+METHODS = ['Gatev Pairs', 'EG Pairs', 'EG Pairs Swap', 'Johansen Pairs']
+# Methods sharing one bidirectional Engle-Granger scan
+ENGLE_GRANGER_METHODS = ['EG Pairs', 'EG Pairs Swap']
+MANIFEST_FILE = 'pipeline_manifest.json'
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_PIPELINE = {
+    'sectors': ['finance', 'tech', 'consumer_good'],
+    'periods': PERIODS,
+    'methods': METHODS,
+    'data_dir': '../../data/processed',
+    'results_dir': '../../results/pairs_formation',
+    'input_files': '{sector}/df_{sector}_processed_{period}_period_*.csv',
+    'gatev_top_values': 10,
+    'integration_order': 1,
+    'significance_level': 0.05,
+    'johansen_confidence_level': 95,
+    'n_workers': None
+}
+
+
+def _file_date(path: str) -> datetime:
+
+    # Date stamp <ddmmyyyy> at the end of the data file names (handling_datetime.today_date_to_digits)
+    stamp = os.path.splitext(os.path.basename(path))[0].rsplit('_', 1)[-1]
+    try:
+        return datetime.strptime(stamp, '%d%m%Y')
+    except ValueError:
+        return datetime.min
+
+
+def load_pipeline_config(config_file_path: str) -> dict:
+
+    """
+    Read config.yaml and resolve the pipeline section: defaults of DEFAULT_PIPELINE for the missing keys,
+    data_dir and results_dir relative to the config file, and the input file of every sector x period:
+    the input_files pattern in data_dir with the latest <ddmmyyyy> stamp.
+
+    Parameters:
+        config_file_path (str): Path of config.yaml.
+
+    Returns:
+        dict: The pipeline parameters, split_ratio and 'inputs' {(sector, period): path}.
+    """
+    config = config_snp.load_config(config_file_path)
+    if config is None:
+        raise ValueError(f"Cannot read the config file {config_file_path}")
+
+    pipeline = {**DEFAULT_PIPELINE, **(config.get('pipeline') or {})}
+    config_dir = os.path.dirname(os.path.abspath(config_file_path))
+
+    unknown = (set(pipeline['periods']) - set(PERIODS)) | (set(pipeline['methods']) - set(METHODS))
+    if unknown:
+        raise ValueError(f"Unknown periods or methods in the pipeline section: {sorted(unknown)}")
+
+    pipeline['split_ratio'] = config['split_ratio']
+    pipeline['data_dir'] = os.path.normpath(os.path.join(config_dir, pipeline['data_dir']))
+    pipeline['results_dir'] = os.path.normpath(os.path.join(config_dir, pipeline['results_dir']))
+
+    pipeline['inputs'] = {}
+    for sector in pipeline['sectors']:
+        for period in pipeline['periods']:
+            pattern = os.path.join(pipeline['data_dir'], pipeline['input_files'].format(sector=sector, period=period))
+            paths = glob.glob(pattern)
+            if not paths:
+                raise FileNotFoundError(f"No input file of {sector} {period} period: {pattern}")
+            pipeline['inputs'][(sector, period)] = max(paths, key=_file_date)
+
+    return pipeline
+
+
+def prepare_formation_data(path: str, split_ratio: float, integration_order: int) -> dict:
+
+    # Same steps as the notebooks: date index, dropna, split by ratio, log prices of the I(d) stocks
+    with inst.stage('pipeline.load_csv'):
+        df = pd.read_csv(path)
+        df.set_index('date', inplace=True)
+        df = df.dropna()
+
+    df_train, _ = splitting_data.splitting_data_by_ratio(df, split_ratio=split_ratio)
+
+    df_train_transformed = data_transform_snp.df_natural_log_transformed(df_train)
+    df_order = tsa_snp.find_integration_order_batched(df_train_transformed)
+    keep = df_order['Column Name'][df_order['Integration Order'].eq(integration_order).fillna(False)].tolist()
+
+    return {'train': df_train, 'train_transformed': df_train_transformed[keep]}
+
+
+def _method_groups(methods: list) -> list:
+
+    # Methods computed by one task: both Engle-Granger directions come from a single bidirectional scan
+    engle_granger = [method for method in methods if method in ENGLE_GRANGER_METHODS]
+    groups = [[method] for method in methods if method not in ENGLE_GRANGER_METHODS]
+    if engle_granger:
+        groups.insert(min(methods.index(method) for method in engle_granger), engle_granger)
+
+    return groups
+
+
+def run_formation_methods(methods: list, params: dict, prepared: dict) -> dict:
+
+    # Pairs of a group of methods {method: pairs}; the batched tests give the same pairs as the notebook functions
+    if methods == ['Gatev Pairs']:
+        df_cum_daily_returns_train = gatev_dist.gatev_data_normalize(prepared['train'], visualize=False)
+        pairs, _ = gatev_dist.gatev_distance_smallest(df_cum_daily_returns_train, top_values=params['gatev_top_values'])
+        return {'Gatev Pairs': pairs}
+
+    df_train_transformed = prepared['train_transformed']
+    if df_train_transformed.shape[1] < 2:
+        return {method: [] for method in methods}
+
+    if methods == ['EG Pairs']:
+        _, _, pairs = eg_coint.find_cointegrated_pairs_batched(
+            df_train_transformed, significance_level=params['significance_level'], visualize=False
+        )
+        return {'EG Pairs': pairs}
+
+    if set(methods) <= set(ENGLE_GRANGER_METHODS):
+        # One scan serves coint(S1, S2) and coint(S2, S1)
+        result = eg_coint.find_cointegrated_pairs_bidirectional(
+            df_train_transformed, significance_level=params['significance_level'], visualize=False
+        )
+        keys = {'EG Pairs': 'pairs', 'EG Pairs Swap': 'pairs_swap'}
+        return {method: result[keys[method]] for method in methods}
+
+    return {'Johansen Pairs': jj_coint.johansen_test_batched(
+        df_train_transformed, confidence_level=params['johansen_confidence_level']
+    )}
+
+
+def write_formation_summary(output_path: str, methods: list, *group_pairs) -> str:
+
+    # Result table of the notebooks; the legacy layout when the four methods are run
+    method_pairs = {method: pairs for group in group_pairs for method, pairs in group.items()}
+    method_pairs = [method_pairs[method] for method in methods]
+
+    if methods == METHODS:
+        df_pairs_formation_train = hdf.pairs_formation_result_summary(*method_pairs)
+    else:
+        df_pairs_formation_train = hdf.pairs_formation_summary(dict(zip(methods, method_pairs)))
+
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    df_pairs_formation_train.to_csv(output_path)
+
+    return output_path
+
+
+def _run_instrumented(function, task_labels: dict, trace_memory: bool, n_dependencies: int, *args) -> dict:
+
+    # Task run in a fresh instrumentation session (in its worker process); the results of the tasks it
+    # depends on arrive wrapped the same way
+    n_args = len(args) - n_dependencies
+    args = (*args[:n_args], *[dependency['result'] for dependency in args[n_args:]])
+
+    with inst.session(trace_memory=trace_memory, **task_labels) as recorded:
+        with inst.stage(f"pipeline.{task_labels['task']}"):
+            result = function(*args)
+
+    return {'result': result, 'report': recorded['report']}
+
+
+def _source_files() -> list:
+
+    # This file and the src modules it imports, then theirs, found through the module objects: a fixed set
+    # whatever the caller imported before, and a code change in any of them makes every result out of date
+    pending = [sys.modules[__name__]]
+    paths = set()
+    while pending:
+        module = pending.pop()
+        path = os.path.abspath(module.__file__)
+        if path in paths:
+            continue
+        paths.add(path)
+        pending.extend(
+            value for value in vars(module).values()
+            if isinstance(value, types.ModuleType) and getattr(value, '__file__', None)
+            and os.path.dirname(os.path.abspath(value.__file__)) == SRC_DIR
+        )
+
+    return sorted(paths)
+
+
+def _fingerprint(input_path: str, pipeline: dict) -> str:
+
+    # Input file content, parameters of the results and source code of the steps
+    digest = hashlib.blake2b(digest_size=16)
+    with open(input_path, 'rb') as file:
+        digest.update(file.read())
+
+    params = {
+        key: pipeline[key] for key in
+        ['methods', 'split_ratio', 'gatev_top_values', 'integration_order', 'significance_level', 'johansen_confidence_level']
+    }
+    digest.update(json.dumps(params, sort_keys=True).encode())
+
+    for source_path in _source_files():
+        digest.update(os.path.basename(source_path).encode())
+        with open(source_path, 'rb') as file:
+            digest.update(file.read())
+
+    return digest.hexdigest()
+
+
+def _load_manifest(results_dir: str) -> dict:
+    manifest_path = os.path.join(results_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path) as file:
+        return json.load(file)
+
+
+def _save_manifest(results_dir: str, manifest: dict) -> None:
+
+    # Written through a temporary file so that an interrupted run never leaves a truncated manifest
+    os.makedirs(results_dir, exist_ok=True)
+    manifest_path = os.path.join(results_dir, MANIFEST_FILE)
+    with open(manifest_path + '.tmp', 'w') as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+
+def build_task_graph(pipeline: dict, force: bool = False) -> tuple:
+
+    """
+    Expand the pipeline into tasks. Every task is a dict with the function to run, its arguments and the
+    names of the tasks whose results are appended to the arguments. Sector x period whose manifest
+    fingerprint matches and whose result file exists are left out.
+
+    Parameters:
+        pipeline (dict): Output of load_pipeline_config.
+        force (bool): Rebuild every result. Default is False.
+
+    Returns:
+        tuple: The tasks {name: task}, the jobs {(sector, period): {'fingerprint', 'output'}} to run and
+        the up-to-date jobs {(sector, period): manifest entry}.
+    """
+    manifest = _load_manifest(pipeline['results_dir'])
+    today = hdt.today_date_to_digits()
+    tasks, jobs, up_to_date = {}, {}, {}
+
+    for (sector, period), input_path in pipeline['inputs'].items():
+        fingerprint = _fingerprint(input_path, pipeline)
+        entry = manifest.get(f'{sector}/{period}')
+        if (not force and entry is not None and entry['fingerprint'] == fingerprint
+                and os.path.exists(os.path.join(pipeline['results_dir'], entry['output']))):
+            up_to_date[(sector, period)] = entry
+            continue
+
+        output_path = os.path.join(
+            pipeline['results_dir'], sector, f'{sector}_pairs_formation_{period}_period_{today}.csv'
+        )
+        jobs[(sector, period)] = {'fingerprint': fingerprint, 'output': output_path}
+
+        tasks[('prepare', sector, period)] = {
+            'function': prepare_formation_data,
+            'args': (input_path, pipeline['split_ratio'], pipeline['integration_order']),
+            'depends_on': []
+        }
+        groups = _method_groups(pipeline['methods'])
+        for group in groups:
+            tasks[('method', sector, period, ' + '.join(group))] = {
+                'function': run_formation_methods,
+                'args': (group, pipeline),
+                'depends_on': [('prepare', sector, period)]
+            }
+        tasks[('summary', sector, period)] = {
+            'function': write_formation_summary,
+            'args': (output_path, pipeline['methods']),
+            'depends_on': [('method', sector, period, ' + '.join(group)) for group in groups]
+        }
+
+    return tasks, jobs, up_to_date
+
+
+def run_task_graph(tasks: dict, n_workers: int = None, on_done=None) -> tuple:
+
+    """
+    Run a task graph on a process pool: a task is submitted as soon as every task it depends on is done,
+    so independent sectors, periods and methods run concurrently. Tasks depending on a failed task are
+    not run.
+
+    Parameters:
+        tasks (dict): Output of build_task_graph.
+        n_workers (int or None): Number of worker processes. Default is os.cpu_count(); 1 runs in-process.
+        on_done (callable or None): Called with (name, result) after every successful task. Default is None.
+
+    Returns:
+        tuple: The results {name: result} and the errors {name: exception or 'skipped'}.
+    """
+    unknown = {dependency for task in tasks.values() for dependency in task['depends_on']} - set(tasks)
+    if unknown:
+        raise ValueError(f"Tasks depend on unknown tasks: {sorted(unknown)}")
+
+    results, errors = {}, {}
+    pending = dict(tasks)
+    n_workers = min(n_workers or os.cpu_count() or 1, max(len(tasks), 1))
+
+    def ready():
+        for name, task in list(pending.items()):
+            if any(dependency in errors for dependency in task['depends_on']):
+                errors[name] = 'skipped'
+                del pending[name]
+            elif all(dependency in results for dependency in task['depends_on']):
+                del pending[name]
+                yield name, (*task['args'], *[results[dependency] for dependency in task['depends_on']])
+
+    def finish(name, result):
+        results[name] = result
+        if on_done is not None:
+            on_done(name, result)
+
+    if n_workers == 1:
+        while pending:
+            for name, args in list(ready()):
+                try:
+                    finish(name, tasks[name]['function'](*args))
+                except Exception as error:
+                    errors[name] = error
+        return results, errors
+
+    running = {}
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        while pending or running:
+            for name, args in list(ready()):
+                running[executor.submit(tasks[name]['function'], *args)] = name
+            if not running:
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    finish(name, future.result())
+                except Exception as error:
+                    errors[name] = error
+
+    return results, errors
+
+
+def run_pipeline(
+    config_file_path: str,
+    n_workers: int = None,
+    force: bool = False,
+    dry_run: bool = False,
+    report_path: str = None,
+    trace_memory: bool = False
+) -> pd.DataFrame:
+
+    """
+    Run the pairs formation of every sector x period of the config in one go and update the manifest
+    after every written result, so an interrupted run resumes where it stopped.
+
+    Parameters:
+        config_file_path (str): Path of config.yaml.
+        n_workers (int or None): Number of worker processes. Default is the pipeline section's n_workers,
+            else os.cpu_count().
+        force (bool): Rebuild every result, up to date or not. Default is False.
+        dry_run (bool): Only report what would run. Default is False.
+        report_path (str or None): Instrument every task (see instrumentation) and write the merged run report,
+            labelled by task, sector, period and method, to this JSON file. Default is None (no instrumentation).
+        trace_memory (bool): With report_path, also record the peak traced memory of the stages. Default is False.
+
+    Returns:
+        pandas.DataFrame: One row per sector x period with its status ('up to date', 'pending', 'written',
+        'failed'), result file and the error of a failed job.
+    """
+    pipeline = load_pipeline_config(config_file_path)
+    tasks, jobs, up_to_date = build_task_graph(pipeline, force=force)
+    manifest = _load_manifest(pipeline['results_dir'])
+    reports = []
+
+    if report_path is not None:
+        for name, task in tasks.items():
+            task_labels = {'task': name[0], 'sector': name[1], 'period': name[2]}
+            if name[0] == 'method':
+                task_labels['method'] = name[3]
+            task['args'] = (task['function'], task_labels, trace_memory, len(task['depends_on']), *task['args'])
+            task['function'] = _run_instrumented
+
+    def on_done(name, result):
+        if report_path is not None:
+            reports.append(result['report'])
+            result = result['result']
+        if name[0] == 'summary':
+            sector, period = name[1:]
+            manifest[f'{sector}/{period}'] = {
+                'fingerprint': jobs[(sector, period)]['fingerprint'],
+                'output': os.path.relpath(result, pipeline['results_dir'])
+            }
+            _save_manifest(pipeline['results_dir'], manifest)
+
+    errors = {}
+    start_time = time.perf_counter()
+    if tasks and not dry_run:
+        _, errors = run_task_graph(tasks, n_workers=n_workers or pipeline['n_workers'], on_done=on_done)
+
+    report = []
+    for (sector, period) in pipeline['inputs']:
+        if (sector, period) in up_to_date:
+            status = 'up to date'
+            output = os.path.join(pipeline['results_dir'], up_to_date[(sector, period)]['output'])
+            error = None
+        else:
+            failed = [
+                errors[name] for name in errors
+                if name[1:3] == (sector, period) and errors[name] != 'skipped'
+            ]
+            status = 'pending' if dry_run else ('failed' if failed else 'written')
+            output = jobs[(sector, period)]['output']
+            error = repr(failed[0]) if failed else None
+        report.append({'Sector': sector, 'Period': period, 'Status': status, 'Output': output, 'Error': error})
+
+    report = pd.DataFrame(report)
+    report.attrs['seconds'] = round(time.perf_counter() - start_time, 2)
+
+    if report_path is not None and not dry_run:
+        inst.write_report(
+            report_path,
+            inst.merge_snapshots(reports),
+            metadata={
+                'config': os.path.abspath(config_file_path),
+                'created': datetime.now().isoformat(timespec='seconds'),
+                'n_workers': n_workers or pipeline['n_workers'] or os.cpu_count(),
+                'seconds': report.attrs['seconds']
+            }
+        )
+
+    return report
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description='Pairs formation of every sector and period of config.yaml')
+    parser.add_argument('--config', default=os.path.join(SRC_DIR, '..', 'notebooks', 'main_notebooks', 'config.yaml'),
+                        help='Path of config.yaml')
+    parser.add_argument('--workers', type=int, default=None, help='Number of worker processes')
+    parser.add_argument('--force', action='store_true', help='Rebuild up-to-date results too')
+    parser.add_argument('--dry-run', action='store_true', help='Only list what would run')
+    parser.add_argument('--report', default=None, help='Write an instrumentation report (JSON) of the run')
+    parser.add_argument('--trace-memory', action='store_true', help='Record peak memory in the report')
+    args = parser.parse_args(argv)
+
+    report = run_pipeline(
+        args.config, n_workers=args.workers, force=args.force, dry_run=args.dry_run,
+        report_path=args.report, trace_memory=args.trace_memory
+    )
+    print(report.drop(columns='Error').to_string(index=False))
+    print(f"Done in {report.attrs['seconds']}s")
+
+    for row in report[report['Status'] == 'failed'].itertuples():
+        print(f"{row.Sector} {row.Period}: {row.Error}", file=sys.stderr)
+
+    return int((report['Status'] == 'failed').any())
+
+
+if __name__ == '__main__':
+    sys.exit(main())
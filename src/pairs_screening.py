@@ -0,0 +1,215 @@
+import time
+import pandas as pd
+import numpy as np
+import data_transformation_snippets as data_transform_snp
+import time_series_analysis_snippets as tsa_snp
+import gatev_distance_method as gatev_dist
+import pair_result_formats as prf
+import engle_granger_cointegration_method as eg_coint
+import johansen_cointegration_method as jj_coint
+
+
+def _stage_report(stage: str, pairs_in: int, pairs_out: int, start_time: float) -> dict:
+    return {
+        'stage': stage,
+        'pairs_in': pairs_in,
+        'pairs_out': pairs_out,
+        'pairs_pruned': pairs_in - pairs_out,
+        'seconds': round(time.perf_counter() - start_time, 4)
+    }
+
+
+def _screen(
+    df: pd.DataFrame,
+    integration_order: int,
+    min_return_correlation: float,
+    max_gatev_rank: int
+) -> tuple:
+
+    # Candidate pairs, the stage report and the pairs pruned by every stage
+    report = []
+    pruned = {}
+    stocks = df.columns.tolist()
+    all_stocks = stocks
+    n_pairs = len(stocks) * (len(stocks) - 1) // 2
+
+    # Stage 1: per-stock unit root check on the log prices
+    start_time = time.perf_counter()
+    if integration_order is not None:
+        df_order = tsa_snp.find_integration_order_batched(data_transform_snp.df_natural_log_transformed(df))
+        stocks = df_order[df_order['Integration Order'].eq(integration_order).fillna(False)]['Column Name'].tolist()
+    pairs_out = len(stocks) * (len(stocks) - 1) // 2
+    report.append(_stage_report('integration_order', n_pairs, pairs_out, start_time))
+    kept = set(stocks)
+    pruned['integration_order'] = [
+        [all_stocks[i], all_stocks[j]] for i, j in zip(*np.triu_indices(len(all_stocks), k=1))
+        if all_stocks[i] not in kept or all_stocks[j] not in kept
+    ]
+
+    df = df[stocks]
+    row_idx, col_idx = np.triu_indices(len(stocks), k=1)
+
+    # Stage 2: correlation of daily log returns, all pairs from one correlation matrix
+    start_time = time.perf_counter()
+    pairs_in = len(row_idx)
+    pruned['return_correlation'] = []
+    if min_return_correlation is not None and len(stocks) > 1:
+        log_returns = np.diff(np.log(df.to_numpy(dtype=float)), axis=0)
+        correlation = np.corrcoef(log_returns, rowvar=False)
+        keep = correlation[row_idx, col_idx] >= min_return_correlation
+        pruned['return_correlation'] = [[stocks[i], stocks[j]] for i, j in zip(row_idx[~keep], col_idx[~keep])]
+        row_idx, col_idx = row_idx[keep], col_idx[keep]
+    report.append(_stage_report('return_correlation', pairs_in, len(row_idx), start_time))
+
+    # Stage 3: rank of the Gatev distance among the remaining pairs
+    start_time = time.perf_counter()
+    pairs_in = len(row_idx)
+    pruned['gatev_rank'] = []
+    if max_gatev_rank is not None and len(row_idx) > max_gatev_rank:
+        df_cum_returns = gatev_dist.gatev_data_normalize(df, visualize=False)
+        sq_dist, _, _ = gatev_dist.gatev_squared_distances(df_cum_returns)
+
+        # Condensed position of (i, j) in the combinations order of the Gatev engine
+        condensed = prf.condensed_index(row_idx, col_idx, len(stocks))
+        order = np.lexsort((condensed, sq_dist[condensed]))[:max_gatev_rank]
+        keep = np.zeros(len(row_idx), dtype=bool)
+        keep[order] = True
+        pruned['gatev_rank'] = [[stocks[i], stocks[j]] for i, j in zip(row_idx[~keep], col_idx[~keep])]
+        row_idx, col_idx = row_idx[keep], col_idx[keep]
+    report.append(_stage_report('gatev_rank', pairs_in, len(row_idx), start_time))
+
+    candidate_pairs = [[stocks[i], stocks[j]] for i, j in zip(row_idx, col_idx)]
+
+    return candidate_pairs, pd.DataFrame(report), pruned
+
+
+def screen_candidate_pairs(
+    df: pd.DataFrame,
+    integration_order: int = 1,
+    min_return_correlation: float = None,
+    max_gatev_rank: int = None
+) -> tuple:
+
+    """
+    Cheap filters run on the whole universe before the cointegration tests:
+        1. I(d) check: keep stocks whose log price has the given integration order (find_integration_order_batched,
+           per-ticker results cached across calls).
+        2. Return correlation: keep pairs whose daily log-return correlation reaches min_return_correlation.
+        3. Gatev distance rank: keep the max_gatev_rank remaining pairs with the smallest Gatev distance.
+
+    Every stage is a lossy pre-filter: cointegrated pairs need neither correlated daily returns nor a small
+    Gatev distance, and the ADF check of a single leg can fail on a pair the tests accept. On the nine
+    24112023 processed panels the I(1) check alone prunes 45 of the 132 pairs that the full Engle-Granger
+    (either direction) and Johansen tests select, and a return correlation of 0.5 prunes 95. The correlation
+    and Gatev stages are therefore off by default; run_screening_cascade(count_missed=True) measures the loss.
+
+    Parameters:
+        df (pandas.DataFrame): Price panel of the formation period, one column per stock, without missing values.
+        integration_order (int or None): Required integration order of the log prices. None skips the stage.
+        min_return_correlation (float or None): Minimum correlation of daily log returns. Default is None (skipped).
+        max_gatev_rank (int or None): Number of closest pairs (Gatev distance) kept. Default is None (skipped).
+
+    Returns:
+        tuple: The list of candidate pairs [stock_a, stock_b] and a DataFrame with the number of pairs
+        entering, leaving and pruned by every stage.
+    """
+    candidate_pairs, report, _ = _screen(df, integration_order, min_return_correlation, max_gatev_rank)
+
+    return candidate_pairs, report
+
+
+def run_screening_cascade(
+    df: pd.DataFrame,
+    integration_order: int = 1,
+    min_return_correlation: float = None,
+    max_gatev_rank: int = None,
+    significance_level: float = 0.05,
+    johansen_confidence_level: int = 95,
+    run_engle_granger: bool = True,
+    run_johansen: bool = True,
+    count_missed: bool = False
+) -> dict:
+
+    """
+    Screening cascade from cheap to expensive: screen_candidate_pairs on the whole universe, then the
+    batched Engle-Granger test (both directions) and the batched Johansen test on the surviving candidates only.
+    The thresholds can be read from the screening section of config.yaml: run_screening_cascade(df, **config['screening']).
+    The screening stages are lossy (see screen_candidate_pairs); with count_missed the tests also run on every
+    pair of the universe and the report counts, per screening stage, the pruned pairs they would have selected.
+
+    Parameters:
+        df (pandas.DataFrame): Price panel of the formation period, one column per stock, without missing values.
+        integration_order (int or None): Required integration order of the log prices. None skips the stage.
+        min_return_correlation (float or None): Minimum correlation of daily log returns. Default is None (skipped).
+        max_gatev_rank (int or None): Number of closest pairs (Gatev distance) kept. Default is None (skipped).
+        significance_level (float): Engle-Granger significance level. Default is 0.05.
+        johansen_confidence_level (int): Johansen trace test confidence level (90, 95 or 99). Default is 95.
+        run_engle_granger (bool): Run the Engle-Granger stage. Default is True.
+        run_johansen (bool): Run the Johansen stage. Default is True.
+        count_missed (bool): Also run the enabled tests on every pair of the universe and count the pairs
+            each screening stage pruned that they select ('selected_pruned' column, 'missed_pairs' list).
+            Costs a full unscreened run. Default is False.
+
+    Returns:
+        dict: 'candidates', 'eg_pairs', 'eg_pairs_swap', 'johansen_pairs' and the per-stage 'report' DataFrame,
+        plus 'missed_pairs' with count_missed.
+    """
+    candidates, report, pruned = _screen(df, integration_order, min_return_correlation, max_gatev_rank)
+    report = report.to_dict('records')
+
+    # The cointegration tests run on the log prices, like in the pairs formation notebooks
+    candidate_stocks = sorted({stock for pair in candidates for stock in pair}, key=df.columns.get_loc)
+    df_transformed = data_transform_snp.df_natural_log_transformed(df[candidate_stocks])
+
+    result = {'candidates': candidates, 'eg_pairs': [], 'eg_pairs_swap': [], 'johansen_pairs': []}
+
+    if run_engle_granger:
+        start_time = time.perf_counter()
+        eg_pairs_either = []
+        if candidates:
+            eg_result = eg_coint.find_cointegrated_pairs_bidirectional(
+                df_transformed,
+                significance_level=significance_level,
+                pairs=candidates,
+                visualize=False
+            )
+            result['eg_pairs'] = eg_result['pairs']
+            result['eg_pairs_swap'] = eg_result['pairs_swap']
+            eg_pairs_either = eg_result['pairs_either']
+        report.append(_stage_report('engle_granger', len(candidates), len(eg_pairs_either), start_time))
+
+    if run_johansen:
+        start_time = time.perf_counter()
+        if candidates:
+            result['johansen_pairs'] = jj_coint.johansen_test_batched(
+                df_transformed,
+                confidence_level=johansen_confidence_level,
+                pairs=candidates
+            )
+        report.append(_stage_report('johansen', len(candidates), len(result['johansen_pairs']), start_time))
+
+    result['report'] = pd.DataFrame(report)
+
+    if count_missed:
+        # Pairs the enabled tests select on the unscreened universe, in canonical (column) order
+        full = run_screening_cascade(
+            df,
+            integration_order=None,
+            significance_level=significance_level,
+            johansen_confidence_level=johansen_confidence_level,
+            run_engle_granger=run_engle_granger,
+            run_johansen=run_johansen
+        )
+        selected = {
+            tuple(sorted(pair, key=df.columns.get_loc))
+            for pair in full['eg_pairs'] + full['eg_pairs_swap'] + full['johansen_pairs']
+        }
+        missed = {stage: [pair for pair in pairs if tuple(pair) in selected] for stage, pairs in pruned.items()}
+
+        result['report']['selected_pruned'] = pd.array(
+            [len(missed[stage]) if stage in missed else pd.NA for stage in result['report']['stage']],
+            dtype='Int64'
+        )
+        result['missed_pairs'] = [pair for pairs in missed.values() for pair in pairs]
+
+    return result
@@ -0,0 +1,153 @@
+import numpy as np
+import pandas as pd
+import handling_dataframe as hdf
+import instrumentation as inst
+
+# Calendar alignment and gap filling of a wide price panel in one pass, replacing
+# resample_dataframe + slicing + fillna(method='ffill') of the preprocessing notebooks:
+#     the rows of every ticker are scattered once into a (calendar, tickers) array,
+#     tickers above the missing threshold are left out before the array is allocated,
+#     forward filling and the fill statistics come from the same missing mask
+FILL_STATISTICS = ['column', 'percentage', 'count', 'filled', 'remaining', 'longest_gap', 'dropped']
+
+
+def trading_calendar(start, end, freq: str = 'B', holidays: list = None) -> pd.DatetimeIndex:
+
+    """
+    Trading days between two dates: every period of freq, without the exchange holidays.
+
+    Parameters:
+        start (str or datetime-like): First date.
+        end (str or datetime-like): Last date.
+        freq (str): Frequency of the sessions, 'B' (weekdays) or 'D' (every calendar day, as
+            resample_dataframe). Default is 'B'.
+        holidays (list or None): Dates on which the exchange is closed. Default is None.
+
+    Returns:
+        pandas.DatetimeIndex: The trading days.
+    """
+    calendar = pd.date_range(pd.Timestamp(start).normalize(), pd.Timestamp(end), freq=freq)
+    if holidays is not None:
+        calendar = calendar.difference(pd.DatetimeIndex(holidays))
+
+    return calendar
+
+
+def _forward_fill(values: np.ndarray, max_gap: int = None) -> tuple:
+
+    # Last observed row of every cell (-1 before the first observation), filled in place when the
+    # distance to it is at most max_gap, as fillna(method='ffill', limit=max_gap) column by column.
+    # Only the filled cells are gathered; the last-row array is reused for the gap lengths
+    missing = np.isnan(values)
+    positions = np.arange(len(values), dtype=np.int32)[:, None]
+    last = np.where(missing, np.int32(-1), positions)
+    np.maximum.accumulate(last, axis=0, out=last)
+
+    fill = missing & (last >= 0)
+    if max_gap is not None:
+        fill &= (positions - last) <= max_gap
+
+    values[fill] = values[last[fill], np.nonzero(fill)[1]]
+
+    # Distance to the last observation: 0 on observed cells, the run length so far on missing ones
+    np.subtract(positions, last, out=last)
+
+    return missing.sum(axis=0), fill.sum(axis=0), last.max(axis=0, initial=0)
+
+
+@inst.timed('panel_alignment.align_panel')
+def align_panel(
+    df: pd.DataFrame,
+    date_column: str = None,
+    calendar='B',
+    start=None,
+    end=None,
+    holidays: list = None,
+    max_gap: int = None,
+    max_missing_percentage: float = None
+) -> tuple:
+
+    """
+    Align every ticker of a wide price panel to a trading calendar and forward fill the gaps. df is not modified.
+
+    Parameters:
+        df (pandas.DataFrame): The panel, one column per ticker, with a date column or a date index.
+        date_column (str or None): The date column (e.g. 'date' of reformat_dataframe). Default is None (the index).
+        calendar (None, str or pandas.DatetimeIndex): Rows of the aligned panel. None keeps the dates present in
+            df, a frequency string gives trading_calendar(start, end, calendar, holidays) ('D' reproduces
+            resample_dataframe), a DatetimeIndex is used as is. Default is 'B'.
+        start (str or datetime-like or None): First date, e.g. the start of a formation period. Default is the first date of df.
+        end (str or datetime-like or None): Last date. Default is the last date of df.
+        holidays (list or None): Exchange holidays removed from the calendar. Default is None.
+        max_gap (int or None): Longest run of missing sessions filled with the last observed price; longer gaps
+            keep their remaining NaN. Default is None (no limit, as fillna(method='ffill')).
+        max_missing_percentage (float or None): Tickers missing on more than this percentage of the calendar
+            (before filling) are dropped. Default is None (keep every ticker).
+
+    Returns:
+        tuple: The aligned panel indexed by the calendar, and the fill statistics of every ticker in the
+        layout of calculate_missing_percentage ('column', 'percentage' and 'count' of the missing sessions
+        before filling) with 'filled', 'remaining' (missing after filling), 'longest_gap' and 'dropped'.
+    """
+    if date_column is None:
+        dates = pd.DatetimeIndex(df.index)
+        columns = df.columns.tolist()
+    else:
+        dates = pd.DatetimeIndex(pd.to_datetime(df[date_column]))
+        columns = [column for column in df.columns if column != date_column]
+
+    start = dates.min() if start is None else pd.Timestamp(start)
+    end = dates.max() if end is None else pd.Timestamp(end)
+    if pd.isna(start) or pd.isna(end):
+        raise ValueError("df has no dates, give start and end to align it to a calendar")
+
+    if calendar is None:
+        calendar = dates[(dates >= start) & (dates <= end)].unique().sort_values()
+    elif isinstance(calendar, str):
+        calendar = trading_calendar(start, end, freq=calendar, holidays=holidays)
+    calendar = pd.DatetimeIndex(calendar, name=date_column or dates.name)
+
+    if len(calendar) == 0:
+        raise ValueError("The calendar between start and end is empty")
+    if max_gap is not None and max_gap < 0:
+        raise ValueError("max_gap must be non-negative")
+
+    # Source rows on the calendar; with duplicated dates the last row wins
+    rows = calendar.get_indexer(dates)
+    positions = np.flatnonzero(rows >= 0)
+    _, last_occurrence = np.unique(rows[positions][::-1], return_index=True)
+    positions = positions[len(positions) - 1 - last_occurrence]
+    every_row = np.array_equal(positions, np.arange(len(df)))
+
+    # Missing counts from the notna masks, before any float copy of the panel
+    observed = df[columns] if every_row else df[columns].iloc[positions]
+    missing_count = len(calendar) - observed.count().to_numpy()
+    stats = hdf._missing_percentage_frame(columns, missing_count, len(calendar))
+
+    keep = np.ones(len(columns), dtype=bool)
+    if max_missing_percentage is not None:
+        keep = stats['percentage'].to_numpy() <= max_missing_percentage
+    kept_columns = [column for column, kept in zip(columns, keep) if kept]
+
+    # Only the kept tickers are converted and scattered into the calendar (a view of a float64 frame,
+    # the one copy being the scatter itself), then filled in place
+    source = df[kept_columns].to_numpy(dtype=float)
+    values = np.full((len(calendar), len(kept_columns)), np.nan, order='F')
+    values[rows[positions]] = source if every_row else source[positions]
+    del source
+    missing, filled, longest_gap = _forward_fill(values, max_gap)
+
+    stats['filled'] = 0
+    stats['remaining'] = stats['count']
+    stats['longest_gap'] = np.nan
+    stats.loc[keep, 'filled'] = filled
+    stats.loc[keep, 'remaining'] = missing - filled
+    stats.loc[keep, 'longest_gap'] = longest_gap
+    stats['dropped'] = ~keep
+
+    panel = pd.DataFrame(values, index=calendar, columns=kept_columns, copy=False)
+
+    inst.count('panel_alignment.tickers_dropped', int((~keep).sum()))
+    inst.count('panel_alignment.cells_filled', int(filled.sum()))
+
+    return panel, stats[FILL_STATISTICS]
@@ -0,0 +1,261 @@
+import os
+import json
+import pandas as pd
+import numpy as np
+
+# A panel store is a directory holding the wide price panel column by column:
+#     values.npy    float64 array (dates, tickers) in Fortran order, each ticker contiguous on disk
+#     dates.npy     datetime64[ns] index of the rows
+#     meta.json     column names, index name and storage format
+# or, with the 'parquet' format (requires pyarrow), panel.parquet instead of the two arrays
+VALUES_FILE = 'values.npy'
+DATES_FILE = 'dates.npy'
+PARQUET_FILE = 'panel.parquet'
+META_FILE = 'meta.json'
+
+
+def _write_meta(store_dir: str, columns: list, index_name: str, file_format: str = 'npy') -> None:
+    with open(os.path.join(store_dir, META_FILE), 'w') as file:
+        json.dump({'columns': columns, 'index_name': index_name, 'format': file_format}, file)
+
+
+def _read_meta(store_dir: str) -> dict:
+    with open(os.path.join(store_dir, META_FILE)) as file:
+        meta = json.load(file)
+    meta.setdefault('format', 'npy')
+
+    return meta
+
+
+def write_panel(df: pd.DataFrame, store_dir: str, file_format: str = 'npy') -> None:
+
+    """
+    Write a wide price panel (date index, one column per ticker) to a panel store.
+
+    Parameters:
+        df (pandas.DataFrame): The panel, indexed by date.
+        store_dir (str): Directory of the store, created if needed.
+        file_format (str): 'npy' (memory-mappable arrays) or 'parquet' (requires pyarrow). Default is 'npy'.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    columns = [str(column) for column in df.columns]
+    index_name = df.index.name or 'date'
+
+    if file_format == 'parquet':
+        df_parquet = df.set_axis(columns, axis=1)
+        df_parquet.index = pd.DatetimeIndex(df.index, name=index_name)
+        df_parquet.to_parquet(os.path.join(store_dir, PARQUET_FILE))
+        _write_meta(store_dir, columns, index_name, file_format)
+        return
+    if file_format != 'npy':
+        raise ValueError("file_format must be 'npy' or 'parquet'")
+
+    values = np.lib.format.open_memmap(
+        os.path.join(store_dir, VALUES_FILE), mode='w+', dtype=np.float64, shape=df.shape, fortran_order=True
+    )
+    for i, column in enumerate(df.columns):
+        values[:, i] = df[column].to_numpy(dtype=float)
+    values.flush()
+    del values
+
+    np.save(os.path.join(store_dir, DATES_FILE), pd.DatetimeIndex(df.index).to_numpy(dtype='datetime64[ns]'))
+    _write_meta(store_dir, columns, index_name)
+
+
+def load_panel(
+    store_dir: str,
+    tickers: list = None,
+    start_date: str = None,
+    end_date: str = None
+) -> pd.DataFrame:
+
+    """
+    Load a panel store. With the 'npy' format the values are a read-only memory map of values.npy:
+    the whole panel and any date range are returned without copying or reading the file up front,
+    and a ticker projection only reads the selected columns (contiguous on disk).
+
+    Parameters:
+        store_dir (str): Directory of the store.
+        tickers (list or None): Columns to load, in this order. Default is every column.
+        start_date (str or None): First date to load (inclusive). Default is the first date of the store.
+        end_date (str or None): Last date to load (inclusive). Default is the last date of the store.
+
+    Returns:
+        pandas.DataFrame: The panel, indexed by date.
+    """
+    meta = _read_meta(store_dir)
+
+    if meta['format'] == 'parquet':
+        df = pd.read_parquet(os.path.join(store_dir, PARQUET_FILE), columns=tickers)
+        return df.loc[start_date:end_date]
+
+    values = np.load(os.path.join(store_dir, VALUES_FILE), mmap_mode='r')
+    dates = pd.DatetimeIndex(np.load(os.path.join(store_dir, DATES_FILE)), name=meta['index_name'])
+    columns = meta['columns']
+
+    # Date range: a row slice of the memory map is still a view
+    rows = dates.slice_indexer(start_date, end_date)
+    values = values[rows]
+    dates = dates[rows]
+
+    if tickers is not None:
+        position = {column: i for i, column in enumerate(columns)}
+        missing = [ticker for ticker in tickers if ticker not in position]
+        if missing:
+            raise KeyError(f"Tickers not in the store: {missing}")
+        values = values[:, [position[ticker] for ticker in tickers]]
+        columns = list(tickers)
+
+    return pd.DataFrame(values, index=dates, columns=columns, copy=False)
+
+
+def convert_csv_tree(
+    csv_root: str,
+    store_root: str,
+    file_format: str = 'npy',
+    index_col: str = 'date',
+    overwrite: bool = False
+) -> pd.DataFrame:
+
+    """
+    Convert every wide CSV panel under csv_root (e.g. data/processed and data/interim) into a panel store
+    under store_root, mirroring the directory tree: a/b/df_x.csv becomes store_root/a/b/df_x/.
+    Stores newer than their CSV are skipped unless overwrite is set.
+
+    Parameters:
+        csv_root (str): Root of the CSV tree.
+        store_root (str): Root of the panel stores.
+        file_format (str): 'npy' or 'parquet'. Default is 'npy'.
+        index_col (str): The date column of the CSV files. Default is 'date'.
+        overwrite (bool): Rewrite every store. Default is False.
+
+    Returns:
+        pandas.DataFrame: One row per CSV file with its store directory, shape and whether it was converted.
+    """
+    report = []
+
+    for directory, _, files in sorted(os.walk(csv_root)):
+        for file_name in sorted(files):
+            if not file_name.endswith('.csv'):
+                continue
+
+            csv_path = os.path.join(directory, file_name)
+            store_dir = os.path.join(store_root, os.path.relpath(csv_path, csv_root)[:-len('.csv')])
+            meta_path = os.path.join(store_dir, META_FILE)
+
+            up_to_date = os.path.exists(meta_path) and os.path.getmtime(meta_path) >= os.path.getmtime(csv_path)
+            if up_to_date and not overwrite:
+                meta = _read_meta(store_dir)
+                report.append({'csv': csv_path, 'store': store_dir, 'columns': len(meta['columns']), 'converted': False})
+                continue
+
+            df = pd.read_csv(csv_path)
+            # Pivoted files carry the old RangeIndex as an unnamed first column
+            df = df.drop(columns=[column for column in df.columns if column.startswith('Unnamed:')])
+            df[index_col] = pd.to_datetime(df[index_col])
+            df = df.set_index(index_col)
+
+            write_panel(df, store_dir, file_format=file_format)
+            report.append({'csv': csv_path, 'store': store_dir, 'columns': df.shape[1], 'converted': True})
+
+    return pd.DataFrame(report)
+
+
+def stream_pivot_to_store(
+    path: str,
+    store_dir: str,
+    index_col: str = 'date',
+    columns_col: str = 'code',
+    values_col: str = 'adClose',
+    prefix: str = '',
+    calendar=None,
+    chunksize: int = 1_000_000
+) -> pd.DataFrame:
+
+    """
+    Out-of-core version of reformat_dataframe followed by resample_dataframe: the long-format file is read
+    in chunks twice, once to collect the dates and codes and once to scatter the values into the panel store,
+    so peak memory depends on chunksize and on the size of the calendar, not on the length of the history.
+    Columns are named like reformat_dataframe: f'{prefix}{value}_{code}', codes sorted. As df.pivot, a
+    (date, code) pair present on more than one row raises a ValueError, across chunks as well.
+
+    Parameters:
+        path (str): The long-format CSV file.
+        store_dir (str): Directory of the panel store, created if needed.
+        index_col (str): The date column. Default is 'date'.
+        columns_col (str): The column with the stock codes. Default is 'code'.
+        values_col (str or list of str): The value column(s) to pivot. Default is 'adClose'.
+        prefix (str): Prefix of the column names. Default is ''.
+        calendar (None, str or pandas.DatetimeIndex): Rows of the panel. None keeps the dates present in the file,
+            a frequency string such as 'D' gives every period from the first to the last date (resample().asfreq()),
+            a DatetimeIndex is used as is; rows outside it are dropped.
+        chunksize (int): The number of rows read per chunk. Default is 1,000,000.
+
+    Returns:
+        pandas.DataFrame: The memory-mapped panel, as load_panel(store_dir).
+    """
+    if isinstance(values_col, str):
+        values_col = [values_col]
+    usecols = [index_col, columns_col] + list(values_col)
+
+    def read_chunks():
+        return pd.read_csv(path, usecols=usecols, chunksize=chunksize, parse_dates=[index_col])
+
+    # Pass 1: calendar and codes
+    dates = set()
+    codes = set()
+    for chunk in read_chunks():
+        dates.update(chunk[index_col].dropna().unique())
+        codes.update(chunk[columns_col].dropna().unique())
+
+    if not dates and not isinstance(calendar, pd.DatetimeIndex):
+        raise ValueError(f"{path} has no dated rows, give a DatetimeIndex calendar to build an empty panel")
+
+    if calendar is None:
+        calendar = pd.DatetimeIndex(sorted(dates))
+    elif isinstance(calendar, str):
+        calendar = pd.date_range(min(dates).normalize(), max(dates), freq=calendar)
+    calendar = pd.DatetimeIndex(calendar, name=index_col)
+
+    codes = sorted(codes)
+    code_position = pd.Index(codes)
+    columns = [f'{prefix}{value}_{code}' for value in values_col for code in codes]
+
+    # Pass 2: scatter every chunk into the memory-mapped panel, missing cells stay NaN
+    os.makedirs(store_dir, exist_ok=True)
+    values = np.lib.format.open_memmap(
+        os.path.join(store_dir, VALUES_FILE), mode='w+', dtype=np.float64,
+        shape=(len(calendar), len(columns)), fortran_order=True
+    )
+    for i in range(len(columns)):
+        values[:, i] = np.nan
+
+    # Cells already written, one byte per (date, code), to reject duplicated rows across chunks
+    seen = np.zeros((len(calendar), len(codes)), dtype=bool)
+
+    for chunk in read_chunks():
+        rows = calendar.get_indexer(chunk[index_col])
+        cols = code_position.get_indexer(chunk[columns_col])
+        keep = (rows >= 0) & (cols >= 0)
+
+        cells = rows[keep] * len(codes) + cols[keep]
+        cells_sorted = np.sort(cells)
+        repeated = cells_sorted[1:][cells_sorted[1:] == cells_sorted[:-1]]
+        duplicates = np.concatenate([repeated, cells[seen.ravel()[cells]]])
+        if len(duplicates):
+            row, col = divmod(int(duplicates[0]), len(codes))
+            raise ValueError(
+                f"Index contains duplicate entries, cannot reshape: {calendar[row]} {codes[col]}"
+            )
+        seen.ravel()[cells] = True
+
+        for k, value in enumerate(values_col):
+            values[rows[keep], cols[keep] + k * len(codes)] = chunk[value].to_numpy(dtype=float)[keep]
+
+    values.flush()
+    del values
+
+    np.save(os.path.join(store_dir, DATES_FILE), calendar.to_numpy(dtype='datetime64[ns]'))
+    _write_meta(store_dir, columns, index_col)
+
+    return load_panel(store_dir)
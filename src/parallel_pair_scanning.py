@@ -0,0 +1,436 @@
+import os
+import json
+import shutil
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+import pandas as pd
+import numpy as np
+import handling_dataframe as hdf
+import pair_result_formats as prf
+import engle_granger_cointegration_method as eg_coint
+import johansen_cointegration_method as jj_coint
+
+# Pooled pair scans with optional checkpoints. Only the scans of this module can be resumed: the batched
+# entry points of the method modules (find_cointegrated_pairs_batched, johansen_test_batched, ...) keep no
+# checkpoint. For a resumable scan without a pool, call the parallel_* function with n_workers=1, which
+# runs the same chunks in-process and writes the same checkpoints.
+
+# Arrays of the current scan, attached once per worker process (or set directly when running serially)
+_WORKER_ARRAYS = {}
+
+
+def _create_shared_arrays(arrays: dict) -> tuple:
+
+    # Copy every array once into its own shared memory segment; workers only receive the names
+    segments = []
+    spec = []
+    for key, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        segment = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=segment.buf)[...] = array
+        segments.append(segment)
+        spec.append((key, segment.name, array.shape, array.dtype.str))
+
+    return segments, spec
+
+
+def _release_shared_arrays(segments: list) -> None:
+    for segment in segments:
+        segment.close()
+        segment.unlink()
+
+
+def _attach_shared_arrays(spec: list) -> None:
+
+    # Worker initializer: zero-copy views over the parent's segments. The parent owns and unlinks them;
+    # pool workers share its resource tracker, so attaching again does not register a second owner
+    global _WORKER_ARRAYS
+    arrays = {}
+    segments = []
+    for key, name, shape, dtype in spec:
+        try:
+            segment = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Python < 3.13 has no track argument
+            segment = shared_memory.SharedMemory(name=name)
+        segments.append(segment)
+        arrays[key] = np.ndarray(shape, dtype=dtype, buffer=segment.buf)
+
+    # Keep the segments referenced for the lifetime of the worker
+    arrays['_segments'] = segments
+    _WORKER_ARRAYS = arrays
+
+
+def _scan_chunk(
+    method: str,
+    start: int,
+    stop: int,
+    params: dict
+) -> tuple:
+
+    # Test the pairs start:stop of the scan with the batched kernels on the attached arrays
+    arrays = _WORKER_ARRAYS
+    rows = arrays['rows'][start:stop]
+    cols = arrays['cols'][start:stop]
+
+    if method == 'engle_granger':
+        return eg_coint._engle_granger_block(
+            arrays['X'], arrays['sum_squares'], arrays['total_sum_squares'], rows, cols, **params
+        )
+
+    if method == 'johansen':
+        diagonals = {key: arrays[key] for key in ['DD', 'ZZ', 'LL', 'DZ', 'LZ', 'LD']}
+        return (jj_coint._johansen_eigenvalues_block(arrays['D'], arrays['Z'], arrays['L'], diagonals, rows, cols),)
+
+    if method == 'gatev':
+        # Pairs come in row-major upper triangle order, so a chunk covers a band of first legs:
+        # one BLAS Gram product of that band against every stock, as gatev_squared_distances.
+        # XT holds one stock per row, so the band is a contiguous block
+        XT = arrays['XT']
+        sq_norms = arrays['sq_norms']
+        if len(rows) == 0:
+            return (np.empty(0),)
+        first = rows[0]
+        gram = XT[first:rows[-1] + 1] @ XT.T
+        cross = gram[rows - first, cols]
+        return (np.maximum(sq_norms[rows] + sq_norms[cols] - 2 * cross, 0.0),)
+
+    raise ValueError(f"Unknown method: {method}")
+
+
+def _scan_fingerprint(
+    method: str,
+    arrays: dict,
+    params: dict,
+    chunk_size: int
+) -> str:
+
+    # Identity of a scan: same prepared arrays, pairs, parameters and chunking -> same checkpoint
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(json.dumps([method, params, chunk_size], sort_keys=True, default=str).encode())
+    for key in sorted(arrays):
+        array = np.ascontiguousarray(arrays[key])
+        digest.update(f"{key}{array.shape}{array.dtype.str}".encode())
+        digest.update(array.data)
+
+    return f"{method}_{digest.hexdigest()}"
+
+
+def _load_checkpoint(checkpoint_path: str) -> dict:
+
+    # Completed chunks keyed by their first pair index; half-written temporary files are ignored
+    results = {}
+    for file_name in os.listdir(checkpoint_path):
+        if file_name.startswith('chunk_') and file_name.endswith('.npz'):
+            with np.load(os.path.join(checkpoint_path, file_name)) as chunk:
+                results[int(file_name[6:-4])] = tuple(chunk[f'output_{k}'] for k in range(len(chunk.files)))
+
+    return results
+
+
+def _save_chunk(checkpoint_path: str, start: int, result: tuple) -> None:
+
+    # Write to a temporary file and rename it, so a crash never leaves a truncated chunk behind
+    file_path = os.path.join(checkpoint_path, f'chunk_{start:012d}.npz')
+    with open(file_path + '.tmp', 'wb') as file:
+        np.savez(file, **{f'output_{k}': output for k, output in enumerate(result)})
+    os.replace(file_path + '.tmp', file_path)
+
+
+def _run_chunks(
+    method: str,
+    arrays: dict,
+    params: dict,
+    n_workers: int = None,
+    chunk_size: int = 1024,
+    checkpoint_dir: str = None,
+    keep_checkpoint: bool = False
+) -> list:
+
+    """
+    Split the pair index space of a scan into fixed chunks and test them serially or on a process pool.
+    The chunks do not depend on the number of workers and are reassembled in order, and the kernels only
+    slice whole rows of C-contiguous arrays, so serial and pooled runs hit the same BLAS paths and the
+    results are identical for any worker count. With a checkpoint directory every completed chunk is written to disk
+    and a rerun with the same input and parameters only computes the missing chunks.
+
+    Parameters:
+        method (str): 'engle_granger', 'johansen' or 'gatev'.
+        arrays (dict): Prepared panel arrays of the method plus the pair index arrays 'rows' and 'cols'.
+        params (dict): Keyword arguments of the method kernel.
+        n_workers (int or None): Number of worker processes. Default is os.cpu_count(); 1 runs in-process.
+        chunk_size (int): Number of pairs per task.
+        checkpoint_dir (str or None): Directory of the on-disk checkpoints. Default is None (no checkpoint).
+        keep_checkpoint (bool): Keep the checkpoint files after the scan completes. Default is False.
+
+    Returns:
+        list: One array per kernel output, concatenated over the chunks.
+    """
+    global _WORKER_ARRAYS
+
+    n_pairs = len(arrays['rows'])
+    starts = list(range(0, n_pairs, chunk_size))
+    stops = [min(start + chunk_size, n_pairs) for start in starts]
+
+    results = {}
+    checkpoint_path = None
+    if checkpoint_dir is not None:
+        checkpoint_path = os.path.join(checkpoint_dir, _scan_fingerprint(method, arrays, params, chunk_size))
+        os.makedirs(checkpoint_path, exist_ok=True)
+        results = _load_checkpoint(checkpoint_path)
+
+    pending = [(start, stop) for start, stop in zip(starts, stops) if start not in results]
+
+    def store(start, result):
+        results[start] = result
+        if checkpoint_path is not None:
+            _save_chunk(checkpoint_path, start, result)
+
+    n_workers = min(n_workers or os.cpu_count() or 1, max(len(pending), 1))
+
+    if n_workers == 1 or len(pending) <= 1:
+        _WORKER_ARRAYS = arrays
+        try:
+            for start, stop in pending:
+                store(start, _scan_chunk(method, start, stop, params))
+        finally:
+            _WORKER_ARRAYS = {}
+    else:
+        segments, spec = _create_shared_arrays(arrays)
+        try:
+            with ProcessPoolExecutor(
+                max_workers=n_workers,
+                initializer=_attach_shared_arrays,
+                initargs=(spec,)
+            ) as pool:
+                futures = {
+                    pool.submit(_scan_chunk, method, start, stop, params): start
+                    for start, stop in pending
+                }
+                # Checkpoint each chunk as soon as it is done, whatever the completion order
+                for future in as_completed(futures):
+                    store(futures[future], future.result())
+        finally:
+            _release_shared_arrays(segments)
+
+    if checkpoint_path is not None and not keep_checkpoint:
+        shutil.rmtree(checkpoint_path, ignore_errors=True)
+
+    if not starts:
+        return []
+
+    ordered = [results[start] for start in starts]
+
+    return [np.concatenate([result[k] for result in ordered]) for k in range(len(ordered[0]))]
+
+
+def parallel_find_cointegrated_pairs(
+    df: pd.DataFrame,
+    significance_level: float = 0.05,
+    trend: str = 'c',
+    maxlag: int = None,
+    autolag: str = 'aic',
+    pairs: list = None,
+    n_workers: int = None,
+    chunk_size: int = 1024,
+    checkpoint_dir: str = None,
+    keep_checkpoint: bool = False,
+    output: str = 'dense'
+) -> tuple:
+
+    """
+    Engle-Granger test of every pair (coint(S1, S2), as in find_cointegrated_pairs) on a process pool.
+    Workers read the detrended price panel from shared memory.
+
+    Parameters:
+        df (pandas.DataFrame): Price panel with one column per stock, without missing values.
+        significance_level (float): Pairs with a p-value below this level are returned. Default is 0.05.
+        trend (str): Deterministic terms of the hedge regression. Default is 'c'.
+        maxlag (int or None): Maximum lag of the residual ADF regression. Default is coint's rule.
+        autolag (str or None): Lag selection of the residual ADF regression. Default is 'aic'.
+        pairs (list or None): Candidate pairs [stock_a, stock_b] to test. Default is every pair.
+        n_workers (int or None): Number of worker processes. Default is os.cpu_count(); 1 runs in-process.
+        chunk_size (int): Number of pairs per task. Default is 1024.
+        checkpoint_dir (str or None): Directory of resumable on-disk checkpoints. Default is None.
+        keep_checkpoint (bool): Keep the checkpoint files after the scan completes. Default is False.
+        output (str): 'dense', 'condensed' or 'sparse' score and p-value results (see pair_result_formats).
+            Default is 'dense'.
+
+    Returns:
+        tuple: score_matrix, pvalue_matrix and the list of cointegrated pairs.
+    """
+    n = df.shape[1]
+    keys = df.keys()
+
+    X_detrended, sum_squares, total_sum_squares = eg_coint._prepare_engle_granger_panel(df, trend)
+    rows, cols = hdf.pairs_to_column_positions(keys.tolist(), pairs)
+
+    arrays = {
+        'X': X_detrended,
+        'sum_squares': sum_squares,
+        'total_sum_squares': total_sum_squares,
+        'rows': rows,
+        'cols': cols
+    }
+    params = {'trend': trend, 'maxlag': maxlag, 'autolag': autolag}
+    results = _run_chunks(
+        'engle_granger', arrays, params,
+        n_workers=n_workers, chunk_size=chunk_size, checkpoint_dir=checkpoint_dir,
+        keep_checkpoint=keep_checkpoint
+    )
+
+    scores, pvalues = results if results else (np.empty(0), np.empty(0))
+
+    selected = pvalues < significance_level
+    pairs = [[keys[i], keys[j]] for i, j in zip(rows[selected], cols[selected])]
+
+    score_matrix = prf.format_pair_values(scores, rows, cols, n, 0.0, output=output, keep=selected)
+    pvalue_matrix = prf.format_pair_values(pvalues, rows, cols, n, 1.0, output=output, keep=selected)
+
+    return score_matrix, pvalue_matrix, pairs
+
+
+def parallel_johansen_statistics(
+    df: pd.DataFrame,
+    pairs: list = None,
+    n_workers: int = None,
+    chunk_size: int = 16384,
+    checkpoint_dir: str = None,
+    keep_checkpoint: bool = False
+) -> tuple:
+
+    """
+    Batched bivariate Johansen statistics (as johansen_statistics_batched) on a process pool.
+    Workers read the per-stock difference, lagged difference and lagged level series from shared memory.
+
+    Parameters:
+        df (pandas.DataFrame): Price panel with one column per stock, without missing values.
+        pairs (list or None): Candidate pairs [stock_a, stock_b] to test. Default is every pair.
+        n_workers (int or None): Number of worker processes. Default is os.cpu_count(); 1 runs in-process.
+        chunk_size (int): Number of pairs per task. Default is 16384.
+        checkpoint_dir (str or None): Directory of resumable on-disk checkpoints. Default is None.
+        keep_checkpoint (bool): Keep the checkpoint files after the scan completes. Default is False.
+
+    Returns:
+        tuple: lr1, lr2, cvt, cvm and the list of tested pairs, as johansen_statistics_batched.
+    """
+    D, Z, L = jj_coint._johansen_pair_features(df)
+    keys = df.columns.tolist()
+    rows, cols = hdf.pairs_to_column_positions(keys, pairs)
+
+    arrays = {
+        'D': D,
+        'Z': Z,
+        'L': L,
+        'DD': np.einsum('ti,ti->i', D, D),
+        'ZZ': np.einsum('ti,ti->i', Z, Z),
+        'LL': np.einsum('ti,ti->i', L, L),
+        'DZ': np.einsum('ti,ti->i', D, Z),
+        'LZ': np.einsum('ti,ti->i', L, Z),
+        'LD': np.einsum('ti,ti->i', L, D),
+        'rows': rows,
+        'cols': cols
+    }
+    results = _run_chunks(
+        'johansen', arrays, {},
+        n_workers=n_workers, chunk_size=chunk_size, checkpoint_dir=checkpoint_dir,
+        keep_checkpoint=keep_checkpoint
+    )
+    eigenvalues = results[0] if results else np.empty((0, 2))
+
+    t = D.shape[0]
+    log_complement = np.log(1 - eigenvalues)
+    lr1 = -t * np.column_stack([log_complement.sum(axis=1), log_complement[:, 1]])
+    lr2 = -t * log_complement
+
+    cvt = np.vstack([jj_coint.c_sjt(2, 0), jj_coint.c_sjt(1, 0)])
+    cvm = np.vstack([jj_coint.c_sja(2, 0), jj_coint.c_sja(1, 0)])
+
+    return lr1, lr2, cvt, cvm, [(keys[i], keys[j]) for i, j in zip(rows, cols)]
+
+
+def parallel_johansen_test(
+    df: pd.DataFrame,
+    confidence_level: int = 95,
+    check_eigen: bool = False,
+    pairs: list = None,
+    n_workers: int = None,
+    chunk_size: int = 16384,
+    checkpoint_dir: str = None,
+    keep_checkpoint: bool = False
+) -> list:
+
+    """
+    johansen_test on a process pool: pairs whose trace statistic for r <= 0 exceeds the critical value.
+
+    Parameters:
+        df (pandas.DataFrame): Price panel with one column per stock, without missing values.
+        confidence_level (int): 90, 95 or 99. Default is 95.
+        check_eigen (bool): Also require the maximum eigenvalue statistic to exceed its critical value.
+        pairs (list or None): Candidate pairs [stock_a, stock_b] to test. Default is every pair.
+        n_workers (int or None): Number of worker processes. Default is os.cpu_count(); 1 runs in-process.
+        chunk_size (int): Number of pairs per task. Default is 16384.
+        checkpoint_dir (str or None): Directory of resumable on-disk checkpoints. Default is None.
+        keep_checkpoint (bool): Keep the checkpoint files after the scan completes. Default is False.
+
+    Returns:
+        list: The cointegrating pairs as [sid_1, sid_2] lists.
+    """
+    confidence_level_col = {90: 0, 95: 1, 99: 2}[confidence_level]
+
+    lr1, lr2, cvt, cvm, tested_pairs = parallel_johansen_statistics(
+        df, pairs=pairs, n_workers=n_workers, chunk_size=chunk_size, checkpoint_dir=checkpoint_dir,
+        keep_checkpoint=keep_checkpoint
+    )
+
+    selected = lr1[:, 0] >= cvt[0, confidence_level_col]
+    if check_eigen:
+        selected &= lr2[:, 0] >= cvm[0, confidence_level_col]
+
+    return [[sid_1, sid_2] for (sid_1, sid_2), keep in zip(tested_pairs, selected) if keep]
+
+
+def parallel_gatev_squared_distances(
+    df: pd.DataFrame,
+    n_workers: int = None,
+    chunk_size: int = 65536,
+    checkpoint_dir: str = None,
+    keep_checkpoint: bool = False
+) -> tuple:
+
+    """
+    Squared Gatev (SSD) distances of every pair on a process pool, same contract as gatev_squared_distances.
+
+    Parameters:
+        df (pandas.DataFrame): Normalized prices (e.g. output of gatev_data_normalize), without missing values.
+        n_workers (int or None): Number of worker processes. Default is os.cpu_count(); 1 runs in-process.
+        chunk_size (int): Number of pairs per task. Default is 65536.
+        checkpoint_dir (str or None): Directory of resumable on-disk checkpoints. Default is None.
+        keep_checkpoint (bool): Keep the checkpoint files after the scan completes. Default is False.
+
+    Returns:
+        tuple: The condensed squared distances and the index arrays i and j.
+    """
+    X = df.to_numpy(dtype=float)
+
+    if np.isnan(X).any():
+        raise ValueError("The normalized prices contain missing values, drop or fill them first")
+
+    X = X - X.mean(axis=1, keepdims=True)
+    rows, cols = np.triu_indices(X.shape[1], k=1)
+
+    arrays = {
+        'XT': np.ascontiguousarray(X.T),
+        'sq_norms': np.einsum('ti,ti->i', X, X),
+        'rows': rows,
+        'cols': cols
+    }
+    results = _run_chunks(
+        'gatev', arrays, {},
+        n_workers=n_workers, chunk_size=chunk_size, checkpoint_dir=checkpoint_dir,
+        keep_checkpoint=keep_checkpoint
+    )
+    sq_dist = results[0] if results else np.empty(0)
+
+    return sq_dist, rows, cols
@@ -1,4 +1,5 @@
 import pandas as pd 
+from typing import Iterator
 
 
 def splitting_data_by_ratio(
@@ -27,4 +28,20 @@ def splitting_data_by_date(
     # Select the data for testing from Start Date to End Date 
     test_set = df[test_period[0]:test_period[1]]
     
-    return train_set, test_set
\ No newline at end of file
+    return train_set, test_set
+
+
+def splitting_data_walk_forward(
+    df: pd.DataFrame,
+    window: int,
+    step: int,
+    test_length: int = 0
+) -> Iterator[tuple]:
+    
+    # Rolling formation windows of `window` rows moved forward by `step` rows,
+    # each followed by the next `test_length` rows as its trading period
+    for start in range(0, len(df) - window - test_length + 1, step):
+        train_df = df.iloc[start:start + window]
+        test_df = df.iloc[start + window:start + window + test_length]
+        
+        yield train_df, test_df
@@ -1,6 +1,20 @@
-import pandas as pd 
+import hashlib
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from scipy.stats import norm
 from statsmodels.tsa.stattools import adfuller
+# MacKinnon (1994) response surface tables used by statsmodels' mackinnonp
+from statsmodels.tsa.adfvalues import (
+    _tau_maxs,
+    _tau_mins,
+    _tau_stars,
+    _tau_smallps,
+    _tau_largeps
+)
+import instrumentation as inst
 
+@inst.timed('time_series_analysis.find_integration_order')
 def find_integration_order(
     df: pd.DataFrame, 
     significance_level=0.05
@@ -31,4 +45,311 @@ def find_integration_order(
 
     result_df = pd.DataFrame(results)
     
-    return result_df
\ No newline at end of file
+    return result_df
+
+
+def mackinnonp_batched(
+    teststat: np.ndarray,
+    regression: str = 'c',
+    N: int = 1
+) -> np.ndarray:
+
+    """
+    Vectorized version of statsmodels' mackinnonp: MacKinnon's approximate p-values
+    for an array of unit-root / cointegration test statistics.
+
+    Parameters:
+        teststat (numpy.ndarray): ADF t-statistics. NaN stays NaN, -inf maps to 0.
+        regression (str): Deterministic terms of the test regression ('n', 'c', 'ct' or 'ctt').
+        N (int): The number of series believed to be I(1). 1 for ADF, 2 for a pairwise Engle-Granger test.
+
+    Returns:
+        numpy.ndarray: The p-values, same shape as teststat.
+    """
+    teststat = np.asarray(teststat, dtype=float)
+
+    maxstat = _tau_maxs[regression][N - 1]
+    minstat = _tau_mins[regression][N - 1]
+    starstat = _tau_stars[regression][N - 1]
+
+    with np.errstate(over='ignore', invalid='ignore'):
+        # The small-p polynomial is used at or below tau*, the large-p one above it
+        small_p = np.polyval(_tau_smallps[regression][N - 1][::-1], teststat)
+        large_p = np.polyval(_tau_largeps[regression][N - 1][::-1], teststat)
+        pvalue = norm.cdf(np.where(teststat <= starstat, small_p, large_p))
+
+    pvalue = np.where(teststat > maxstat, 1.0, pvalue)
+    pvalue = np.where(teststat < minstat, 0.0, pvalue)
+
+    return pvalue
+
+
+def _trend_columns(nobs: int, regression: str) -> np.ndarray:
+    # Deterministic regressors in the same form as statsmodels' add_trend: 1, t, t^2 with t = 1..nobs
+    ntrend = 0 if regression == 'n' else len(regression)
+    t = np.arange(1, nobs + 1, dtype=float)
+
+    return np.column_stack([t ** power for power in range(ntrend)]) if ntrend else np.empty((nobs, 0))
+
+
+def _adf_design(
+    X: np.ndarray,
+    xdiff: np.ndarray,
+    nlags: int,
+    nobs: int,
+    regression: str,
+    level_last: bool = False
+) -> tuple:
+
+    # Stack the ADF regressions of every column into (series, regressors, nobs) arrays, rows contiguous
+    # in time. The sample is the last nobs differences, exactly like adfuller's lagmat(trim='both')
+    start = xdiff.shape[0] - nobs
+    trend = _trend_columns(nobs, regression)
+    ntrend = trend.shape[1]
+    n_regressors = ntrend + 1 + nlags
+
+    if level_last:
+        # [trend, lagged differences, lagged level]: the t-value of the last column is the ADF statistic
+        level_col = n_regressors - 1
+        lag_cols = range(ntrend, ntrend + nlags)
+    else:
+        # [trend, lagged level, lagged differences]: nested leading blocks are the autolag candidates
+        level_col = ntrend
+        lag_cols = range(ntrend + 1, n_regressors)
+
+    Z = np.empty((X.shape[1], n_regressors, nobs))
+    Z[:, :ntrend, :] = trend.T[None, :, :]
+    Z[:, level_col, :] = X.T[:, start:start + nobs]
+    xdiff_t = np.ascontiguousarray(xdiff.T)
+    for lag, col in enumerate(lag_cols, start=1):
+        Z[:, col, :] = xdiff_t[:, start - lag:start - lag + nobs]
+
+    y = xdiff_t[:, start:]
+
+    return Z, y
+
+
+def _nested_least_squares(Z: np.ndarray, y: np.ndarray) -> tuple:
+
+    # One Cholesky factorisation of Z'Z solves every nested model Z[:, :q] at once:
+    # the factor of a leading block is the leading block of the factor, so with L w = Z'y
+    # the SSR of the first q regressors is y'y - sum(w[:q]^2) and the t-value of the
+    # q-th regressor in that model is w[q-1] / s_q
+    ZtZ = np.matmul(Z, Z.transpose(0, 2, 1))
+    Zty = np.matmul(Z, y[..., None])[..., 0]
+    yty = np.einsum('kn,kn->k', y, y)
+
+    L = np.linalg.cholesky(ZtZ)
+    w = np.linalg.solve(L, Zty[..., None])[..., 0]
+    ssr = yty[:, None] - np.cumsum(w ** 2, axis=1)
+
+    return w, np.maximum(ssr, 0.0)
+
+
+def adfuller_batched(
+    X: np.ndarray,
+    maxlag: int = None,
+    regression: str = 'c',
+    autolag: str = 'aic'
+) -> tuple:
+
+    """
+    Augmented Dickey-Fuller test for every column of a 2D array at once. Reproduces
+    statsmodels' adfuller (same lag search sample, information criteria and final regression)
+    but solves all columns' regressions as stacked array operations.
+
+    Parameters:
+        X (numpy.ndarray): Array of shape (nobs, n_series), one series per column, without NaN.
+        maxlag (int or None): Maximum lag included in the test. Default is adfuller's 12*(nobs/100)^{1/4} rule.
+        regression (str): Deterministic terms of the test regression ('n', 'c', 'ct' or 'ctt').
+        autolag (str or None): 'aic', 'bic', 't-stat' or None to use maxlag lags for every series.
+
+    Returns:
+        tuple: Arrays with the ADF statistic, the MacKinnon p-value, the number of lags used and
+        the number of observations of the final regression of every column. Constant columns are not
+        tested: NaN statistic and p-value, -1 lags and observations.
+    """
+    X = np.asarray(X, dtype=float)
+    if X.ndim == 1:
+        X = X[:, None]
+
+    nobs_total, n_series = X.shape
+    ntrend = 0 if regression == 'n' else len(regression)
+
+    if maxlag is None:
+        # from Greene referencing Schwert 1989, -1 for the diff
+        maxlag = int(np.ceil(12.0 * np.power(nobs_total / 100.0, 1 / 4.0)))
+        maxlag = min(nobs_total // 2 - ntrend - 1, maxlag)
+        if maxlag < 0:
+            raise ValueError("sample size is too short to use selected regression component")
+    elif maxlag > nobs_total // 2 - ntrend - 1:
+        raise ValueError(
+            "maxlag must be less than (nobs/2 - 1 - ntrend) "
+            "where n trend is the number of included deterministic regressors"
+        )
+
+    # adfuller rejects constant input: those columns are left out of the batch and get NaN / -1 below
+    constant = X.max(axis=0) == X.min(axis=0)
+    if np.any(constant):
+        tested = np.flatnonzero(~constant)
+        adfstat = np.full(n_series, np.nan)
+        pvalue = np.full(n_series, np.nan)
+        usedlag = np.full(n_series, -1)
+        nobs_used = np.full(n_series, -1)
+        if len(tested):
+            (
+                adfstat[tested], pvalue[tested], usedlag[tested], nobs_used[tested]
+            ) = adfuller_batched(X[:, tested], maxlag=maxlag, regression=regression, autolag=autolag)
+        return adfstat, pvalue, usedlag, nobs_used
+
+    xdiff = np.diff(X, axis=0)
+
+    if autolag:
+        # Lag search on the common sample of the longest model so that the criteria are comparable
+        nobs = xdiff.shape[0] - maxlag
+        Z, y = _adf_design(X, xdiff, maxlag, nobs, regression)
+        w, ssr = _nested_least_squares(Z, y)
+
+        # Candidate p lags uses the first ntrend + 1 + p regressors
+        n_params = np.arange(ntrend + 1, ntrend + maxlag + 2)
+        ssr = ssr[:, ntrend:]
+
+        if autolag == 'aic':
+            criteria = nobs * np.log(ssr / nobs) + 2 * n_params
+            usedlag = np.argmin(criteria, axis=1)
+        elif autolag == 'bic':
+            criteria = nobs * np.log(ssr / nobs) + np.log(nobs) * n_params
+            usedlag = np.argmin(criteria, axis=1)
+        elif autolag == 't-stat':
+            # Longest lag whose last lagged difference is significant at the 5% level
+            t_last = w[:, ntrend:] / np.sqrt(ssr / (nobs - n_params))
+            significant = np.abs(t_last) >= 1.6448536269514722
+            significant[:, 0] = True
+            usedlag = maxlag - np.argmax(significant[:, ::-1], axis=1)
+        else:
+            raise ValueError("autolag must be 'aic', 'bic', 't-stat' or None")
+    else:
+        usedlag = np.full(n_series, maxlag)
+
+    adfstat = np.empty(n_series)
+    nobs_used = np.empty(n_series, dtype=int)
+
+    # Rerun the regression with the selected lag, one stacked solve per distinct lag length
+    for lag in np.unique(usedlag):
+        cols = np.flatnonzero(usedlag == lag)
+        nobs = xdiff.shape[0] - lag
+        Z, y = _adf_design(X[:, cols], xdiff[:, cols], lag, nobs, regression, level_last=True)
+        w, ssr = _nested_least_squares(Z, y)
+
+        sigma = np.sqrt(ssr[:, -1] / (nobs - Z.shape[1]))
+        adfstat[cols] = w[:, -1] / sigma
+        nobs_used[cols] = nobs
+
+    pvalue = mackinnonp_batched(adfstat, regression=regression, N=1)
+
+    return adfstat, pvalue, usedlag, nobs_used
+
+
+# Per-ticker integration orders already computed, keyed by the series content and the test settings.
+# Least recently used entries are evicted beyond INTEGRATION_ORDER_CACHE_SIZE, so long sessions that
+# test many windows (walk-forward, screening) keep a bounded cache
+INTEGRATION_ORDER_CACHE_SIZE = 4096
+_INTEGRATION_ORDER_CACHE = OrderedDict()
+
+
+def clear_integration_order_cache() -> None:
+    _INTEGRATION_ORDER_CACHE.clear()
+
+
+def _cache_integration_order(key: tuple, order) -> None:
+    _INTEGRATION_ORDER_CACHE[key] = order
+    _INTEGRATION_ORDER_CACHE.move_to_end(key)
+    while len(_INTEGRATION_ORDER_CACHE) > INTEGRATION_ORDER_CACHE_SIZE:
+        _INTEGRATION_ORDER_CACHE.popitem(last=False)
+
+
+@inst.timed('time_series_analysis.find_integration_order_batched')
+def find_integration_order_batched(
+    df: pd.DataFrame,
+    significance_level: float = 0.05,
+    max_order: int = 3,
+    use_cache: bool = True
+) -> pd.DataFrame:
+
+    """
+    Batched version of find_integration_order: the ADF tests of every column still undecided at a given
+    differencing order run together in adfuller_batched (regression 'c', AIC lag search). Leading and trailing
+    missing values (late listings, delistings) are dropped per column instead of dropping the rows of the whole
+    frame, and columns with the same number of valid observations are stacked into one batch. Missing values
+    inside a series would join the prices across the gap, so they raise instead.
+
+    Parameters:
+        df (pandas.DataFrame): One series per column, missing values only at the start or the end.
+        significance_level (float): ADF p-value at or below which a series is stationary. Default is 0.05.
+        max_order (int): Maximum number of differences. Columns still non-stationary after max_order
+            differences (or constant, or too short to test) get <NA>. Default is 3.
+        use_cache (bool): Reuse and store per-ticker results in the module cache. Default is True.
+
+    Returns:
+        pandas.DataFrame: 'Column Name' and 'Integration Order' (nullable Int64) of every column,
+        same layout as find_integration_order.
+    """
+    orders = {}
+    keys = {}
+    groups = {}
+
+    # A missing value after the first and before the last valid one is an interior gap
+    valid = df.notna().to_numpy()
+    after_first = np.cumsum(valid, axis=0) > 0
+    before_last = np.cumsum(valid[::-1], axis=0)[::-1] > 0
+    gaps = (~valid & after_first & before_last).any(axis=0)
+    if gaps.any():
+        raise ValueError(
+            f"Missing values inside the series of {df.columns[gaps].tolist()}, fill or drop those rows first"
+        )
+
+    for col in df.columns:
+        values = df[col].dropna().to_numpy(dtype=float)
+        keys[col] = (
+            hashlib.blake2b(values.tobytes(), digest_size=16).hexdigest(), significance_level, max_order
+        )
+        if use_cache and keys[col] in _INTEGRATION_ORDER_CACHE:
+            _INTEGRATION_ORDER_CACHE.move_to_end(keys[col])
+            orders[col] = _INTEGRATION_ORDER_CACHE[keys[col]]
+        else:
+            groups.setdefault(len(values), []).append((col, values))
+
+    for length, members in groups.items():
+        cols = [col for col, _ in members]
+        X = np.column_stack([values for _, values in members])
+        undecided = np.ones(len(cols), dtype=bool)
+        result = np.full(len(cols), -1)
+
+        for order in range(max_order + 1):
+            # Each round differences once more and tests the columns not yet stationary
+            X_order = np.diff(X[:, undecided], n=order, axis=0)
+            try:
+                pvalue = adfuller_batched(X_order, regression='c', autolag='aic')[1]
+            except ValueError:
+                # Too few observations left for the lag search
+                break
+
+            stationary = pvalue <= significance_level
+            positions = np.flatnonzero(undecided)
+            result[positions[stationary]] = order
+            undecided[positions[stationary]] = False
+            # Constant series cannot be tested at all
+            undecided[positions[np.isnan(pvalue)]] = False
+
+            if not undecided.any():
+                break
+
+        for col, order in zip(cols, result):
+            orders[col] = pd.NA if order < 0 else int(order)
+            if use_cache:
+                _cache_integration_order(keys[col], orders[col])
+
+    return pd.DataFrame({
+        'Column Name': list(df.columns),
+        'Integration Order': pd.array([orders[col] for col in df.columns], dtype='Int64')
+    })
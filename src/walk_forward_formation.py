@@ -0,0 +1,136 @@
+import pandas as pd
+import numpy as np
+import gatev_distance_method as gatev_dist
+import incremental_pair_statistics as inc_stats
+import splitting_data as splitting_data
+
+METHODS = ['Gatev Pairs', 'EG Pairs', 'EG Pairs Swap', 'Johansen Pairs']
+
+
+def walk_forward_formation(
+    df: pd.DataFrame,
+    window: int,
+    step: int,
+    methods: list = None,
+    top_values: int = 10,
+    significance_level: float = 0.05,
+    confidence_level: int = 95
+) -> pd.DataFrame:
+
+    """
+    Pairs formation on every rolling formation window of splitting_data_walk_forward (test_length=0).
+    A single incremental state slides through the panel: each step adds the new bars and removes the old
+    ones from the moment sums instead of rebuilding them per window, and only the final selections (Gatev
+    top pairs, residual ADF, Johansen) are evaluated on every window.
+
+    Parameters:
+        df (pandas.DataFrame): Price panel, one column per stock, without missing values.
+        window (int): Number of bars of a formation window.
+        step (int): Number of bars between two consecutive windows.
+        methods (list or None): Subset of 'Gatev Pairs', 'EG Pairs', 'EG Pairs Swap' and 'Johansen Pairs'.
+            Default is all four.
+        top_values (int): Number of Gatev pairs selected per window. Default is 10.
+        significance_level (float): Engle-Granger significance level. Default is 0.05.
+        confidence_level (int): Johansen trace test confidence level (90, 95 or 99). Default is 95.
+
+    Returns:
+        pandas.DataFrame: One row per (window, method, selected pair) with the window number, its first and
+        last date and the statistic of the pair (Gatev distance, Engle-Granger p-value, NaN for Johansen).
+    """
+    methods = METHODS if methods is None else methods
+    unknown = set(methods) - set(METHODS)
+    if unknown:
+        raise ValueError(f"Unknown methods: {sorted(unknown)}")
+    if step < 1 or window > len(df):
+        raise ValueError("step must be positive and window at most the number of bars")
+
+    state = inc_stats.init_pair_state(df.iloc[:window], window=window)
+    tickers = state['tickers']
+    position_of = {ticker: i for i, ticker in enumerate(tickers)}
+    rows = []
+
+    windows = splitting_data.splitting_data_walk_forward(df, window=window, step=step)
+    for number, (train_df, _) in enumerate(windows):
+        # Slide the state to the window [end - window, end); with step > window the bars between two
+        # windows go through the ring buffer and are dropped again
+        end = window + number * step
+        for position in range(end - step if number else end, end):
+            inc_stats.append_bar(state, df.iloc[position])
+
+        window_dates = (train_df.index[0], train_df.index[-1])
+        selected = {}
+
+        if 'Gatev Pairs' in methods:
+            sq_dist, row_idx, col_idx = inc_stats.incremental_gatev_squared_distances(state)
+            chosen = gatev_dist._smallest_positions(sq_dist, top_values)
+            distances = np.sqrt(sq_dist[chosen])
+            order = np.lexsort((chosen, distances))
+            selected['Gatev Pairs'] = [
+                (tickers[row_idx[k]], tickers[col_idx[k]], distance)
+                for k, distance in zip(chosen[order], distances[order])
+            ]
+
+        for method, swap in [('EG Pairs', False), ('EG Pairs Swap', True)]:
+            if method in methods:
+                _, pvalue_matrix, pairs = inc_stats.incremental_engle_granger(
+                    state, significance_level=significance_level, swap=swap
+                )
+                selected[method] = [
+                    (a, b, pvalue_matrix[position_of[a], position_of[b]]) for a, b in pairs
+                ]
+
+        if 'Johansen Pairs' in methods:
+            pairs = inc_stats.incremental_johansen_test(state, confidence_level=confidence_level)
+            selected['Johansen Pairs'] = [(a, b, np.nan) for a, b in pairs]
+
+        for method in methods:
+            for stock_a, stock_b, statistic in selected[method]:
+                rows.append((number, *window_dates, method, stock_a, stock_b, statistic))
+
+    df_walk_forward = pd.DataFrame(
+        rows,
+        columns=['Window', 'Start Date', 'End Date', 'Method', 'Stock A', 'Stock B', 'Statistic']
+    )
+    # Windows without any selected pair still count in the stability panel
+    df_walk_forward.attrs['n_windows'] = number + 1
+
+    return df_walk_forward
+
+
+def pair_stability_panel(df_walk_forward: pd.DataFrame) -> pd.DataFrame:
+
+    """
+    Compact pair-stability panel of a walk-forward study: one row per (method, pair) ever selected,
+    one boolean column per window, followed by the number of windows selecting the pair, its selection
+    frequency and its longest run of consecutive windows.
+
+    Parameters:
+        df_walk_forward (pandas.DataFrame): Output of walk_forward_formation.
+
+    Returns:
+        pandas.DataFrame: The panel, sorted by method and decreasing frequency.
+    """
+    n_windows = df_walk_forward.attrs.get(
+        'n_windows', df_walk_forward['Window'].max() + 1 if len(df_walk_forward) else 0
+    )
+
+    panel = pd.crosstab(
+        [df_walk_forward['Method'], df_walk_forward['Stock A'], df_walk_forward['Stock B']],
+        df_walk_forward['Window']
+    ).reindex(columns=range(n_windows), fill_value=0) > 0
+
+    selected = panel.to_numpy()
+
+    # Longest run of True per row: position minus position of the last False before it
+    positions = np.arange(n_windows)
+    last_false = np.maximum.accumulate(np.where(selected, -1, positions), axis=1) if n_windows else selected
+    runs = np.where(selected, positions - last_false, 0)
+
+    panel['Windows Selected'] = selected.sum(axis=1)
+    panel['Frequency'] = panel['Windows Selected'] / max(n_windows, 1)
+    panel['Longest Streak'] = runs.max(axis=1) if n_windows else 0
+
+    panel = panel.sort_values(['Frequency', 'Longest Streak'], ascending=False, kind='stable')
+    panel = panel.sort_index(level='Method', kind='stable', sort_remaining=False)
+
+    return panel
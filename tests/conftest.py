@@ -0,0 +1,40 @@
+import os
+import sys
+import glob
+import warnings
+import numpy as np
+import pandas as pd
+import pytest
+
+# The modules of src import each other by name, as in the notebooks and the pipeline
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in [os.path.join(ROOT_DIR, 'src'), os.path.join(ROOT_DIR, 'benchmarks')]:
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from synthetic_universe import generate_universe  # noqa: E402
+
+PROCESSED_FILES = sorted(glob.glob(os.path.join(ROOT_DIR, 'data', 'processed', '*', '*_24112023.csv')))
+
+
+def load_processed(path: str, n_stocks: int = None) -> pd.DataFrame:
+
+    # Price columns of a processed sector file, rows without any missing price, as in the notebooks
+    df = pd.read_csv(path, index_col=0).select_dtypes('number').dropna()
+    return df if n_stocks is None else df.iloc[:, :n_stocks]
+
+
+@pytest.fixture
+def log_prices() -> pd.DataFrame:
+
+    # Seeded random-walk log prices with planted cointegrated pairs
+    return np.log(generate_universe(12, 300, n_cointegrated_pairs=3, seed=7)['prices'])
+
+
+@pytest.fixture(autouse=True)
+def _quiet_statsmodels():
+
+    # statsmodels announces future changes of its return types on every call
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', FutureWarning)
+        yield
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+import engle_granger_cointegration_method as eg_coint
+from conftest import PROCESSED_FILES, load_processed
+
+
+def test_batched_matches_find_cointegrated_pairs(log_prices):
+    score, pvalue, pairs = eg_coint.find_cointegrated_pairs(log_prices, visualize=False)
+    score_batched, pvalue_batched, pairs_batched = eg_coint.find_cointegrated_pairs_batched(
+        log_prices, visualize=False
+    )
+
+    np.testing.assert_allclose(score_batched, score, rtol=1e-8, atol=1e-10)
+    np.testing.assert_allclose(pvalue_batched, pvalue, rtol=1e-8, atol=1e-10)
+    assert pairs_batched == pairs
+
+
+@pytest.mark.parametrize('path', PROCESSED_FILES[:3])
+def test_batched_matches_find_cointegrated_pairs_on_repo_data(path):
+    df = np.log(load_processed(path, n_stocks=8))
+
+    _, pvalue, pairs = eg_coint.find_cointegrated_pairs(df, visualize=False)
+    _, pvalue_batched, pairs_batched = eg_coint.find_cointegrated_pairs_batched(df, visualize=False, block_size=5)
+
+    np.testing.assert_allclose(pvalue_batched, pvalue, rtol=1e-8, atol=1e-10)
+    assert pairs_batched == pairs
+
+
+def test_batched_subset_of_pairs(log_prices):
+    keys = log_prices.columns.tolist()
+    subset = [[keys[0], keys[3]], [keys[2], keys[5]]]
+
+    _, pvalue, _ = eg_coint.find_cointegrated_pairs(log_prices, visualize=False)
+    _, pvalue_subset, _ = eg_coint.find_cointegrated_pairs_batched(log_prices, pairs=subset, visualize=False)
+
+    assert pvalue_subset[0, 3] == pytest.approx(pvalue[0, 3])
+    assert pvalue_subset[2, 5] == pytest.approx(pvalue[2, 5])
+    assert pvalue_subset[0, 1] == 1.0
+
+
+def test_bidirectional_matches_both_directions(log_prices):
+    _, pvalue, pairs = eg_coint.find_cointegrated_pairs(log_prices, visualize=False)
+    _, pvalue_swap, pairs_swap = eg_coint.find_cointegrated_pairs_swap(log_prices, visualize=False)
+
+    result = eg_coint.find_cointegrated_pairs_bidirectional(log_prices, visualize=False)
+
+    np.testing.assert_allclose(result['pvalue_matrix'], pvalue, rtol=1e-8, atol=1e-10)
+    np.testing.assert_allclose(result['pvalue_matrix_swap'], pvalue_swap, rtol=1e-8, atol=1e-10)
+    assert result['pairs'] == pairs
+    assert result['pairs_swap'] == pairs_swap
+    assert sorted(map(tuple, result['pairs_either'])) == sorted(set(map(tuple, pairs + pairs_swap)))
+    assert sorted(map(tuple, result['pairs_both'])) == sorted(set(map(tuple, pairs)) & set(map(tuple, pairs_swap)))
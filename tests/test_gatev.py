@@ -0,0 +1,56 @@
+import itertools
+import numpy as np
+import pytest
+from scipy.spatial.distance import pdist
+import gatev_distance_method as gatev_dist
+from synthetic_universe import generate_universe
+from conftest import PROCESSED_FILES, load_processed
+
+
+@pytest.fixture
+def normalized():
+    prices = generate_universe(40, 250, seed=11)['prices']
+    return gatev_dist.gatev_data_normalize(prices, visualize=False)
+
+
+def _brute_force_pairs(df, top_values):
+    # Every pair sorted by distance, ties by itertools.combinations order
+    distances = pdist(df.to_numpy().T)
+    pairs = list(itertools.combinations(df.columns, 2))
+    order = np.lexsort((np.arange(len(distances)), distances))[:top_values]
+    return [list(pairs[k]) for k in order], distances[order]
+
+
+def test_squared_distances_match_pdist(normalized):
+    sq_dist, row_idx, col_idx = gatev_dist.gatev_squared_distances(normalized)
+
+    np.testing.assert_allclose(sq_dist, pdist(normalized.to_numpy().T, 'sqeuclidean'), rtol=1e-9)
+    assert list(zip(row_idx, col_idx)) == list(itertools.combinations(range(normalized.shape[1]), 2))
+
+
+@pytest.mark.parametrize('top_values', [1, 10, 50])
+def test_smallest_pairs_match_brute_force(normalized, top_values):
+    pairs, distances = gatev_dist.gatev_smallest_pairs(normalized, top_values=top_values)
+    expected_pairs, expected_distances = _brute_force_pairs(normalized, top_values)
+
+    assert pairs == expected_pairs
+    np.testing.assert_allclose(distances, expected_distances, rtol=1e-12)
+
+
+@pytest.mark.parametrize('path', PROCESSED_FILES[::3])
+def test_smallest_pairs_on_repo_data(path):
+    normalized = gatev_dist.gatev_data_normalize(load_processed(path), visualize=False)
+
+    pairs, _ = gatev_dist.gatev_smallest_pairs(normalized, top_values=10)
+
+    assert pairs == _brute_force_pairs(normalized, 10)[0]
+
+
+def test_duplicate_series_tie_at_zero(normalized):
+    df = normalized.copy()
+    df['copy'] = df.iloc[:, 5]
+
+    pairs, distances = gatev_dist.gatev_smallest_pairs(df, top_values=1)
+
+    assert pairs == [[df.columns[5], 'copy']]
+    assert distances[0] == 0.0
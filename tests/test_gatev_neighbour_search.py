@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+import gatev_distance_method as gatev_dist
+import gatev_neighbour_search as neighbour_search
+from synthetic_universe import generate_universe
+
+
+@pytest.fixture(scope='module')
+def normalized():
+    prices = generate_universe(300, 120, seed=5)['prices']
+    return gatev_dist.gatev_data_normalize(prices, visualize=False)
+
+
+@pytest.mark.parametrize('top_values', [1, 10, 40])
+def test_exact_top_pairs_match_gatev_smallest_pairs(normalized, top_values):
+    index = neighbour_search.build_gatev_neighbour_index(normalized, mode='exact')
+
+    pairs, distances = neighbour_search.gatev_top_pairs(index, top_values=top_values)
+    expected_pairs, expected_distances = gatev_dist.gatev_smallest_pairs(normalized, top_values=top_values)
+
+    assert pairs == expected_pairs
+    np.testing.assert_allclose(distances, expected_distances, rtol=1e-9)
+
+    # Per-stock neighbour lists give the same pairs
+    assert neighbour_search.gatev_top_pairs(index, top_values, neighbours_per_stock=top_values)[0] == expected_pairs
+
+
+def test_exact_neighbours_have_full_recall(normalized):
+    index = neighbour_search.build_gatev_neighbour_index(normalized, mode='exact')
+
+    report = neighbour_search.gatev_neighbour_recall(index, k=5, n_queries=100)
+
+    assert report['recall_min'] == 1.0
+
+
+def test_approximate_recall(normalized):
+    index = neighbour_search.build_gatev_neighbour_index(normalized, mode='approximate')
+
+    report = neighbour_search.gatev_neighbour_recall(index, k=5, n_queries=100)
+
+    assert report['recall_mean'] >= 0.95
+
+
+def test_single_stock_gives_empty_results(normalized):
+    index = neighbour_search.build_gatev_neighbour_index(normalized.iloc[:, :1])
+
+    pairs, distances = neighbour_search.gatev_top_pairs(index)
+
+    assert pairs == [] and len(distances) == 0
+    assert neighbour_search.gatev_nearest_neighbours(index).empty
+
+
+def test_duplicate_series(normalized):
+    df = pd.concat([normalized.iloc[:, :20], normalized.iloc[:, [3]].add_suffix('_copy')], axis=1)
+    index = neighbour_search.build_gatev_neighbour_index(df)
+
+    pairs, distances = neighbour_search.gatev_top_pairs(index, top_values=1)
+
+    assert pairs == [[df.columns[3], df.columns[3] + '_copy']]
+    assert distances[0] == 0.0
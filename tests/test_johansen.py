@@ -0,0 +1,40 @@
+import itertools
+import numpy as np
+import pytest
+from statsmodels.tsa.vector_ar.vecm import coint_johansen
+import johansen_cointegration_method as jj_coint
+from conftest import PROCESSED_FILES, load_processed
+
+
+def test_statistics_match_coint_johansen(log_prices):
+    lr1, lr2, cvt, cvm, pairs = jj_coint.johansen_statistics_batched(log_prices, block_size=7)
+
+    assert pairs == list(itertools.combinations(log_prices.columns, 2))
+    for k, (sid_1, sid_2) in enumerate(pairs):
+        result = coint_johansen(log_prices[[sid_1, sid_2]], 0, 1)
+        np.testing.assert_allclose(lr1[k], result.lr1, rtol=1e-7)
+        np.testing.assert_allclose(lr2[k], result.lr2, rtol=1e-7)
+        np.testing.assert_allclose(cvt, result.cvt)
+        np.testing.assert_allclose(cvm, result.cvm)
+
+
+@pytest.mark.parametrize('path', PROCESSED_FILES)
+def test_batched_matches_johansen_test_on_repo_data(path):
+    df = np.log(load_processed(path, n_stocks=10))
+
+    assert jj_coint.johansen_test_batched(df) == jj_coint.johansen_test(df)
+
+
+def test_all_missing_dates_are_dropped(log_prices):
+    df = log_prices.copy()
+    df.iloc[[0, 40, 41, -1]] = np.nan
+
+    assert jj_coint.johansen_test_batched(df) == jj_coint.johansen_test(df)
+
+
+def test_partly_missing_dates_raise(log_prices):
+    df = log_prices.copy()
+    df.iloc[40, 2] = np.nan
+
+    with pytest.raises(ValueError):
+        jj_coint.johansen_test_batched(df)
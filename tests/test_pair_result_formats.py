@@ -0,0 +1,38 @@
+import itertools
+import numpy as np
+import pytest
+from scipy.spatial.distance import squareform
+import pair_result_formats as prf
+import engle_granger_cointegration_method as eg_coint
+
+
+@pytest.mark.parametrize('n', [2, 3, 17])
+def test_condensed_index_follows_combinations_order(n):
+    i, j = np.array(list(itertools.combinations(range(n), 2))).T
+
+    np.testing.assert_array_equal(prf.condensed_index(i, j, n), np.arange(n * (n - 1) // 2))
+    np.testing.assert_array_equal(np.column_stack(prf.condensed_pair_positions(np.arange(len(i)), n)),
+                                  np.column_stack([i, j]))
+    assert prf.n_from_condensed(len(i)) == n
+
+
+def test_condensed_matches_scipy_layout():
+    values = np.arange(1, 22, dtype=float)
+
+    np.testing.assert_array_equal(np.triu(prf.to_dense(values, fill=0.0)), np.triu(squareform(values)))
+
+
+def test_formats_round_trip(log_prices):
+    dense = eg_coint.find_cointegrated_pairs_batched(log_prices, visualize=False)[1]
+    condensed = eg_coint.find_cointegrated_pairs_batched(log_prices, visualize=False, output='condensed')[1]
+    sparse = eg_coint.find_cointegrated_pairs_batched(log_prices, visualize=False, output='sparse')[1]
+
+    np.testing.assert_allclose(prf.to_dense(condensed, fill=1.0), dense, rtol=1e-6)
+    kept = dense < 0.05
+    np.testing.assert_allclose(prf.to_dense(sparse)[kept], dense[kept], rtol=1e-6)
+    assert (prf.to_dense(sparse)[~kept] == 1.0).all()
+
+
+def test_condensed_requires_fill():
+    with pytest.raises(ValueError):
+        prf.to_dense(np.zeros(3))
@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+from statsmodels.stats.multitest import multipletests
+from statsmodels.tsa.stattools import coint
+from statsmodels.tsa.vector_ar.vecm import coint_johansen
+
+import pair_significance as ps
+from conftest import generate_universe
+
+
+@pytest.fixture
+def pvalues() -> np.ndarray:
+
+    # Mixture of true effects and nulls, with ties and a missing value
+    rng = np.random.default_rng(3)
+    values = np.concatenate([rng.uniform(0, 0.01, 15), rng.uniform(0, 1, 85), [0.02, 0.02, 0.5, 0.5]])
+    values[7] = np.nan
+    return values
+
+
+@pytest.mark.parametrize('method', ps.CORRECTIONS)
+def test_adjust_pvalues_matches_multipletests(pvalues, method):
+    valid = ~np.isnan(pvalues)
+    expected = multipletests(pvalues[valid], method=method)[1]
+    adjusted = ps.adjust_pvalues(pvalues, method=method)
+    np.testing.assert_allclose(adjusted[valid], expected, rtol=1e-12)
+    assert np.isnan(adjusted[~valid]).all()
+
+
+@pytest.mark.parametrize('method', ps.CORRECTIONS)
+def test_adjust_pvalues_of_the_smallest_equals_the_full_family(pvalues, method):
+    # A sparse result keeps only the smallest p-values; the others count as p-values of 1
+    p = np.sort(pvalues[~np.isnan(pvalues)])
+    kept = p[:30]
+    padded = np.concatenate([kept, np.ones(len(p) - len(kept))])
+    expected = ps.adjust_pvalues(padded, method=method)[:30]
+    np.testing.assert_allclose(ps.adjust_pvalues(kept, method=method, n_tests=len(p)), expected, rtol=1e-12)
+
+
+def test_adjust_pvalues_rejects_bad_arguments(pvalues):
+    with pytest.raises(ValueError):
+        ps.adjust_pvalues(pvalues, method='sidak')
+    with pytest.raises(ValueError):
+        ps.adjust_pvalues(pvalues, n_tests=10)
+
+
+def test_correct_pair_pvalues_agrees_across_formats():
+    rng = np.random.default_rng(5)
+    n = 9
+    tickers = [f'S{k}' for k in range(n)]
+    dense = np.ones((n, n))
+    rows, cols = np.triu_indices(n, k=1)
+    dense[rows, cols] = np.concatenate([rng.uniform(0, 0.002, 6), rng.uniform(0, 1, len(rows) - 6)])
+
+    by_dense = ps.correct_pair_pvalues(dense, tickers)
+    by_condensed = ps.correct_pair_pvalues(dense[rows, cols], tickers)
+    assert by_dense['pairs'] == by_condensed['pairs'] and len(by_dense['pairs']) >= 6
+    np.testing.assert_allclose(by_condensed['adjusted'], by_dense['adjusted'][rows, cols], rtol=1e-6)
+    np.testing.assert_allclose(
+        by_dense['adjusted'][rows, cols], multipletests(dense[rows, cols], method='fdr_bh')[1], rtol=1e-12
+    )
+
+
+def test_bootstrap_statistics_match_statsmodels(log_prices):
+    df = log_prices.iloc[:, :5]
+    df_pvalues = ps.bootstrap_pair_pvalues(df, n_boot=3, seed=1)
+    for _, row in df_pvalues.iterrows():
+        S1, S2 = df[row['Stock A']], df[row['Stock B']]
+        assert row['EG Statistic'] == pytest.approx(coint(S1, S2, maxlag=1, autolag=None)[0], rel=1e-8)
+        trace = coint_johansen(df[[row['Stock A'], row['Stock B']]], det_order=0, k_ar_diff=1).lr1[0]
+        assert row['Johansen Trace'] == pytest.approx(trace, rel=1e-8)
+    assert df_pvalues.attrs['n_boot'] == 3
+    assert df_pvalues.attrs['min_pvalue'] == pytest.approx(1 / (1 + 3 * len(df_pvalues)))
+
+
+def test_bootstrap_is_reproducible_from_the_seed(log_prices):
+    first = ps.bootstrap_pair_pvalues(log_prices, n_boot=9, block_length=5, seed=11)
+    again = ps.bootstrap_pair_pvalues(log_prices, n_boot=9, block_length=5, seed=11)
+    other = ps.bootstrap_pair_pvalues(log_prices, n_boot=9, block_length=5, seed=12)
+    assert first.equals(again)
+    assert not first['EG Bootstrap P-Value'].equals(other['EG Bootstrap P-Value'])
+
+    # The pair's own null distribution: resolution 1 / (n_boot + 1)
+    unpooled = ps.bootstrap_pair_pvalues(log_prices, n_boot=9, block_length=5, seed=11, pooled=False)
+    assert (unpooled['EG Bootstrap P-Value'] * 10).round(9).mod(1).eq(0).all()
+    assert unpooled['EG Statistic'].equals(first['EG Statistic'])
+
+
+def test_bootstrap_with_deadline_equals_the_same_number_of_replicates(log_prices):
+    limited = ps.bootstrap_pair_pvalues(log_prices, n_boot=10_000, seed=4, max_seconds=0.05)
+    assert 1 <= limited.attrs['n_boot'] < 10_000
+    assert limited.equals(ps.bootstrap_pair_pvalues(log_prices, n_boot=limited.attrs['n_boot'], seed=4))
+
+
+def test_bootstrap_selects_only_planted_pairs():
+    universe = generate_universe(12, 300, n_cointegrated_pairs=3, seed=7)
+    df_pvalues = ps.bootstrap_pair_pvalues(np.log(universe['prices']), methods=['engle_granger'], n_boot=49)
+    selected = ps.select_significant_pairs(df_pvalues, 'EG Bootstrap P-Value', alpha=0.05)
+    planted = {frozenset(pair) for pair in universe['pairs']}
+    assert selected and {frozenset(pair) for pair in selected} <= planted
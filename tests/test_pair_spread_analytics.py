@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+import pytest
+import statsmodels.api as sm
+import pair_spread_analytics as spread_analytics
+
+
+@pytest.fixture
+def prices(log_prices):
+    return np.exp(log_prices)
+
+
+def _ols(y, x):
+    return sm.OLS(y, sm.add_constant(x)).fit().params
+
+
+def test_hedge_ratio_and_half_life_match_ols(prices):
+    train, test = prices.iloc[:200], prices.iloc[200:]
+    pairs = [[prices.columns[0], prices.columns[1]], [prices.columns[4], prices.columns[2]]]
+
+    result = spread_analytics.pair_spread_analytics(pairs, train, test)
+    summary = result['summary']
+
+    for k, (stock_a, stock_b) in enumerate(pairs):
+        log_train = np.log(train)
+        intercept, hedge_ratio = _ols(log_train[stock_a].to_numpy(), log_train[stock_b].to_numpy())
+        assert summary['Hedge Ratio'][k] == pytest.approx(hedge_ratio)
+        assert summary['Intercept'][k] == pytest.approx(intercept)
+
+        spread = np.log(prices[stock_a]) - hedge_ratio * np.log(prices[stock_b]) - intercept
+        np.testing.assert_allclose(result['spread'].iloc[:, k], spread, atol=1e-10)
+
+        _, slope = _ols(np.diff(spread[:200]), spread[:199].to_numpy())
+        phi = 1 + slope
+        expected = -np.log(2) / np.log(abs(phi)) if abs(phi) < 1 else np.nan
+        assert summary['Half Life'][k] == pytest.approx(expected, nan_ok=True)
+
+
+def test_rolling_estimates_match_pandas(prices):
+    pair = [prices.columns[0], prices.columns[1]]
+    window = 30
+
+    result = spread_analytics.pair_spread_analytics([pair], prices, window=window)
+    log_prices = np.log(prices)
+    spread = result['spread'].iloc[:, 0]
+
+    leg_a, leg_b = log_prices[pair[0]], log_prices[pair[1]]
+    expected_ratio = leg_a.rolling(window).cov(leg_b) / leg_b.rolling(window).var()
+    np.testing.assert_allclose(result['rolling_hedge_ratio'].iloc[:, 0], expected_ratio, rtol=1e-7)
+
+    expected_zscore = (spread - spread.rolling(window).mean()) / spread.rolling(window).std()
+    np.testing.assert_allclose(result['rolling_zscore'].iloc[:, 0], expected_zscore, rtol=1e-7)
+
+
+def test_half_life_of_reverting_and_non_reverting_spreads():
+    phi = np.array([0.0, 0.5, -0.5, 1.0, 1.2, -1.0, np.nan])
+
+    np.testing.assert_allclose(
+        spread_analytics._half_life(phi), [0.0, 1.0, 1.0, np.nan, np.nan, np.nan, np.nan]
+    )
+
+    # White noise reverts at once: a short, finite half-life
+    white_noise = np.random.default_rng(0).standard_normal((500, 1))
+    assert spread_analytics._ar1_half_life(white_noise)[0] < 1
+
+
+def test_window_is_validated(prices):
+    with pytest.raises(ValueError):
+        spread_analytics.pair_spread_analytics([list(prices.columns[:2])], prices, window=1)
@@ -0,0 +1,95 @@
+import os
+import sys
+import json
+import shutil
+import subprocess
+import pytest
+
+from conftest import ROOT_DIR, PROCESSED_FILES
+import pairs_formation_pipeline as pfp
+
+FINGERPRINT_SCRIPT = """
+import sys, json
+sys.path.insert(0, {src!r})
+for name in {imports!r}:
+    __import__(name)
+import pairs_formation_pipeline as pfp
+print(json.dumps([pfp._fingerprint({path!r}, {pipeline!r}), pfp._source_files()]))
+"""
+
+
+@pytest.fixture
+def pipeline(tmp_path) -> dict:
+
+    # One sector x period on a copy of a repo CSV, results in a temporary folder
+    input_path = str(tmp_path / 'df_finance_processed_first_period_24112023.csv')
+    shutil.copy(PROCESSED_FILES[0], input_path)
+    return {
+        **pfp.DEFAULT_PIPELINE,
+        'split_ratio': 0.7,
+        'results_dir': str(tmp_path / 'results'),
+        'inputs': {('finance', 'first'): input_path}
+    }
+
+
+def _fingerprint_in_fresh_process(path: str, pipeline: dict, imports: list) -> tuple:
+    script = FINGERPRINT_SCRIPT.format(
+        src=os.path.join(ROOT_DIR, 'src'), imports=imports, path=path,
+        pipeline={key: value for key, value in pipeline.items() if key != 'inputs'}
+    )
+    output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True).stdout
+    return tuple(json.loads(output.strip().splitlines()[-1]))
+
+
+def test_fingerprint_does_not_depend_on_other_imports(pipeline):
+    path = pipeline['inputs'][('finance', 'first')]
+    fingerprint, sources = _fingerprint_in_fresh_process(path, pipeline, [])
+    for imports in [['pairs_screening'], ['pair_reporting', 'pair_significance']]:
+        assert _fingerprint_in_fresh_process(path, pipeline, imports) == (fingerprint, sources)
+    assert fingerprint == pfp._fingerprint(path, pipeline)
+    assert os.path.join(ROOT_DIR, 'src', 'pairs_formation_pipeline.py') in sources
+    assert os.path.join(ROOT_DIR, 'src', 'pairs_screening.py') not in sources
+
+
+@pytest.mark.parametrize('key, value', [
+    ('significance_level', 0.01), ('gatev_top_values', 5), ('split_ratio', 0.6),
+    ('methods', ['gatev']), ('johansen_confidence_level', 99)
+])
+def test_fingerprint_changes_with_the_result_params(pipeline, key, value):
+    path = pipeline['inputs'][('finance', 'first')]
+    assert pfp._fingerprint(path, {**pipeline, key: value}) != pfp._fingerprint(path, pipeline)
+
+
+def test_fingerprint_ignores_the_run_settings(pipeline):
+    path = pipeline['inputs'][('finance', 'first')]
+    assert pfp._fingerprint(path, {**pipeline, 'n_workers': 4}) == pfp._fingerprint(path, pipeline)
+
+
+def test_fingerprint_changes_with_the_input_content(pipeline):
+    path = pipeline['inputs'][('finance', 'first')]
+    before = pfp._fingerprint(path, pipeline)
+    with open(path, 'a') as file:
+        file.write('\n')
+    assert pfp._fingerprint(path, pipeline) != before
+
+
+def test_task_graph_skips_up_to_date_results(pipeline):
+    tasks, jobs, up_to_date = pfp.build_task_graph(pipeline)
+    assert list(jobs) == [('finance', 'first')] and not up_to_date
+    assert ('summary', 'finance', 'first') in tasks
+
+    # A manifest entry with the same fingerprint and an existing result leaves the job out
+    output = os.path.relpath(jobs[('finance', 'first')]['output'], pipeline['results_dir'])
+    os.makedirs(os.path.dirname(jobs[('finance', 'first')]['output']))
+    open(jobs[('finance', 'first')]['output'], 'w').close()
+    pfp._save_manifest(pipeline['results_dir'], {
+        'finance/first': {'fingerprint': jobs[('finance', 'first')]['fingerprint'], 'output': output}
+    })
+    tasks, jobs, up_to_date = pfp.build_task_graph(pipeline)
+    assert not tasks and not jobs and list(up_to_date) == [('finance', 'first')]
+
+    tasks, jobs, up_to_date = pfp.build_task_graph(pipeline, force=True)
+    assert list(jobs) == [('finance', 'first')] and not up_to_date
+
+    tasks, jobs, up_to_date = pfp.build_task_graph({**pipeline, 'significance_level': 0.01})
+    assert list(jobs) == [('finance', 'first')] and not up_to_date
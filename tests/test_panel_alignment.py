@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import handling_dataframe as hdf
+import panel_alignment as pa
+
+
+@pytest.fixture
+def raw_panel() -> pd.DataFrame:
+
+    # Irregular trading days with gaps of every length, a late listing, a sparse ticker and duplicated dates
+    rng = np.random.default_rng(2)
+    dates = pd.bdate_range('2021-01-04', periods=160)
+    dates = dates[rng.uniform(size=len(dates)) > 0.15]
+    values = np.exp(np.cumsum(rng.normal(0, 0.02, (len(dates), 5)), axis=0)) * 100
+    df = pd.DataFrame(values, index=pd.DatetimeIndex(dates, name='date'), columns=[f'S{k}' for k in range(5)])
+    df = df.mask(rng.uniform(size=df.shape) < 0.1)
+    df.iloc[:20, 1] = np.nan
+    df.iloc[rng.uniform(size=len(df)) < 0.7, 4] = np.nan
+    df.iloc[40:55, 2] = np.nan
+    return pd.concat([df, df.iloc[[10, 30]] * 1.01])
+
+
+def _expected(df: pd.DataFrame, calendar: pd.DatetimeIndex, max_gap: int = None) -> tuple:
+
+    # Reference of the notebooks: last duplicate wins, reindex on the calendar, then ffill
+    reindexed = df[~df.index.duplicated(keep='last')].reindex(calendar)
+    return reindexed, reindexed if max_gap == 0 else reindexed.ffill(limit=max_gap)
+
+
+@pytest.mark.parametrize('max_gap', [None, 0, 2, 5])
+def test_align_panel_matches_reindex_and_ffill(raw_panel, max_gap):
+    panel, stats = pa.align_panel(raw_panel, max_gap=max_gap)
+    calendar = pd.bdate_range(raw_panel.index.min(), raw_panel.index.max())
+    reindexed, expected = _expected(raw_panel, calendar, max_gap)
+    pd.testing.assert_frame_equal(panel, expected, check_freq=False, check_names=False)
+
+    before = hdf.calculate_missing_percentage(reindexed)
+    np.testing.assert_array_equal(stats['count'], before['count'])
+    np.testing.assert_allclose(stats['percentage'], before['percentage'])
+    np.testing.assert_array_equal(stats['remaining'], expected.isna().sum().to_numpy())
+    np.testing.assert_array_equal(stats['filled'], stats['count'] - stats['remaining'])
+
+
+def test_longest_gap_counts_the_leading_and_interior_runs(raw_panel):
+    _, stats = pa.align_panel(raw_panel)
+    calendar = pd.bdate_range(raw_panel.index.min(), raw_panel.index.max())
+    reindexed, _ = _expected(raw_panel, calendar)
+    for column, longest_gap in zip(stats['column'], stats['longest_gap']):
+        missing = reindexed[column].isna()
+        runs = missing.groupby((~missing).cumsum()).sum()
+        assert longest_gap == runs.max()
+
+
+def test_align_panel_with_date_column_and_window(raw_panel):
+    df = raw_panel.reset_index()
+    panel, _ = pa.align_panel(df, date_column='date', start='2021-02-01', end='2021-04-30')
+    calendar = pd.bdate_range('2021-02-01', '2021-04-30')
+    _, expected = _expected(raw_panel, calendar)
+    pd.testing.assert_frame_equal(panel, expected, check_freq=False, check_names=False)
+    assert panel.index.name == 'date'
+
+
+def test_daily_calendar_reproduces_resample_dataframe(raw_panel):
+    df = raw_panel[~raw_panel.index.duplicated(keep='last')].reset_index()
+    panel, _ = pa.align_panel(df, date_column='date', calendar='D')
+    expected = hdf.resample_dataframe(df, 'date').ffill()
+    pd.testing.assert_frame_equal(panel, expected, check_freq=False)
+
+
+def test_calendar_none_keeps_the_dates_of_the_panel(raw_panel):
+    panel, _ = pa.align_panel(raw_panel, calendar=None)
+    dates = raw_panel.index.unique().sort_values()
+    _, expected = _expected(raw_panel, dates)
+    pd.testing.assert_frame_equal(panel, expected, check_names=False)
+
+
+def test_holidays_and_missing_threshold(raw_panel):
+    holidays = ['2021-01-18', '2021-02-15']
+    panel, stats = pa.align_panel(raw_panel, holidays=holidays, max_missing_percentage=50)
+    assert not panel.index.isin(pd.DatetimeIndex(holidays)).any()
+    dropped = stats.loc[stats['dropped'], 'column'].tolist()
+    assert dropped == ['S4'] and list(panel.columns) == ['S0', 'S1', 'S2', 'S3']
+    assert stats.loc[stats['dropped'], 'filled'].eq(0).all()
+    assert stats.loc[stats['dropped'], 'longest_gap'].isna().all()
+
+
+def test_align_panel_does_not_modify_its_input(raw_panel):
+    before = raw_panel.copy()
+    pa.align_panel(raw_panel, max_gap=3)
+    pd.testing.assert_frame_equal(raw_panel, before)
+
+
+def test_align_panel_rejects_bad_arguments(raw_panel):
+    with pytest.raises(ValueError):
+        pa.align_panel(raw_panel.iloc[:0])
+    with pytest.raises(ValueError):
+        pa.align_panel(raw_panel, max_gap=-1)
+    with pytest.raises(ValueError):
+        pa.align_panel(raw_panel, start='2021-01-09', end='2021-01-10')
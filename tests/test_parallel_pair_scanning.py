@@ -0,0 +1,79 @@
+import os
+import numpy as np
+import pytest
+
+import engle_granger_cointegration_method as eg_coint
+import gatev_distance_method as gatev
+import johansen_cointegration_method as jj_coint
+import parallel_pair_scanning as pps
+
+
+@pytest.mark.parametrize('chunk_size', [7, 1024])
+def test_engle_granger_is_identical_for_any_worker_count(log_prices, chunk_size):
+    serial = pps.parallel_find_cointegrated_pairs(log_prices, n_workers=1, chunk_size=chunk_size)
+    pooled = pps.parallel_find_cointegrated_pairs(log_prices, n_workers=2, chunk_size=chunk_size)
+    np.testing.assert_array_equal(serial[0], pooled[0])
+    np.testing.assert_array_equal(serial[1], pooled[1])
+    assert serial[2] == pooled[2]
+
+    batched = eg_coint.find_cointegrated_pairs_batched(log_prices, visualize=False)
+    np.testing.assert_allclose(serial[1], batched[1], rtol=1e-10, atol=1e-12)
+    assert serial[2] == batched[2]
+
+
+def test_johansen_is_identical_for_any_worker_count(log_prices):
+    serial = pps.parallel_johansen_statistics(log_prices, n_workers=1, chunk_size=10)
+    pooled = pps.parallel_johansen_statistics(log_prices, n_workers=2, chunk_size=10)
+    for serial_output, pooled_output in zip(serial[:2], pooled[:2]):
+        np.testing.assert_array_equal(serial_output, pooled_output)
+
+    lr1, lr2, _, _, tested_pairs = jj_coint.johansen_statistics_batched(log_prices)
+    assert list(tested_pairs) == list(serial[4])
+    np.testing.assert_allclose(serial[0], lr1, rtol=1e-10)
+    np.testing.assert_allclose(serial[1], lr2, rtol=1e-10)
+    assert pps.parallel_johansen_test(log_prices, n_workers=2, chunk_size=10) == \
+        jj_coint.johansen_test_batched(log_prices)
+
+
+def test_gatev_distances_are_identical_for_any_worker_count(log_prices):
+    serial = pps.parallel_gatev_squared_distances(log_prices, n_workers=1, chunk_size=10)
+    pooled = pps.parallel_gatev_squared_distances(log_prices, n_workers=2, chunk_size=10)
+    np.testing.assert_array_equal(serial[0], pooled[0])
+    np.testing.assert_allclose(serial[0], gatev.gatev_squared_distances(log_prices)[0], rtol=1e-8, atol=1e-10)
+
+
+def test_checkpoint_resumes_only_the_missing_chunks(log_prices, tmp_path, monkeypatch):
+    checkpoint_dir = str(tmp_path)
+    complete = pps.parallel_find_cointegrated_pairs(
+        log_prices, n_workers=1, chunk_size=10, checkpoint_dir=checkpoint_dir, keep_checkpoint=True
+    )
+    (scan_dir,) = os.listdir(checkpoint_dir)
+    chunk_files = sorted(os.listdir(os.path.join(checkpoint_dir, scan_dir)))
+    assert len(chunk_files) == 7
+
+    # An interrupted run: two chunks never reached the disk
+    for file_name in chunk_files[2:4]:
+        os.remove(os.path.join(checkpoint_dir, scan_dir, file_name))
+
+    scanned = []
+    scan_chunk = pps._scan_chunk
+    monkeypatch.setattr(pps, '_scan_chunk', lambda method, start, stop, params: (
+        scanned.append(start) or scan_chunk(method, start, stop, params)
+    ))
+    resumed = pps.parallel_find_cointegrated_pairs(
+        log_prices, n_workers=1, chunk_size=10, checkpoint_dir=checkpoint_dir
+    )
+    assert scanned == [20, 30]
+    np.testing.assert_array_equal(resumed[1], complete[1])
+    assert resumed[2] == complete[2]
+
+    # Without keep_checkpoint the completed scan removes its checkpoint
+    assert os.listdir(checkpoint_dir) == []
+
+
+def test_checkpoint_is_not_shared_across_parameters(log_prices, tmp_path):
+    for trend in ['c', 'ct']:
+        pps.parallel_find_cointegrated_pairs(
+            log_prices, trend=trend, n_workers=1, chunk_size=10, checkpoint_dir=str(tmp_path), keep_checkpoint=True
+        )
+    assert len(os.listdir(tmp_path)) == 2
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+from statsmodels.tsa.adfvalues import mackinnonp
+from statsmodels.tsa.stattools import adfuller
+import time_series_analysis_snippets as tsa_snp
+from conftest import PROCESSED_FILES, load_processed
+
+
+@pytest.mark.parametrize('regression', ['n', 'c', 'ct'])
+@pytest.mark.parametrize('N', [1, 2])
+def test_mackinnonp_batched_matches_statsmodels(regression, N):
+    teststat = np.linspace(-8, 3, 45)
+    expected = [mackinnonp(value, regression=regression, N=N) for value in teststat]
+
+    np.testing.assert_allclose(tsa_snp.mackinnonp_batched(teststat, regression=regression, N=N), expected)
+
+
+@pytest.mark.parametrize('regression', ['c', 'ct'])
+@pytest.mark.parametrize('autolag', ['aic', 'bic', 't-stat', None])
+def test_adfuller_batched_matches_statsmodels(regression, autolag):
+    rng = np.random.default_rng(3)
+    X = np.column_stack([
+        rng.standard_normal(250).cumsum(),
+        rng.standard_normal(250),
+        np.convolve(rng.standard_normal(260), [1, 0.6, 0.3], mode='valid')[:250].cumsum()
+    ])
+
+    adfstat, pvalue, usedlag, nobs = tsa_snp.adfuller_batched(X, regression=regression, autolag=autolag)
+
+    for k in range(X.shape[1]):
+        expected = adfuller(X[:, k], regression=regression, autolag=autolag)
+        np.testing.assert_allclose([adfstat[k], pvalue[k]], expected[:2], rtol=1e-8)
+        assert (usedlag[k], nobs[k]) == tuple(expected[2:4])
+
+
+def test_adfuller_batched_leaves_constant_columns_out():
+    rng = np.random.default_rng(4)
+    X = rng.standard_normal((200, 3)).cumsum(axis=0)
+    X[:, 1] = 2.5
+
+    adfstat, pvalue, usedlag, nobs = tsa_snp.adfuller_batched(X)
+
+    assert np.isnan(adfstat[1]) and np.isnan(pvalue[1]) and usedlag[1] == -1 and nobs[1] == -1
+    for k in [0, 2]:
+        expected = adfuller(X[:, k])
+        assert adfstat[k] == pytest.approx(expected[0]) and (usedlag[k], nobs[k]) == tuple(expected[2:4])
+
+
+@pytest.mark.parametrize('path', PROCESSED_FILES[:3])
+def test_integration_order_batched_matches_find_integration_order(path):
+    df = np.log(load_processed(path, n_stocks=10))
+
+    expected = tsa_snp.find_integration_order(df)
+    result = tsa_snp.find_integration_order_batched(df, use_cache=False)
+
+    assert result['Column Name'].tolist() == expected['Column Name'].tolist()
+    assert result['Integration Order'].astype(int).tolist() == expected['Integration Order'].tolist()
+
+
+def test_integration_order_rejects_interior_gaps(log_prices):
+    df = log_prices.copy()
+    df.iloc[:5, 0] = np.nan
+    df.iloc[-5:, 1] = np.nan
+    tsa_snp.find_integration_order_batched(df, use_cache=False)
+
+    df.iloc[100, 2] = np.nan
+    with pytest.raises(ValueError):
+        tsa_snp.find_integration_order_batched(df, use_cache=False)
+
+
+def test_integration_order_cache_is_bounded(log_prices, monkeypatch):
+    monkeypatch.setattr(tsa_snp, 'INTEGRATION_ORDER_CACHE_SIZE', 5)
+    tsa_snp.clear_integration_order_cache()
+
+    first = tsa_snp.find_integration_order_batched(log_prices)
+    assert len(tsa_snp._INTEGRATION_ORDER_CACHE) == 5
+    assert tsa_snp.find_integration_order_batched(log_prices).equals(first)
+    tsa_snp.clear_integration_order_cache()